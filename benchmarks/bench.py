@@ -0,0 +1,381 @@
+"""Benchmarks for the template pipeline: catalog, render, validate, select, send, queue.
+
+Run from the repository root::
+
+    python benchmarks/bench.py                  # run everything, record results
+    python benchmarks/bench.py -k render        # only benchmarks whose name contains "render"
+    python benchmarks/bench.py --compare        # also compare with the last run of another commit
+
+Each run appends one JSON line per benchmark to ``benchmarks/results.jsonl``
+(not committed), tagged with the git commit it ran on. ``--compare`` checks
+the run against the most recent results recorded for a different commit
+(or ``--baseline REV``) and exits non-zero if any benchmark got more than
+``--threshold`` slower.
+"""
+
+from __future__ import annotations
+
+import argparse
+import fnmatch
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from managed_notifications.catalog import Catalog  # noqa: E402
+from managed_notifications.inventory import Inventory  # noqa: E402
+from managed_notifications.render import Renderer  # noqa: E402
+from managed_notifications.selector import compile_predicate, fragment, fragment_names  # noqa: E402
+from managed_notifications.sender import BulkSender  # noqa: E402
+from managed_notifications.sharded import ShardedSender  # noqa: E402
+from managed_notifications.similarity import SimilarityIndex, template_text  # noqa: E402
+from managed_notifications.stub_server import StubServer  # noqa: E402
+from managed_notifications.synthetic import generate  # noqa: E402
+from managed_notifications.validate import validate_catalog, validate_payload  # noqa: E402
+from managed_notifications.workqueue import WorkQueue, drain  # noqa: E402
+
+RESULTS_PATH = Path(__file__).resolve().parent / "results.jsonl"
+
+#: The largest templates in the tree.
+HEAVY_TEMPLATES = ("osd/additional_trusted_ca_missing", "osd/incorrect_PodDisruptionBudget")
+
+#: Parameters for the parameterised cluster/ fragments.
+FRAGMENT_PARAMS = {"CLOUD_PROVIDER": "aws", "CLUSTER_REGION": "us-east-1", "CLUSTER_VERSION": "4.12.0"}
+
+#: A benchmark: setup returning (function to time, operations per call).
+Setup = Callable[[], Tuple[Callable[[], Any], int]]
+
+BENCHMARKS: Dict[str, Setup] = {}
+
+
+def benchmark(name: str) -> Callable[[Setup], Setup]:
+    def register(setup: Setup) -> Setup:
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+def params_for(renderer: Renderer, template_id: str) -> Dict[str, str]:
+    return {name: f"value-{name.lower()}" for name in renderer.compile(template_id).placeholders}
+
+
+@benchmark("catalog.build")
+def bench_catalog_build():
+    return lambda: Catalog.build(), 1
+
+
+@benchmark("catalog.load")
+def bench_catalog_load():
+    return lambda: Catalog.load(), 1
+
+
+@benchmark("catalog.parse_all")
+def bench_catalog_parse_all():
+    def run():
+        catalog = Catalog.load()
+        for template_id in catalog.ids():
+            catalog.template(template_id)
+
+    return run, 1
+
+
+@benchmark("catalog.validate")
+def bench_catalog_validate():
+    catalog = Catalog.load()
+    return lambda: validate_catalog(catalog), 1
+
+
+def _render_single(template_id: str) -> Setup:
+    def setup():
+        renderer = Renderer()
+        params = params_for(renderer, template_id)
+        compiled = renderer.compile(template_id)
+        return lambda: compiled.render(params), 1
+
+    return setup
+
+
+def _render_bulk(template_id: str, count: int = 10_000) -> Setup:
+    def setup():
+        renderer = Renderer()
+        base = params_for(renderer, template_id)
+        params_list = [dict(base, CLUSTER_UUID=r["external_id"]) for r in generate(count)]
+        return lambda: [json.dumps(p) for p in renderer.render_many(template_id, params_list)], count
+
+    return setup
+
+
+for _template in HEAVY_TEMPLATES:
+    _short = _template.rsplit("/", 1)[-1]
+    benchmark(f"render.single[{_short}]")(_render_single(_template))
+    benchmark(f"render.bulk[{_short}]")(_render_bulk(_template))
+
+
+@benchmark("render.fleet[cluster_overloaded]")
+def bench_render_fleet():
+    count = 100_000
+    fleet = Renderer().fleet("osd/cluster_overloaded")
+    uuids = [r["external_id"] for r in generate(count)]
+    return lambda: list(fleet.render_all(uuids)), count
+
+
+@benchmark("validate.payload")
+def bench_validate_payload():
+    renderer = Renderer()
+    template_id = HEAVY_TEMPLATES[0]
+    payload = renderer.render(template_id, dict(params_for(renderer, template_id), CLUSTER_UUID="x"))
+    return lambda: validate_payload(payload), 1
+
+
+_inventory_cache: Dict[int, Tuple[List[Dict[str, Any]], Inventory]] = {}
+
+
+def inventory(count: int = 100_000) -> Tuple[List[Dict[str, Any]], Inventory]:
+    if count not in _inventory_cache:
+        records = list(generate(count))
+        _inventory_cache[count] = (records, Inventory.from_records(records))
+    return _inventory_cache[count]
+
+
+def _fragments():
+    return [fragment(name, FRAGMENT_PARAMS) for name in fragment_names()]
+
+
+@benchmark("synthetic.generate[100k]")
+def bench_generate():
+    count = 100_000
+    return lambda: list(generate(count)), count
+
+
+@benchmark("select.inventory_build[100k]")
+def bench_inventory_build():
+    records, _ = inventory()
+    return lambda: Inventory.from_records(records), len(records)
+
+
+@benchmark("select.fragments_bitmap[100k]")
+def bench_select_bitmap():
+    _, inv = inventory()
+    nodes = _fragments()
+    return lambda: [inv.count(node) for node in nodes], len(nodes)
+
+
+@benchmark("select.fragments_select[100k]")
+def bench_select_uuids():
+    _, inv = inventory()
+    nodes = _fragments()
+    return lambda: [inv.select(node) for node in nodes], len(nodes)
+
+
+@benchmark("select.fragments_scan[100k]")
+def bench_select_scan():
+    records, _ = inventory()
+    predicates = [compile_predicate(node) for node in _fragments()]
+    return lambda: [sum(1 for r in records if predicate(r)) for predicate in predicates], len(predicates)
+
+
+@benchmark("similarity.index_catalog")
+def bench_similarity_index():
+    catalog = Catalog.load()
+    return lambda: SimilarityIndex.from_catalog(catalog).clusters(), len(catalog)
+
+
+@benchmark("similarity.query")
+def bench_similarity_query():
+    catalog = Catalog.load()
+    index = SimilarityIndex.from_catalog(catalog)
+    text = template_text(catalog.template(HEAVY_TEMPLATES[0]))
+    return lambda: index.query(text), 1
+
+
+@benchmark("send.fleet_e2e[2000]")
+def bench_send():
+    count = 2000
+    url = StubServer(keep=0).start_in_thread().url
+    uuids = [r["external_id"] for r in generate(count)]
+
+    def run():
+        with BulkSender(url, "token", concurrency=16) as sender:
+            failed = sum(1 for r in sender.send_fleet("osd/cluster_overloaded", uuids) if not r.ok)
+        if failed:
+            raise RuntimeError(f"{failed} sends failed against the stub")
+
+    return run, count
+
+
+@benchmark("send.sharded_e2e[10000]")
+def bench_send_sharded():
+    count = 10_000
+    url = StubServer(keep=0).start_in_thread().url
+    uuids = [r["external_id"] for r in generate(count)]
+
+    def run():
+        with ShardedSender(2, url, "token", concurrency=16) as sender:
+            failed = sum(1 for r in sender.send_fleet("osd/cluster_overloaded", uuids) if not r.ok)
+        if failed:
+            raise RuntimeError(f"{failed} sends failed against the stub")
+
+    return run, count
+
+
+@benchmark("queue.put[10000]")
+def bench_queue_put():
+    count = 10_000
+    directory = tempfile.mkdtemp(prefix="bench-queue-")
+    payloads = [{"cluster_uuid": r["external_id"], "summary": "s", "description": "d"} for r in generate(count)]
+    runs = 0
+
+    def run():
+        nonlocal runs
+        runs += 1
+        with WorkQueue(Path(directory) / f"put-{runs}.db") as queue:
+            for payload in payloads:
+                queue.put(payload, "osd/cluster_overloaded")
+
+    return run, count
+
+
+@benchmark("queue.drain_e2e[2000]")
+def bench_queue_drain():
+    count = 2000
+    url = StubServer(keep=0).start_in_thread().url
+    fleet = Renderer().fleet("osd/cluster_overloaded")
+    bodies = [fleet.render(r["external_id"]) for r in generate(count)]
+    queue = WorkQueue(Path(tempfile.mkdtemp(prefix="bench-queue-")) / "drain.db")
+
+    def run():
+        queue.put_many(bodies, "osd/cluster_overloaded")
+        with BulkSender(url, "token", concurrency=16) as sender:
+            failed = sum(1 for r in drain(queue, sender) if not r.ok)
+        if failed:
+            raise RuntimeError(f"{failed} sends failed against the stub")
+
+    return run, count
+
+
+def measure(setup: Setup, min_time: float, repeat: int) -> Dict[str, Any]:
+    """Time a benchmark; per-operation seconds over ``repeat`` rounds."""
+    func, ops = setup()
+    func()  # warm up
+    start = time.perf_counter()
+    func()
+    once = time.perf_counter() - start
+    number = max(1, int(min_time / max(once, 1e-9)))
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        rounds.append((time.perf_counter() - start) / (number * ops))
+    return {"min": min(rounds), "median": statistics.median(rounds), "rounds": repeat, "number": number, "ops": ops}
+
+
+def git_commit() -> Tuple[Optional[str], bool]:
+    def git(*args: str) -> str:
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+
+    try:
+        return git("rev-parse", "HEAD"), bool(git("status", "--porcelain", "--untracked-files=no"))
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+
+
+def load_results(path: Path = RESULTS_PATH) -> List[Dict[str, Any]]:
+    if not path.exists():
+        return []
+    with path.open(encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def baseline_for(results: List[Dict[str, Any]], commit: Optional[str], rev: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    """Latest result per benchmark for ``rev``, or for the last commit other than ``commit``."""
+    if rev is not None:
+        try:
+            rev = subprocess.run(
+                ["git", "rev-parse", rev], cwd=ROOT, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            raise SystemExit(f"unknown revision: {rev}") from None
+    else:
+        rev = next((r["commit"] for r in reversed(results) if r["commit"] != commit), None)
+    return {r["name"]: r for r in results if rev is not None and r["commit"] == rev}
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:8.3f} {unit}"
+    return f"{seconds / 1e-9:8.1f} ns"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-k", dest="pattern", help="run benchmarks whose name contains this (glob allowed)")
+    parser.add_argument("--list", action="store_true", help="list benchmarks and exit")
+    parser.add_argument("--min-time", type=float, default=0.2, help="target seconds per round (default: 0.2)")
+    parser.add_argument("--repeat", type=int, default=5, help="rounds per benchmark (default: 5)")
+    parser.add_argument("--no-save", action="store_true", help="do not append to the results file")
+    parser.add_argument("--results", type=Path, default=RESULTS_PATH, help="results file (JSON lines)")
+    parser.add_argument("--compare", action="store_true", help="compare with earlier results")
+    parser.add_argument("--baseline", metavar="REV", help="commit to compare with (default: last other commit)")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="relative slowdown counted as a regression (default: 0.2)"
+    )
+    args = parser.parse_args(argv)
+
+    names = sorted(BENCHMARKS)
+    if args.pattern:
+        pattern = args.pattern if any(c in args.pattern for c in "*?[") else f"*{args.pattern}*"
+        names = [n for n in names if fnmatch.fnmatchcase(n, pattern)]
+    if args.list:
+        print("\n".join(names))
+        return 0
+
+    commit, dirty = git_commit()
+    baseline = baseline_for(load_results(args.results), commit, args.baseline) if args.compare else {}
+    regressions = []
+    records = []
+    for name in names:
+        stats = measure(BENCHMARKS[name], args.min_time, args.repeat)
+        line = f"{name:46} {format_time(stats['median'])}/op  (min {format_time(stats['min']).strip()})"
+        before = baseline.get(name)
+        if before is not None:
+            change = stats["median"] / before["median"] - 1
+            line += f"  {change:+7.1%}"
+            if change > args.threshold:
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line, flush=True)
+        records.append(
+            {
+                "commit": commit,
+                "dirty": dirty,
+                "time": time.time(),
+                "python": platform.python_version(),
+                "machine": platform.node(),
+                "name": name,
+                **stats,
+            }
+        )
+
+    if not args.no_save:
+        with args.results.open("a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, sort_keys=True) + "\n")
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
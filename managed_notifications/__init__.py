@@ -0,0 +1,69 @@
+"""Python tooling for the managed-notifications templates."""
+
+from .auth import TokenManager
+from .catalog import Catalog, TemplateEntry, TemplateNotFound, default_catalog
+from .changes import Change, diff_revisions
+from .checkpoint import Checkpoint
+from .coordinator import Coordinator, run_job
+from .deadletter import DeadLetterStore
+from .inventory import Inventory
+from .ledger import Ledger
+from .placeholders import PlaceholderIndex, default_placeholder_index
+from .ratelimit import AdaptiveLimiter
+from .render import MissingParameters, Renderer, default_renderer, render, render_fleet, render_many
+from .router import AlertRouter, Route
+from .selector import SelectorError, load_inventory, select
+from .sender import BulkSender, SendResult
+from .sharded import ShardedSender
+from .similarity import SimilarityIndex
+from .stub_server import Faults, StubServer
+from .suppress import MemorySuppressor, SqliteSuppressor
+from .synthetic import FleetSpec, write_fleet
+from .validate import ValidationError, validate_catalog, validate_payload, validate_template
+from .workqueue import WorkQueue, drain
+
+__all__ = [
+    "AdaptiveLimiter",
+    "AlertRouter",
+    "BulkSender",
+    "Catalog",
+    "Change",
+    "Checkpoint",
+    "Coordinator",
+    "DeadLetterStore",
+    "Faults",
+    "FleetSpec",
+    "Inventory",
+    "Ledger",
+    "MemorySuppressor",
+    "MissingParameters",
+    "PlaceholderIndex",
+    "Renderer",
+    "Route",
+    "SelectorError",
+    "SendResult",
+    "ShardedSender",
+    "SimilarityIndex",
+    "SqliteSuppressor",
+    "StubServer",
+    "TemplateEntry",
+    "TemplateNotFound",
+    "TokenManager",
+    "ValidationError",
+    "WorkQueue",
+    "default_catalog",
+    "default_placeholder_index",
+    "default_renderer",
+    "diff_revisions",
+    "drain",
+    "load_inventory",
+    "render",
+    "render_fleet",
+    "render_many",
+    "run_job",
+    "select",
+    "validate_catalog",
+    "validate_payload",
+    "validate_template",
+    "write_fleet",
+]
@@ -0,0 +1,839 @@
+"""Command line entry point: ``python -m managed_notifications <command>``."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from .auth import SSO_TOKEN_URL, AuthError, TokenManager
+from .bundle import BUNDLE_PATH, BundleError, build_bundle, bundle_digest
+from .changes import RevisionError, changed_ids, diff_revisions
+from .catalog import INDEX_PATH, REPO_ROOT, Catalog, TemplateNotFound, normalize_id
+from .checkpoint import Checkpoint, CheckpointError
+from .checkpoint import job_id as job_key
+from .coordinator import DONE, LEASED, PENDING, Coordinator, CoordinatorError, run_job
+from .deadletter import ERROR_CLASSES, DeadLetterStore
+from .inventory import inventory_for
+from .ledger import Ledger
+from .placeholders import default_placeholder_index
+from .ratelimit import AdaptiveLimiter
+from .render import MissingParameters, iter_uuids, render, render_fleet
+from .router import AlertRouter
+from .selector import SelectorError, default_fragments, parse
+from .sender import DEFAULT_URL, BulkSender, SendResult
+from .sharded import ShardError, ShardedSender
+from .similarity import SimilarityIndex, template_text
+from .stub_server import Faults, StubServer, run_stub_server
+from .suppress import DEFAULT_WINDOW, SqliteSuppressor
+from .synthetic import FleetSpec, FleetSpecError, write_fleet
+from .validate import ValidationError, validate_catalog, validate_payload
+from .workqueue import DEFAULT_VISIBILITY_TIMEOUT, WorkQueue, drain
+
+
+def cmd_index(args: argparse.Namespace) -> int:
+    catalog = Catalog.build()
+    if args.check:
+        try:
+            with INDEX_PATH.open(encoding="utf-8") as f:
+                current = json.load(f)
+        except FileNotFoundError:
+            current = None
+        if current != catalog.to_index():
+            print(f"{INDEX_PATH} is out of date; run 'python -m managed_notifications index'", file=sys.stderr)
+            return 1
+        return 0
+    catalog.write_index()
+    print(f"indexed {len(catalog)} templates into {INDEX_PATH}")
+    return 0
+
+
+def parse_params(pairs: List[str]) -> Dict[str, str]:
+    params = {}
+    for pair in pairs:
+        name, sep, value = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"invalid parameter {pair!r}, expected NAME=VALUE")
+        params[name] = value
+    return params
+
+
+def cmd_render(args: argparse.Namespace) -> int:
+    payload = render(args.template, parse_params(args.param))
+    json.dump(payload, sys.stdout, indent=4)
+    sys.stdout.write("\n")
+    return 0
+
+
+def cmd_fleet(args: argparse.Namespace) -> int:
+    out = sys.stdout.buffer
+    with args.uuids as uuids:
+        for payload in render_fleet(args.template, uuids, parse_params(args.param)):
+            out.write(payload)
+            out.write(b"\n")
+    out.flush()
+    return 0
+
+
+def iter_params_file(f, fixed: Dict[str, str]) -> Iterator[Dict[str, str]]:
+    for line in f:
+        line = line.strip()
+        if line:
+            params = dict(fixed)
+            params.update(json.loads(line))
+            yield params
+
+
+def cmd_send(args: argparse.Namespace) -> int:
+    fixed = parse_params(args.param)
+    failed = 0
+    if args.checkpoint and args.skip_sent:
+        raise CheckpointError("--checkpoint cannot be combined with --skip-sent")
+    if args.coordinate and (args.checkpoint or args.skip_sent or args.processes > 1):
+        raise CoordinatorError("--coordinate cannot be combined with --checkpoint, --skip-sent or --processes")
+    token = token_from_args(args)
+    suppressor = limiter = dead_letters = None
+    ledger = Ledger(args.ledger) if args.ledger else None
+    stop = threading.Event()
+    if args.processes > 1:
+        sender = ShardedSender(
+            args.processes,
+            args.url,
+            token=token,
+            concurrency=args.concurrency,
+            retries=args.retries,
+            suppress_db=args.suppress_db,
+            suppress_window=args.suppress_window,
+            ledger=args.ledger,
+            dead_letters=args.dead_letters,
+            adaptive=args.adaptive,
+            rate=args.rate,
+        )
+    else:
+        suppressor = SqliteSuppressor(args.suppress_db, args.suppress_window) if args.suppress_db else None
+        dead_letters = DeadLetterStore(args.dead_letters) if args.dead_letters else None
+        if args.adaptive or args.rate:
+            limiter = AdaptiveLimiter(args.concurrency, rate=args.rate)
+        if limiter is not None and args.stats:
+            threading.Thread(target=print_stats, args=(limiter, args.stats, stop), daemon=True).start()
+        sender = BulkSender(
+            args.url,
+            token=token,
+            concurrency=args.concurrency,
+            retries=args.retries,
+            suppressor=suppressor,
+            ledger=ledger,
+            limiter=limiter,
+            dead_letters=dead_letters,
+        )
+    with sender:
+        template_id = sender.renderer.compile(args.template).id
+        checkpoint = Checkpoint.for_job(args.checkpoint, template_id, fixed) if args.checkpoint else None
+        if args.coordinate:
+            failed = report(coordinated_send(args, sender, template_id, fixed))
+        elif args.params_file is not None:
+            with args.params_file as f:
+                params_stream = iter_params_file(f, fixed)
+                if ledger is not None and args.skip_sent:
+                    params_stream = ledger.unsent_params(template_id, params_stream)
+                failed = report(sender.send(template_id, params_stream, checkpoint))
+        else:
+            with args.uuids as f:
+                uuids = iter_uuids(f)
+                if ledger is not None and args.skip_sent:
+                    uuids = ledger.unsent(template_id, uuids, fixed)
+                failed = report(sender.send_fleet(template_id, uuids, fixed, checkpoint))
+    stop.set()
+    if isinstance(token, TokenManager):
+        token.close()
+    for store in (suppressor, ledger, dead_letters, checkpoint):
+        if store is not None:
+            store.close()
+    return 1 if failed else 0
+
+
+def token_from_args(args: argparse.Namespace):
+    """A :class:`~.auth.TokenManager` if an offline token is set, else the access token, if any."""
+    offline_token = os.environ.get(args.offline_token_env)
+    if offline_token:
+        return TokenManager(offline_token, args.token_url, cache_path=args.token_cache)
+    return os.environ.get(args.token_env)
+
+
+def coordinated_send(
+    args: argparse.Namespace, sender: BulkSender, template_id: str, fixed: Dict[str, str]
+) -> Iterator[SendResult]:
+    """Take part in a multi-host job; every host reads the input from its own copy of the file."""
+    source = args.params_file if args.params_file is not None else args.uuids
+    source.close()
+    if source.name == "<stdin>":
+        raise CoordinatorError("--coordinate needs the input in a file (--uuids or --params-file), not stdin")
+
+    def inputs():
+        if args.params_file is not None:
+            with open(source.name, encoding="utf-8") as f:
+                yield from iter_params_file(f, fixed)
+        else:
+            with open(source.name, "rb") as f:
+                yield from f
+
+    job_id = args.job or f"{template_id}@{job_key(template_id, fixed).hex()[:12]}"
+    with Coordinator(args.coordinate, lease=args.lease) as coordinator:
+        coordinator.create_job(job_id, template_id, fixed, args.shards)
+        yield from run_job(
+            coordinator, job_id, sender, inputs, args.params_file is None, resend_uncertain=args.resend_uncertain
+        )
+
+
+def print_stats(limiter: AdaptiveLimiter, interval: float, stop: threading.Event) -> None:
+    while not stop.wait(interval):
+        print(json.dumps(limiter.stats().to_json()), file=sys.stderr, flush=True)
+
+
+def report(results) -> int:
+    failed = 0
+    for result in results:
+        if result.failed:
+            failed += 1
+        print(json.dumps(result.to_json()), flush=True)
+    return failed
+
+
+def cmd_generate(args: argparse.Namespace) -> int:
+    spec = FleetSpec.load(args.spec) if args.spec else None
+    written = write_fleet(args.output, args.count, spec, args.seed)
+    print(f"wrote {written} clusters", file=sys.stderr)
+    return 0
+
+
+def cmd_stub_server(args: argparse.Namespace) -> int:
+    faults = Faults(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        rate_limit=args.rate_limit,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        drop_rate=args.drop_rate,
+    )
+    server = StubServer(
+        args.host,
+        args.port,
+        faults,
+        token=args.token,
+        seed=args.seed,
+        refresh_token=args.refresh_token,
+        token_ttl=args.token_ttl,
+    )
+    run_stub_server(server, args.stats)
+    return 0
+
+
+def cmd_select(args: argparse.Namespace) -> int:
+    node = parse(args.expression, parse_params(args.param), default_fragments())
+    if args.inventory is None:
+        print(node.to_search())
+        return 0
+    inventory = inventory_for(args.inventory, node)
+    if args.count:
+        print(inventory.count(node))
+        return 0
+    for cluster_uuid in inventory.select(node):
+        print(cluster_uuid)
+    return 0
+
+
+def cmd_validate(args: argparse.Namespace) -> int:
+    failed = 0
+    if args.payloads is None:
+        if args.changed_since:
+            failures = validate_catalog(Catalog.build(), changed_ids(diff_revisions(args.changed_since)))
+        else:
+            failures = validate_catalog()
+        for template_id, errors in failures.items():
+            failed += 1
+            for error in errors:
+                print(f"{template_id}: {error}")
+    else:
+        with args.payloads as f:
+            for lineno, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    payload = json.loads(line)
+                except ValueError as e:
+                    errors = [f"invalid JSON: {e}"]
+                else:
+                    errors = validate_payload(payload)
+                if errors:
+                    failed += 1
+                    for error in errors:
+                        print(f"{f.name}:{lineno}: {error}")
+    return 1 if failed else 0
+
+
+def cmd_bundle(args: argparse.Namespace) -> int:
+    before = bundle_digest(args.output)
+    digest = build_bundle(args.output)
+    if digest == before:
+        print(f"{args.output} is up to date ({digest[:12]})")
+    else:
+        print(f"wrote {args.output} ({digest[:12]})")
+    return 0
+
+
+def cmd_changes(args: argparse.Namespace) -> int:
+    changes = diff_revisions(args.old, args.new)
+    for change in changes:
+        if args.ids:
+            if change.status != "removed":
+                print(change.id)
+        else:
+            print(json.dumps(change.to_json()))
+    return 0
+
+
+def cmd_duplicates(args: argparse.Namespace) -> int:
+    index = SimilarityIndex.from_catalog(Catalog.build(), threshold=args.threshold)
+    if not args.templates and not args.changed_since:
+        for group in index.clusters():
+            print("\t".join(group))
+        return 0
+    found = 0
+    if args.changed_since:
+        for template_id in changed_ids(diff_revisions(args.changed_since)):
+            for match in index.similar_to(template_id):
+                found += 1
+                print(f"{template_id}\t{match.id}\t{match.similarity:.2f}")
+    for path in args.templates:
+        with open(path, encoding="utf-8") as f:
+            text = template_text(json.load(f))
+        resolved = Path(path).resolve()
+        # A template already in the catalog is not its own duplicate.
+        own = [normalize_id(resolved.relative_to(REPO_ROOT).as_posix())] if resolved.is_relative_to(REPO_ROOT) else []
+        for match in index.query(text, exclude=own):
+            found += 1
+            print(f"{path}\t{match.id}\t{match.similarity:.2f}")
+    return 1 if found else 0
+
+
+def cmd_jobs(args: argparse.Namespace) -> int:
+    with Coordinator(args.db) as coordinator:
+        if args.job:
+            for shard in coordinator.status(args.job):
+                print(json.dumps(shard.to_json()))
+            return 0
+        for job_id in coordinator.jobs():
+            shards = coordinator.status(job_id)
+            states = {state: sum(1 for s in shards if s.state == state) for state in (PENDING, LEASED, DONE)}
+            sent, failed = sum(s.sent for s in shards), sum(s.failed for s in shards)
+            print(json.dumps({"job_id": job_id, **states, "sent": sent, "failed": failed}))
+    return 0
+
+
+def cmd_placeholders(args: argparse.Namespace) -> int:
+    index = default_placeholder_index()
+    if args.template:
+        for name in sorted(index.required(args.template)):
+            print(name)
+    elif args.renderable is not None:
+        for template_id in index.renderable(args.renderable):
+            print(template_id)
+    elif args.name:
+        for name in args.name:
+            for template_id in sorted(index.templates_using(name)):
+                print(f"{name}\t{template_id}")
+    else:
+        for name in index.placeholders():
+            print(f"{name}\t{len(index.templates_using(name))}")
+    return 0
+
+
+def cmd_route(args: argparse.Namespace) -> int:
+    router = AlertRouter(fallback=args.fallback, resolved=args.resolved)
+    with args.payload as f:
+        payload = json.load(f)
+    routes = router.route(payload, provider=args.provider, cluster_uuid=args.cluster_uuid)
+    for routed in routes:
+        print(json.dumps(routed.to_json()))
+    if args.enqueue:
+        queued = 0
+        with WorkQueue(args.enqueue, args.queue) as queue:
+            for routed in routes:
+                if not routed.ready:
+                    continue
+                rendered = render(routed.template, routed.params)
+                errors = validate_payload(rendered)
+                if errors:
+                    print(f"{routed.template}: not queued: {'; '.join(errors)}", file=sys.stderr)
+                    continue
+                queue.put(rendered, normalize_id(routed.template), params=routed.params)
+                queued += 1
+        print(f"queued {queued} of {len(routes)} notifications", file=sys.stderr)
+    return 0
+
+
+def cmd_queue(args: argparse.Namespace) -> int:
+    with WorkQueue(args.db, args.queue) as queue:
+        print(json.dumps(queue.stats().to_json()))
+    return 0
+
+
+def cmd_drain(args: argparse.Namespace) -> int:
+    token = token_from_args(args)
+    suppressor = SqliteSuppressor(args.suppress_db, args.suppress_window) if args.suppress_db else None
+    ledger = Ledger(args.ledger) if args.ledger else None
+    dead_letters = DeadLetterStore(args.dead_letters) if args.dead_letters else None
+    sender = BulkSender(
+        args.url,
+        token=token,
+        concurrency=args.concurrency,
+        retries=args.retries,
+        suppressor=suppressor,
+        ledger=ledger,
+        dead_letters=dead_letters,
+    )
+    with WorkQueue(args.db, args.queue, visibility_timeout=args.visibility_timeout) as queue, sender:
+        try:
+            failed = report(drain(queue, sender, follow=args.follow, max_attempts=args.max_attempts))
+        except KeyboardInterrupt:
+            # Messages taken and not acknowledged are delivered again after the visibility timeout.
+            failed = 0
+    if isinstance(token, TokenManager):
+        token.close()
+    for store in (suppressor, ledger, dead_letters):
+        if store is not None:
+            store.close()
+    return 1 if failed else 0
+
+
+def cmd_dead_letters(args: argparse.Namespace) -> int:
+    template_id = normalize_id(args.template) if args.template else None
+    with DeadLetterStore(args.db) as store:
+        if args.purge:
+            purged = store.discard(template_id, args.error_class)
+            print(f"purged {purged} resolved entries", file=sys.stderr)
+        elif args.summary:
+            for template, error_class, count in store.summary(resolved=args.all):
+                print(json.dumps({"template_id": template, "error_class": error_class, "count": count}))
+        else:
+            entries = store.entries(
+                template_id, args.error_class, args.cluster_uuid, resolved=args.all, limit=args.limit
+            )
+            for entry in entries:
+                print(json.dumps(entry.to_json()))
+    return 0
+
+
+def cmd_redrive(args: argparse.Namespace) -> int:
+    token = token_from_args(args)
+    suppressor = SqliteSuppressor(args.suppress_db, args.suppress_window) if args.suppress_db else None
+    ledger = Ledger(args.ledger) if args.ledger else None
+    with DeadLetterStore(args.db) as dead_letters:
+        entries = dead_letters.entries(
+            normalize_id(args.template) if args.template else None,
+            args.error_class,
+            args.cluster_uuid,
+            ids=args.id or None,
+            limit=args.limit,
+        )
+        sender = BulkSender(
+            args.url,
+            token=token,
+            concurrency=args.concurrency,
+            retries=args.retries,
+            suppressor=suppressor,
+            ledger=ledger,
+            dead_letters=dead_letters,
+        )
+        with sender:
+            failed = report(sender.redrive(entries, parse_params(args.param) or None))
+    if isinstance(token, TokenManager):
+        token.close()
+    for store in (suppressor, ledger):
+        if store is not None:
+            store.close()
+    return 1 if failed else 0
+
+
+def cmd_ledger(args: argparse.Namespace) -> int:
+    with Ledger(args.ledger) as ledger:
+        if args.received:
+            template_id = normalize_id(args.received)
+            params = parse_params(args.param) if args.param else None
+            for cluster_uuid in sorted(ledger.clusters(template_id, params, args.since)):
+                print(cluster_uuid)
+            return 0
+        entries = ledger.history(
+            cluster_uuid=args.cluster_uuid,
+            template_id=normalize_id(args.template) if args.template else None,
+            event_stream_id=args.event_stream_id,
+            since=args.since,
+            limit=args.limit,
+        )
+        for entry in entries:
+            print(json.dumps(entry.to_json()))
+    return 0
+
+
+def add_token_args(p: argparse.ArgumentParser) -> None:
+    p.add_argument(
+        "--token-env",
+        default="OCM_TOKEN",
+        help="environment variable holding the access token (default: OCM_TOKEN)",
+    )
+    p.add_argument(
+        "--offline-token-env",
+        default="OCM_OFFLINE_TOKEN",
+        help="environment variable holding an offline token; when set, access tokens are fetched from SSO "
+        "and refreshed before they expire (default: OCM_OFFLINE_TOKEN)",
+    )
+    p.add_argument("--token-url", default=SSO_TOKEN_URL, help="SSO token endpoint (default: Red Hat SSO)")
+    p.add_argument(
+        "--token-cache",
+        type=Path,
+        help="file caching the access token, shared by concurrent senders",
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m managed_notifications")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("index", help="regenerate the template index")
+    p.add_argument("--check", action="store_true", help="fail if the shipped index is stale")
+    p.set_defaults(func=cmd_index)
+
+    p = sub.add_parser("bundle", help="pack templates and fragments into one binary bundle")
+    p.add_argument("-o", "--output", type=Path, default=BUNDLE_PATH, help=f"default: {BUNDLE_PATH}")
+    p.set_defaults(func=cmd_bundle)
+
+    p = sub.add_parser("changes", help="list templates changed between two git revisions")
+    p.add_argument("old", help="git revision to compare from")
+    p.add_argument("new", nargs="?", help="git revision to compare to (default: the working tree)")
+    p.add_argument("--ids", action="store_true", help="print only the ids of templates that exist and changed")
+    p.set_defaults(func=cmd_changes)
+
+    p = sub.add_parser(
+        "duplicates",
+        help="list clusters of near-duplicate templates, or check templates against the catalog",
+        description="Without arguments, print each cluster of near-duplicate templates on one line. "
+        "With template files or --changed-since, print every catalog template each one near-duplicates "
+        "and exit 1 if there is any.",
+    )
+    p.add_argument("templates", nargs="*", help="template files to check against the catalog")
+    p.add_argument("--changed-since", metavar="REV", help="check templates added, modified or renamed since REV")
+    p.add_argument(
+        "--threshold",
+        type=float,
+        default=0.5,
+        help="Jaccard similarity of word 3-grams counted as a near-duplicate (default: 0.5)",
+    )
+    p.set_defaults(func=cmd_duplicates)
+
+    p = sub.add_parser("jobs", help="show the progress of coordinated sends")
+    p.add_argument("db", help="coordination file given to 'send --coordinate'")
+    p.add_argument("job", nargs="?", help="show every shard of this job")
+    p.set_defaults(func=cmd_jobs)
+
+    p = sub.add_parser("ledger", help="query the send ledger")
+    p.add_argument("ledger", help="ledger file written by 'send --ledger'")
+    p.add_argument("--received", metavar="TEMPLATE", help="list clusters that successfully received TEMPLATE")
+    p.add_argument("-p", "--param", action="append", default=[], metavar="NAME=VALUE")
+    p.add_argument("--cluster-uuid")
+    p.add_argument("--template")
+    p.add_argument("--event-stream-id")
+    p.add_argument("--since", type=float, help="Unix timestamp")
+    p.add_argument("--limit", type=int)
+    p.set_defaults(func=cmd_ledger)
+
+    p = sub.add_parser("placeholders", help="query which templates need which parameters")
+    p.add_argument("name", nargs="*", help="list the templates using these placeholders")
+    p.add_argument("--template", help="list the placeholders a template requires")
+    p.add_argument(
+        "--renderable",
+        nargs="*",
+        metavar="NAME",
+        help="list the templates fully renderable from these parameter names",
+    )
+    p.set_defaults(func=cmd_placeholders)
+
+    p = sub.add_parser("render", help="render a template to JSON")
+    p.add_argument("template", help="template id, path or URL")
+    p.add_argument("-p", "--param", action="append", default=[], metavar="NAME=VALUE")
+    p.set_defaults(func=cmd_render)
+
+    p = sub.add_parser("fleet", help="render a template for many clusters as JSON lines")
+    p.add_argument("template", help="template id, path or URL")
+    p.add_argument(
+        "--uuids",
+        type=argparse.FileType("rb"),
+        default="-",
+        help="file with one cluster UUID per line (default: stdin)",
+    )
+    p.add_argument("-p", "--param", action="append", default=[], metavar="NAME=VALUE")
+    p.set_defaults(func=cmd_fleet)
+
+    p = sub.add_parser("send", help="post a template to many clusters")
+    p.add_argument("template", help="template id, path or URL")
+    source = p.add_mutually_exclusive_group()
+    source.add_argument(
+        "--uuids",
+        type=argparse.FileType("rb"),
+        default="-",
+        help="file with one cluster UUID per line (default: stdin)",
+    )
+    source.add_argument(
+        "--params-file",
+        type=argparse.FileType("r"),
+        help="JSON lines file with one parameter object per cluster",
+    )
+    p.add_argument("-p", "--param", action="append", default=[], metavar="NAME=VALUE")
+    p.add_argument("--url", default=DEFAULT_URL, help=f"API base URL (default: {DEFAULT_URL})")
+    add_token_args(p)
+    p.add_argument("--concurrency", type=int, default=16, help="requests in flight per process (default: 16)")
+    p.add_argument("--retries", type=int, default=3)
+    p.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="send from this many worker processes, each taking the clusters a hash of their UUID assigns it; "
+        "results are still reported in input order (default: 1)",
+    )
+    p.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="adapt the number of requests in flight (up to --concurrency) to throttling",
+    )
+    p.add_argument("--rate", type=float, help="maximum posts per second; implies --adaptive")
+    p.add_argument(
+        "--stats",
+        type=float,
+        metavar="SECONDS",
+        help="with --adaptive and one process, print rate and window statistics to stderr this often",
+    )
+    p.add_argument("--ledger", help="SQLite send ledger to record every post in")
+    p.add_argument(
+        "--skip-sent",
+        action="store_true",
+        help="with --ledger, skip clusters that already received this template and parameters",
+    )
+    p.add_argument(
+        "--checkpoint",
+        help="checkpoint file; an interrupted send rerun with the same input resumes where it stopped",
+    )
+    p.add_argument(
+        "--suppress-db",
+        help="SQLite file of recent sends, shared between senders; repeats within the window are skipped",
+    )
+    p.add_argument(
+        "--suppress-window",
+        type=float,
+        default=DEFAULT_WINDOW,
+        help=f"suppression window in seconds (default: {DEFAULT_WINDOW:g})",
+    )
+    p.add_argument("--dead-letters", metavar="DB", help="SQLite dead-letter store to keep failed payloads in")
+    p.add_argument(
+        "--coordinate",
+        metavar="DB",
+        help="share the send with other hosts through this SQLite file; each host leases shards of the input",
+    )
+    p.add_argument("--job", help="with --coordinate, the job name (default: derived from template and -p)")
+    p.add_argument("--shards", type=int, default=16, help="with --coordinate, shards of a new job (default: 16)")
+    p.add_argument("--lease", type=float, default=30.0, help="with --coordinate, lease seconds (default: 30)")
+    p.add_argument(
+        "--resend-uncertain",
+        action="store_true",
+        help="with --coordinate, resend inputs a failed host may have posted instead of reporting them",
+    )
+    p.set_defaults(func=cmd_send)
+
+    p = sub.add_parser("route", help="pick templates for an Alertmanager webhook payload")
+    p.add_argument(
+        "payload",
+        type=argparse.FileType("r"),
+        nargs="?",
+        default="-",
+        help="webhook JSON (default: stdin)",
+    )
+    p.add_argument("--provider", help="cloud provider of the cluster (aws, gcp)")
+    p.add_argument("--cluster-uuid", help="cluster UUID, if the alerts do not carry one")
+    p.add_argument("--fallback", help="template for alerts without a route, e.g. osd/unknown_failure")
+    p.add_argument("--resolved", help="template for resolved alerts, e.g. osd/incident_resolved")
+    p.add_argument(
+        "--enqueue",
+        metavar="DB",
+        help="render the alerts that have every parameter and put them on this SQLite work queue",
+    )
+    p.add_argument("--queue", default="default", help="with --enqueue, the queue name (default: default)")
+    p.set_defaults(func=cmd_route)
+
+    p = sub.add_parser("queue", help="show how many notifications a work queue holds")
+    p.add_argument("db", help="SQLite work queue")
+    p.add_argument("--queue", default="default", help="queue name (default: default)")
+    p.set_defaults(func=cmd_queue)
+
+    p = sub.add_parser("drain", help="post the notifications on a work queue")
+    p.add_argument("db", help="SQLite work queue")
+    p.add_argument("--queue", default="default", help="queue name (default: default)")
+    p.add_argument("--url", default=DEFAULT_URL, help=f"API base URL (default: {DEFAULT_URL})")
+    add_token_args(p)
+    p.add_argument("--concurrency", type=int, default=16, help="requests in flight (default: 16)")
+    p.add_argument("--retries", type=int, default=3)
+    p.add_argument(
+        "--follow",
+        action="store_true",
+        help="keep waiting for new notifications instead of stopping once the queue is empty",
+    )
+    p.add_argument(
+        "--visibility-timeout",
+        type=float,
+        default=DEFAULT_VISIBILITY_TIMEOUT,
+        help="seconds a notification taken stays hidden from other consumers; if it is not acknowledged "
+        f"by then it is delivered again (default: {DEFAULT_VISIBILITY_TIMEOUT:g})",
+    )
+    p.add_argument(
+        "--max-attempts",
+        type=int,
+        default=10,
+        help="deliveries after which a notification that keeps failing is given up (default: 10)",
+    )
+    p.add_argument(
+        "--dead-letters",
+        metavar="DB",
+        help="SQLite dead-letter store to keep notifications that were given up in",
+    )
+    p.add_argument("--ledger", help="SQLite send ledger to record every post in")
+    p.add_argument("--suppress-db", help="SQLite file of recent sends; repeats within the window are skipped")
+    p.add_argument(
+        "--suppress-window",
+        type=float,
+        default=DEFAULT_WINDOW,
+        help=f"suppression window in seconds (default: {DEFAULT_WINDOW:g})",
+    )
+    p.set_defaults(func=cmd_drain)
+
+    p = sub.add_parser("dead-letters", help="query payloads that could not be posted")
+    p.add_argument("db", help="SQLite dead-letter store")
+    p.add_argument("--template", help="only entries of this template")
+    p.add_argument("--error-class", choices=ERROR_CLASSES, help="only entries that failed this way")
+    p.add_argument("--cluster-uuid", help="only entries for this cluster")
+    p.add_argument("--all", action="store_true", help="include entries resolved by a re-drive")
+    p.add_argument("--limit", type=int)
+    p.add_argument("--summary", action="store_true", help="count entries per template and error class")
+    p.add_argument("--purge", action="store_true", help="delete resolved entries matching --template/--error-class")
+    p.set_defaults(func=cmd_dead_letters)
+
+    p = sub.add_parser("redrive", help="post dead-lettered payloads again")
+    p.add_argument("db", help="SQLite dead-letter store")
+    p.add_argument("--template", help="only entries of this template")
+    p.add_argument("--error-class", choices=ERROR_CLASSES, help="only entries that failed this way")
+    p.add_argument("--cluster-uuid", help="only entries for this cluster")
+    p.add_argument("--id", type=int, action="append", help="only this entry (repeatable)")
+    p.add_argument("--limit", type=int)
+    p.add_argument(
+        "-p",
+        "--param",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="re-render each entry from its stored parameters with this one replaced, instead of resending "
+        "the stored payload",
+    )
+    p.add_argument("--url", default=DEFAULT_URL, help=f"API base URL (default: {DEFAULT_URL})")
+    add_token_args(p)
+    p.add_argument("--concurrency", type=int, default=16, help="requests in flight (default: 16)")
+    p.add_argument("--retries", type=int, default=3)
+    p.add_argument("--ledger", help="SQLite send ledger to record every post in")
+    p.add_argument("--suppress-db", help="SQLite file of recent sends; repeats within the window are skipped")
+    p.add_argument(
+        "--suppress-window",
+        type=float,
+        default=DEFAULT_WINDOW,
+        help=f"suppression window in seconds (default: {DEFAULT_WINDOW:g})",
+    )
+    p.set_defaults(func=cmd_redrive)
+
+    p = sub.add_parser("generate", help="write a synthetic cluster inventory for load tests")
+    p.add_argument("output", help="output file: .jsonl, .arrow/.feather or .parquet; - for JSON lines on stdout")
+    p.add_argument("-n", "--count", type=int, default=100_000, help="number of clusters (default: 100000)")
+    p.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    p.add_argument("--spec", help="JSON file overriding the default distributions (see FleetSpec)")
+    p.set_defaults(func=cmd_generate)
+
+    p = sub.add_parser("stub-server", help="run a local stand-in for the service log API")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8000)
+    p.add_argument("--token", help="bearer token to require")
+    p.add_argument(
+        "--refresh-token", help="serve an SSO token endpoint that exchanges this offline token for access tokens"
+    )
+    p.add_argument("--token-ttl", type=float, default=900.0, help="lifetime of issued access tokens (default: 900)")
+    p.add_argument("--latency", type=float, default=0.0, help="seconds added to every POST")
+    p.add_argument("--jitter", type=float, default=0.0, help="up to this many more seconds, at random")
+    p.add_argument("--error-rate", type=float, default=0.0, help="share of POSTs failed with --error-status")
+    p.add_argument("--error-status", type=int, default=503)
+    p.add_argument("--rate-limit", type=float, help="POSTs per second accepted before answering 429")
+    p.add_argument("--throttle-rate", type=float, default=0.0, help="share of POSTs answered with 429")
+    p.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    p.add_argument("--drop-rate", type=float, default=0.0, help="share of POSTs whose connection is dropped")
+    p.add_argument("--seed", type=int, help="random seed for the injected faults")
+    p.add_argument("--stats", type=float, metavar="SECONDS", help="print metrics to stderr this often")
+    p.set_defaults(func=cmd_stub_server)
+
+    p = sub.add_parser("select", help="evaluate a cluster selector")
+    p.add_argument("expression", help="search expression; fragment names from cluster/ may be used")
+    p.add_argument("-p", "--param", action="append", default=[], metavar="NAME=VALUE")
+    p.add_argument(
+        "--inventory",
+        help="cluster inventory (JSON lines, Arrow or Parquet); prints matching cluster UUIDs. "
+        "Without it the expanded OCM search string is printed.",
+    )
+    p.add_argument("--count", action="store_true", help="print the number of matching clusters only")
+    p.set_defaults(func=cmd_select)
+
+    p = sub.add_parser("validate", help="validate all templates, or rendered payloads")
+    p.add_argument(
+        "--payloads",
+        type=argparse.FileType("r"),
+        help="JSON lines file of rendered payloads to validate instead of the templates",
+    )
+    p.add_argument(
+        "--changed-since",
+        metavar="REV",
+        help="only validate templates added, modified or renamed since git revision REV",
+    )
+    p.set_defaults(func=cmd_validate)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except TemplateNotFound as e:
+        print(f"unknown template: {e.args[0]}", file=sys.stderr)
+    except (
+        AuthError,
+        BundleError,
+        CheckpointError,
+        CoordinatorError,
+        FleetSpecError,
+        MissingParameters,
+        RevisionError,
+        SelectorError,
+        ShardError,
+        ValidationError,
+    ) as e:
+        print(e, file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""OCM access tokens from an offline token, cached and refreshed ahead of expiry.
+
+:class:`TokenManager` exchanges an offline (refresh) token for an access
+token with Red Hat SSO (the OAuth refresh-token grant ``ocm login`` uses)
+and hands the same access token to every caller until it is about to
+expire. It is a callable, so it can be passed as ``token`` to
+:class:`~.sender.BulkSender`::
+
+    with TokenManager(offline_token, cache_path="~/.cache/managed-notifications/token.json") as token, \\
+            BulkSender(token=token) as sender:
+        ...
+
+Reading a valid token takes no lock. Refreshes are single-flight: one
+thread fetches while the others keep using the current token, or wait if
+it has expired. A background thread refreshes ``refresh_margin`` seconds
+before expiry, so posts do not wait on SSO at all. With ``cache_path`` the
+access token is also shared through a file: worker processes take an
+exclusive ``fcntl`` lock on it before refreshing and reuse a token another
+process already fetched.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Union
+from urllib.parse import urlencode
+
+try:
+    import fcntl
+except ImportError:  # Windows: the cache file is then shared without locking
+    fcntl = None
+
+#: Path of the OpenID Connect token endpoint, below the SSO host.
+TOKEN_PATH = "/auth/realms/redhat-external/protocol/openid-connect/token"
+
+#: Token endpoint of Red Hat SSO.
+SSO_TOKEN_URL = "https://sso.redhat.com" + TOKEN_PATH
+
+#: OAuth client the OCM command line tools authenticate as.
+DEFAULT_CLIENT_ID = "cloud-services"
+
+#: Seconds a token must still be valid for callers to use it while a refresh is pending.
+MIN_VALIDITY = 5.0
+
+
+class AuthError(RuntimeError):
+    """Raised when SSO refuses the offline token or cannot be reached."""
+
+
+@dataclass(frozen=True)
+class AccessToken:
+    value: str
+    #: Wall-clock times (``time.time()``), comparable across processes.
+    issued_at: float
+    expires_at: float
+    #: When to replace it: ``refresh_margin`` before expiry, or half way for short-lived tokens.
+    refresh_at: float
+
+    def valid_for(self, seconds: float) -> bool:
+        return self.expires_at - time.time() > seconds
+
+
+class TokenManager:
+    """Shared access token for one offline token; see the module docstring."""
+
+    def __init__(
+        self,
+        offline_token: str,
+        token_url: str = SSO_TOKEN_URL,
+        client_id: str = DEFAULT_CLIENT_ID,
+        cache_path: Union[str, Path, None] = None,
+        refresh_margin: float = 60.0,
+        timeout: float = 30.0,
+        background: bool = True,
+    ):
+        if not offline_token:
+            raise AuthError("an offline token is required")
+        self.token_url = token_url
+        self.client_id = client_id
+        self.cache_path = Path(cache_path).expanduser() if cache_path is not None else None
+        self.refresh_margin = refresh_margin
+        self.timeout = timeout
+        self.background = background
+        #: Tokens fetched from SSO by this instance.
+        self.refreshes = 0
+        self._refresh_token = offline_token
+        # Identifies the offline token in the cache file without storing it.
+        self._key = hashlib.blake2b(f"{token_url}\0{client_id}\0{offline_token}".encode(), digest_size=16).hexdigest()
+        self._current: Optional[AccessToken] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __reduce__(self):
+        # A copy (e.g. in a worker process) starts with no token of its own
+        # and shares fetched tokens through ``cache_path``, if any. It gets
+        # the latest refresh token but keeps the cache key of the offline
+        # token, so the cache file stays shared after SSO rotates it.
+        return (
+            type(self),
+            (
+                self._refresh_token,
+                self.token_url,
+                self.client_id,
+                self.cache_path,
+                self.refresh_margin,
+                self.timeout,
+                self.background,
+            ),
+            {"_key": self._key},
+        )
+
+    def __call__(self) -> str:
+        """The current access token, refreshing it first if needed."""
+        current = self._current
+        if current is not None:
+            if time.time() < current.refresh_at:
+                return current.value
+            if self._thread is not None and current.valid_for(MIN_VALIDITY):
+                return current.value
+        return self._refresh().value
+
+    def invalidate(self, rejected: str) -> None:
+        """Fetch a new token unless ``rejected`` (e.g. answered with 401) was already replaced."""
+        self._refresh(rejected)
+
+    def _usable(self, token: Optional[AccessToken], rejected: Optional[str]) -> bool:
+        return token is not None and token.value != rejected and time.time() < token.refresh_at
+
+    def _token(self, value: str, issued_at: float, expires_at: float) -> AccessToken:
+        margin = min(self.refresh_margin, (expires_at - issued_at) / 2)
+        return AccessToken(value, issued_at, expires_at, expires_at - margin)
+
+    def _refresh(self, rejected: Optional[str] = None) -> AccessToken:
+        with self._lock:
+            if self._usable(self._current, rejected):
+                return self._current
+            with self._file_lock():
+                cached = self._read_cache()
+                if self._usable(cached, rejected):
+                    token = cached
+                else:
+                    token = self._fetch()
+                    self._write_cache(token)
+            self._current = token
+            if self.background and self._thread is None and not self._stop.is_set():
+                self._thread = threading.Thread(target=self._run, name="token-refresh", daemon=True)
+                self._thread.start()
+            return token
+
+    def _fetch(self) -> AccessToken:
+        body = urlencode(
+            {"grant_type": "refresh_token", "client_id": self.client_id, "refresh_token": self._refresh_token}
+        ).encode("ascii")
+        request = urllib.request.Request(
+            self.token_url,
+            data=body,
+            headers={"Content-Type": "application/x-www-form-urlencoded", "Accept": "application/json"},
+        )
+        requested = time.time()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = json.load(response)
+        except urllib.error.HTTPError as e:
+            raise AuthError(f"token refresh failed: HTTP {e.code}: {_oauth_error(e)}") from None
+        except (OSError, ValueError) as e:
+            raise AuthError(f"token refresh failed: {e}") from None
+        if not isinstance(data, dict) or not data.get("access_token"):
+            raise AuthError("token refresh failed: no access_token in the response")
+        # SSO may rotate the refresh token; later refreshes must use the new one.
+        self._refresh_token = data.get("refresh_token") or self._refresh_token
+        self.refreshes += 1
+        return self._token(data["access_token"], requested, requested + float(data.get("expires_in", 300)))
+
+    def _run(self) -> None:
+        failures = 0
+        while True:
+            current = self._current
+            if failures:
+                delay = min(60.0, 2.0**failures)
+            else:
+                delay = current.refresh_at - time.time()
+            if self._stop.wait(max(delay, 0.0)):
+                return
+            try:
+                self._refresh()
+            except AuthError:
+                # Callers keep the current token until it expires, then refresh themselves.
+                failures += 1
+            else:
+                failures = 0
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        if self.cache_path is None or fcntl is None:
+            yield
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(f"{self.cache_path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _read_cache(self) -> Optional[AccessToken]:
+        if self.cache_path is None:
+            return None
+        try:
+            with self.cache_path.open(encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("key") != self._key:
+                return None
+            return self._token(data["access_token"], float(data["issued_at"]), float(data["expires_at"]))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+    def _write_cache(self, token: AccessToken) -> None:
+        if self.cache_path is None:
+            return
+        tmp = self.cache_path.with_name(f"{self.cache_path.name}.{os.getpid()}.tmp")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "key": self._key,
+                    "access_token": token.value,
+                    "issued_at": token.issued_at,
+                    "expires_at": token.expires_at,
+                },
+                f,
+            )
+        os.replace(tmp, self.cache_path)
+
+    def close(self) -> None:
+        """Stop the background refresh."""
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def __enter__(self) -> "TokenManager":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _oauth_error(error: urllib.error.HTTPError) -> str:
+    try:
+        data: Dict[str, Any] = json.load(error)
+        return data.get("error_description") or data.get("error") or error.reason
+    except (OSError, ValueError, AttributeError):
+        return str(error.reason)
@@ -0,0 +1,211 @@
+"""Single-file binary bundle of all templates and selector fragments.
+
+Layout (little endian)::
+
+    header   magic "MNBUNDLE", format version (u32), entry count (u32),
+             SHA-256 digest of the entry data (32 bytes)
+    entries  count x (kind u8, 3 pad bytes, name offset/length,
+             data offset/length, meta offset/length as u32 pairs)
+    blobs    names, data and meta, referenced by absolute offset
+
+Template data is the template's compact JSON; template meta is
+``severity \\x1f summary \\x1f placeholder,placeholder,... \\x1f digest``, the
+digest being :func:`~.catalog.template_digest` of the template. Fragment data
+is the fragment text. The reader memory-maps the file and only copies the
+bytes of the entries that are actually looked up.
+
+Build a bundle with ``python -m managed_notifications bundle``; point
+:func:`~.catalog.default_catalog` at it with the ``MANAGED_NOTIFICATIONS_BUNDLE``
+environment variable.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from .catalog import REPO_ROOT, Catalog, TemplateEntry, provider_for, template_digest
+from .selector import FRAGMENT_DIR, FragmentSource, fragment_names, read_fragment
+
+MAGIC = b"MNBUNDLE"
+FORMAT_VERSION = 2
+
+#: Default output of the bundle build step.
+BUNDLE_PATH = Path(__file__).resolve().parent / "templates.bundle"
+
+KIND_TEMPLATE = 1
+KIND_FRAGMENT = 2
+
+_HEADER = struct.Struct("<8sII32s")
+_ENTRY = struct.Struct("<B3xIIIIII")
+_SEP = "\x1f"
+
+
+class BundleError(ValueError):
+    """Raised for missing, corrupt or incompatible bundle files."""
+
+
+def build_bundle(
+    path: Union[str, Path] = BUNDLE_PATH,
+    catalog: Optional[Catalog] = None,
+    fragments: FragmentSource = FRAGMENT_DIR,
+) -> str:
+    """Write a bundle of every template and fragment; returns its hex digest.
+
+    An existing bundle at ``path`` with the same digest is left untouched, so
+    its mtime (and anything keyed on it) only changes when its content does.
+    """
+    catalog = catalog if catalog is not None else Catalog.build(REPO_ROOT)
+    records: List[Tuple[int, bytes, bytes, bytes]] = []
+    for entry in sorted(catalog, key=lambda e: e.id):
+        template = catalog.template(entry.id)
+        data = json.dumps(template, separators=(",", ":")).encode("utf-8")
+        meta = _SEP.join(
+            (
+                entry.severity or "",
+                entry.summary or "",
+                ",".join(sorted(entry.placeholders)),
+                entry.digest or template_digest(template),
+            )
+        ).encode("utf-8")
+        records.append((KIND_TEMPLATE, entry.id.encode("utf-8"), data, meta))
+    for name in fragment_names(fragments):
+        text = read_fragment(name, fragments).encode("utf-8")
+        records.append((KIND_FRAGMENT, name.encode("utf-8"), text, b""))
+
+    digest = hashlib.sha256()
+    blobs = bytearray()
+    table = bytearray()
+    base = _HEADER.size + _ENTRY.size * len(records)
+    for kind, name, data, meta in records:
+        offsets = []
+        for blob in (name, data, meta):
+            offsets += [base + len(blobs), len(blob)]
+            blobs += blob
+        table += _ENTRY.pack(kind, *offsets)
+        digest.update(bytes([kind]) + name + b"\0" + data + b"\0" + meta + b"\0")
+
+    path = Path(path)
+    if bundle_digest(path) == digest.hexdigest():
+        return digest.hexdigest()
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(records), digest.digest()))
+        f.write(table)
+        f.write(blobs)
+    os.replace(tmp, path)
+    return digest.hexdigest()
+
+
+def bundle_digest(path: Union[str, Path] = BUNDLE_PATH) -> Optional[str]:
+    """The digest recorded in the bundle at ``path``, or None if there is no readable bundle."""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(_HEADER.size)
+    except OSError:
+        return None
+    if len(header) < _HEADER.size:
+        return None
+    magic, version, _, digest = _HEADER.unpack(header)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        return None
+    return digest.hex()
+
+
+class Bundle:
+    """Read-only, memory-mapped view of a bundle file."""
+
+    def __init__(self, path: Union[str, Path] = BUNDLE_PATH):
+        self.path = Path(path)
+        try:
+            with self.path.open("rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError) as e:
+            raise BundleError(f"cannot open bundle {self.path}: {e}") from None
+        self._view = memoryview(self._mmap)
+        if len(self._view) < _HEADER.size:
+            raise BundleError(f"{self.path}: truncated bundle")
+        magic, version, count, digest = _HEADER.unpack_from(self._view)
+        if magic != MAGIC:
+            raise BundleError(f"{self.path}: not a template bundle")
+        if version != FORMAT_VERSION:
+            raise BundleError(f"{self.path}: unsupported bundle format {version}")
+        self.digest = digest.hex()
+        self._count = count
+        self._index: Optional[Dict[Tuple[int, str], int]] = None
+
+    def close(self) -> None:
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self) -> "Bundle":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _entry(self, i: int) -> Tuple[int, int, int, int, int, int, int]:
+        return _ENTRY.unpack_from(self._view, _HEADER.size + i * _ENTRY.size)
+
+    def _slice(self, offset: int, length: int) -> memoryview:
+        return self._view[offset : offset + length]
+
+    def _lookup(self, kind: int, name: str) -> Tuple[int, int, int, int, int, int, int]:
+        if self._index is None:
+            index = {}
+            for i in range(self._count):
+                entry = self._entry(i)
+                index[(entry[0], str(self._slice(entry[1], entry[2]), "utf-8"))] = i
+            self._index = index
+        try:
+            return self._entry(self._index[(kind, name)])
+        except KeyError:
+            raise KeyError(name) from None
+
+    def names(self, kind: int = KIND_TEMPLATE) -> Iterator[str]:
+        for i in range(self._count):
+            entry = self._entry(i)
+            if entry[0] == kind:
+                yield str(self._slice(entry[1], entry[2]), "utf-8")
+
+    def raw(self, template_id: str) -> bytes:
+        """The template's compact JSON.
+
+        This is a copy rather than a view of the mapping, so it stays valid
+        (and cannot keep the bundle from closing) after :meth:`close`.
+        """
+        entry = self._lookup(KIND_TEMPLATE, template_id)
+        return bytes(self._slice(entry[3], entry[4]))
+
+    def template(self, template_id: str) -> dict:
+        return json.loads(self.raw(template_id))
+
+    def entry(self, template_id: str) -> TemplateEntry:
+        entry = self._lookup(KIND_TEMPLATE, template_id)
+        severity, summary, placeholders, digest = str(self._slice(entry[5], entry[6]), "utf-8").split(_SEP)
+        return TemplateEntry(
+            id=template_id,
+            path=f"{template_id}.json",
+            severity=severity or None,
+            summary=summary or None,
+            placeholders=frozenset(placeholders.split(",")) if placeholders else frozenset(),
+            provider=provider_for(template_id),
+            digest=digest,
+        )
+
+    def fragment(self, name: str) -> str:
+        entry = self._lookup(KIND_FRAGMENT, name)
+        return str(self._slice(entry[3], entry[4]), "utf-8")
+
+    def fragments(self) -> Dict[str, str]:
+        return {name: self.fragment(name) for name in self.names(KIND_FRAGMENT)}
+
+    def catalog(self) -> Catalog:
+        """A catalog whose template bodies are read from this bundle."""
+        entries = {name: self.entry(name) for name in self.names()}
+        return Catalog(entries, loader=lambda entry: self.template(entry.id))
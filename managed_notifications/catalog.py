@@ -0,0 +1,271 @@
+"""Template catalog backed by a prebuilt index.
+
+The index (``index.json`` next to this module) records, for every template
+under ``osd/`` and ``ocm/``, its path, severity, summary, provider, the
+placeholders it uses and a digest of its content. Looking a template up
+only touches the index; the template body is read and parsed the first time
+it is requested and cached afterwards.
+
+Regenerate the index after adding or editing templates::
+
+    python -m managed_notifications index
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, Iterator, List, Optional
+
+#: Repository root, i.e. the directory holding ``osd/``, ``ocm/`` and ``cluster/``.
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+#: Location of the generated index shipped with the package.
+INDEX_PATH = Path(__file__).resolve().parent / "index.json"
+
+#: Environment variable naming a template bundle to use instead of this checkout.
+BUNDLE_ENV = "MANAGED_NOTIFICATIONS_BUNDLE"
+
+#: Bump when the layout of ``index.json`` changes.
+INDEX_VERSION = 2
+
+#: Directories (relative to the repository root) that hold templates.
+TEMPLATE_DIRS = ("osd", "ocm")
+
+PLACEHOLDER_RE = re.compile(r"\$\{([A-Za-z0-9_]+)\}")
+
+
+class TemplateNotFound(KeyError):
+    """Raised when a template id is not present in the catalog."""
+
+
+@dataclass(frozen=True)
+class TemplateEntry:
+    """Index record for a single template."""
+
+    id: str
+    path: str
+    severity: Optional[str]
+    summary: Optional[str]
+    placeholders: FrozenSet[str]
+    provider: Optional[str]
+    #: :func:`template_digest` of the body, when known.
+    digest: Optional[str] = None
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "severity": self.severity,
+            "summary": self.summary,
+            "placeholders": sorted(self.placeholders),
+            "provider": self.provider,
+            "digest": self.digest,
+        }
+
+    @classmethod
+    def from_json(cls, template_id: str, data: Dict[str, Any]) -> "TemplateEntry":
+        return cls(
+            id=template_id,
+            path=data["path"],
+            severity=data.get("severity"),
+            summary=data.get("summary"),
+            placeholders=frozenset(data.get("placeholders", ())),
+            provider=data.get("provider"),
+            digest=data.get("digest"),
+        )
+
+
+def normalize_id(name: str) -> str:
+    """Turn a path, file name or raw GitHub URL into a template id.
+
+    ``osd/aws/AWS_outage.json``, ``./osd/aws/AWS_outage`` and
+    ``https://raw.githubusercontent.com/openshift/managed-notifications/master/osd/aws/AWS_outage.json``
+    all map to ``osd/aws/AWS_outage``.
+    """
+    name = name.strip().replace("\\", "/")
+    if "://" in name:
+        parts = name.split("/")
+        for i, part in enumerate(parts):
+            if part in TEMPLATE_DIRS:
+                name = "/".join(parts[i:])
+                break
+    if name.startswith("./"):
+        name = name[2:]
+    if name.endswith(".json"):
+        name = name[: -len(".json")]
+    return name
+
+
+def provider_for(template_id: str) -> Optional[str]:
+    """Return the cloud provider a template is specific to, if any."""
+    parts = template_id.split("/")
+    if len(parts) > 2:
+        return parts[1]
+    return None
+
+
+def placeholders_in(template: Dict[str, Any]) -> FrozenSet[str]:
+    """Return every ``${NAME}`` placeholder used in a template's string values."""
+    found = set()
+    for value in template.values():
+        if isinstance(value, str):
+            found.update(PLACEHOLDER_RE.findall(value))
+    return frozenset(found)
+
+
+def template_digest(template: Dict[str, Any]) -> str:
+    """Hex digest of a template's normalized JSON (sorted keys, compact).
+
+    Reformatting or reordering keys leaves it unchanged; any change to a
+    value, and so to the placeholders used, changes it.
+    """
+    data = json.dumps(template, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def template_paths(root: Path = REPO_ROOT) -> List[Path]:
+    """List every template file below ``root``, sorted by path."""
+    paths: List[Path] = []
+    for directory in TEMPLATE_DIRS:
+        paths.extend((root / directory).rglob("*.json"))
+    return sorted(paths)
+
+
+def entry_for(root: Path, path: Path, template: Dict[str, Any]) -> TemplateEntry:
+    rel = path.relative_to(root).as_posix()
+    template_id = normalize_id(rel)
+    return TemplateEntry(
+        id=template_id,
+        path=rel,
+        severity=template.get("severity"),
+        summary=template.get("summary"),
+        placeholders=placeholders_in(template),
+        provider=provider_for(template_id),
+        digest=template_digest(template),
+    )
+
+
+class Catalog:
+    """Lookup of templates by id, with lazily parsed bodies.
+
+    Bodies are read from ``root`` unless a ``loader`` is given, e.g. one
+    reading from a :class:`~.bundle.Bundle`.
+    """
+
+    def __init__(
+        self,
+        entries: Dict[str, TemplateEntry],
+        root: Path = REPO_ROOT,
+        loader: Optional[Callable[[TemplateEntry], Dict[str, Any]]] = None,
+    ):
+        self.root = Path(root)
+        self._entries = entries
+        self._bodies: Dict[str, Dict[str, Any]] = {}
+        self._loader = loader if loader is not None else self._read
+
+    @classmethod
+    def build(cls, root: Path = REPO_ROOT) -> "Catalog":
+        """Scan the template directories and build a fresh catalog."""
+        root = Path(root)
+        catalog = cls({}, root)
+        for path in template_paths(root):
+            with path.open(encoding="utf-8") as f:
+                template = json.load(f)
+            entry = entry_for(root, path, template)
+            catalog._entries[entry.id] = entry
+            catalog._bodies[entry.id] = template
+        return catalog
+
+    @classmethod
+    def load(cls, root: Path = REPO_ROOT, index_path: Optional[Path] = None) -> "Catalog":
+        """Load the catalog from the prebuilt index, scanning only if it is missing."""
+        index_path = Path(index_path) if index_path is not None else INDEX_PATH
+        try:
+            with index_path.open(encoding="utf-8") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return cls.build(root)
+        if index.get("version") != INDEX_VERSION:
+            return cls.build(root)
+        entries = {
+            template_id: TemplateEntry.from_json(template_id, data)
+            for template_id, data in index["templates"].items()
+        }
+        return cls(entries, root)
+
+    def to_index(self) -> Dict[str, Any]:
+        return {
+            "version": INDEX_VERSION,
+            "templates": {
+                template_id: self._entries[template_id].to_json()
+                for template_id in sorted(self._entries)
+            },
+        }
+
+    def write_index(self, index_path: Optional[Path] = None) -> None:
+        index_path = Path(index_path) if index_path is not None else INDEX_PATH
+        with index_path.open("w", encoding="utf-8") as f:
+            json.dump(self.to_index(), f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[TemplateEntry]:
+        return iter(self._entries.values())
+
+    def __contains__(self, template_id: object) -> bool:
+        return isinstance(template_id, str) and normalize_id(template_id) in self._entries
+
+    def ids(self) -> List[str]:
+        return list(self._entries)
+
+    def entry(self, template_id: str) -> TemplateEntry:
+        """Return the index record for ``template_id``."""
+        try:
+            return self._entries[template_id]
+        except KeyError:
+            pass
+        try:
+            return self._entries[normalize_id(template_id)]
+        except KeyError:
+            raise TemplateNotFound(template_id) from None
+
+    def template(self, template_id: str) -> Dict[str, Any]:
+        """Return the parsed template body, reading it from disk on first use.
+
+        The returned dict is shared; copy it before mutating.
+        """
+        entry = self.entry(template_id)
+        body = self._bodies.get(entry.id)
+        if body is None:
+            body = self._bodies[entry.id] = self._loader(entry)
+        return body
+
+    def _read(self, entry: TemplateEntry) -> Dict[str, Any]:
+        with (self.root / entry.path).open(encoding="utf-8") as f:
+            return json.load(f)
+
+    def by_provider(self, provider: Optional[str]) -> List[TemplateEntry]:
+        """Return templates specific to ``provider`` (``None`` for provider-neutral ones)."""
+        return [e for e in self._entries.values() if e.provider == provider]
+
+
+@lru_cache(maxsize=None)
+def default_catalog() -> Catalog:
+    """Return the process-wide catalog.
+
+    Templates come from the bundle named by ``$MANAGED_NOTIFICATIONS_BUNDLE``
+    if set, otherwise from this checkout via the prebuilt index.
+    """
+    bundle_path = os.environ.get(BUNDLE_ENV)
+    if bundle_path:
+        from .bundle import Bundle
+
+        return Bundle(bundle_path).catalog()
+    return Catalog.load()
@@ -0,0 +1,227 @@
+"""Which templates changed between two revisions of the repository.
+
+:func:`diff_revisions` compares the template trees of two git revisions (or
+a revision and the working tree). Files whose git blob is identical on both
+sides are skipped without being read (in the working tree, git tells which
+files differ from the index); the rest are parsed and compared by
+:func:`~.catalog.template_digest`, so reformatting a file is not a change.
+A removed and an added template with the same digest are reported as one
+rename.
+
+Each :class:`Change` also says which fields and placeholders changed, so
+callers can rebuild, invalidate or re-validate only what is affected::
+
+    python -m managed_notifications changes origin/master
+    python -m managed_notifications validate --changed-since origin/master
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import subprocess
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from .catalog import REPO_ROOT, TEMPLATE_DIRS, normalize_id, placeholders_in, template_digest
+
+#: Change statuses, in report order.
+STATUSES = ("added", "removed", "modified", "renamed")
+
+
+class RevisionError(ValueError):
+    """Raised when git cannot resolve a revision or read a tree."""
+
+
+@dataclass(frozen=True)
+class Change:
+    """One template that differs between two revisions."""
+
+    id: str
+    status: str
+    old_path: Optional[str] = None
+    new_path: Optional[str] = None
+    old_digest: Optional[str] = None
+    new_digest: Optional[str] = None
+    #: Top-level fields whose value differs (for ``modified``).
+    fields: Tuple[str, ...] = ()
+    placeholders_added: FrozenSet[str] = field(default_factory=frozenset)
+    placeholders_removed: FrozenSet[str] = field(default_factory=frozenset)
+
+    @property
+    def old_id(self) -> Optional[str]:
+        return normalize_id(self.old_path) if self.old_path else None
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "old_path": self.old_path,
+            "new_path": self.new_path,
+            "old_digest": self.old_digest,
+            "new_digest": self.new_digest,
+            "fields": list(self.fields),
+            "placeholders_added": sorted(self.placeholders_added),
+            "placeholders_removed": sorted(self.placeholders_removed),
+        }
+
+
+def _git(root: Path, *args: str, stdin: Optional[bytes] = None) -> bytes:
+    try:
+        result = subprocess.run(["git", *args], cwd=root, input=stdin, capture_output=True, check=True)
+    except FileNotFoundError:
+        raise RevisionError("git is not installed") from None
+    except subprocess.CalledProcessError as e:
+        raise RevisionError(e.stderr.decode("utf-8", "replace").strip() or f"git {args[0]} failed") from None
+    return result.stdout
+
+
+def blob_id(data: bytes) -> str:
+    """The git blob id of ``data``, as ``git hash-object`` computes it."""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+class _Tree:
+    """Template paths and blob ids at a revision, or in the working tree."""
+
+    def __init__(self, root: Path, rev: Optional[str]):
+        self.root = root
+        self.rev = rev
+        self._data: Dict[str, bytes] = {}
+        self.blobs: Dict[str, str] = {}
+        if rev is None:
+            # Index blob ids, then only the files that differ from the index
+            # (modified, deleted or untracked) are read and hashed.
+            for meta, name in _records(_git(root, "ls-files", "-s", "-z", "--", *TEMPLATE_DIRS)):
+                self.blobs[name] = meta.split()[1].decode("ascii")
+            dirty = _git(root, "diff", "--name-only", "-z", "--", *TEMPLATE_DIRS)
+            untracked = _git(root, "ls-files", "--others", "--exclude-standard", "-z", "--", *TEMPLATE_DIRS)
+            for name in (dirty + untracked).split(b"\0"):
+                rel = name.decode("utf-8")
+                if not rel.endswith(".json"):
+                    continue
+                try:
+                    data = self._data[rel] = (root / rel).read_bytes()
+                except FileNotFoundError:
+                    self.blobs.pop(rel, None)
+                    continue
+                self.blobs[rel] = blob_id(data)
+        else:
+            for meta, name in _records(_git(root, "ls-tree", "-r", "-z", rev, "--", *TEMPLATE_DIRS)):
+                _, kind, sha = meta.split()
+                if kind == b"blob":
+                    self.blobs[name] = sha.decode("ascii")
+
+    def read(self, paths: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Parse the templates at ``paths``, fetching blobs in one git call."""
+        paths = list(paths)
+        missing = [p for p in paths if p not in self._data]
+        if missing:
+            request = "".join(self.blobs[p] + "\n" for p in missing).encode("ascii")
+            out = _git(self.root, "cat-file", "--batch", stdin=request)
+            pos = 0
+            for path in missing:
+                header_end = out.index(b"\n", pos)
+                size = int(out[pos:header_end].split()[2])
+                self._data[path] = out[header_end + 1 : header_end + 1 + size]
+                pos = header_end + 1 + size + 1
+        bodies = {}
+        for path in paths:
+            try:
+                bodies[path] = json.loads(self._data[path])
+            except ValueError as e:
+                raise RevisionError(f"{path} at {self.rev or 'working tree'}: invalid JSON: {e}") from None
+        return bodies
+
+
+def _records(listing: bytes) -> Iterable[Tuple[bytes, str]]:
+    """``(metadata, path)`` of the ``.json`` entries of a ``-z`` git listing."""
+    for record in listing.split(b"\0"):
+        meta, _, path = record.partition(b"\t")
+        name = path.decode("utf-8")
+        if name.endswith(".json"):
+            yield meta, name
+
+
+_MISSING = object()
+
+
+def _changed_fields(old: Dict[str, Any], new: Dict[str, Any]) -> Tuple[str, ...]:
+    return tuple(sorted(k for k in old.keys() | new.keys() if old.get(k, _MISSING) != new.get(k, _MISSING)))
+
+
+def diff_revisions(old: str, new: Optional[str] = None, root: Path = REPO_ROOT) -> List[Change]:
+    """Templates added, removed, modified or renamed from ``old`` to ``new``.
+
+    ``new`` defaults to the working tree. Changes are sorted by status, then id.
+    """
+    root = Path(root)
+    before, after = _Tree(root, old), _Tree(root, new)
+    removed = [p for p in before.blobs if p not in after.blobs]
+    added = [p for p in after.blobs if p not in before.blobs]
+    touched = [p for p in before.blobs if p in after.blobs and before.blobs[p] != after.blobs[p]]
+    old_bodies = before.read(removed + touched)
+    new_bodies = after.read(added + touched)
+    old_digests = {p: template_digest(b) for p, b in old_bodies.items()}
+    new_digests = {p: template_digest(b) for p, b in new_bodies.items()}
+
+    changes: List[Change] = []
+    for path in touched:
+        if old_digests[path] == new_digests[path]:
+            continue
+        old_ph, new_ph = placeholders_in(old_bodies[path]), placeholders_in(new_bodies[path])
+        changes.append(
+            Change(
+                normalize_id(path),
+                "modified",
+                path,
+                path,
+                old_digests[path],
+                new_digests[path],
+                _changed_fields(old_bodies[path], new_bodies[path]),
+                new_ph - old_ph,
+                old_ph - new_ph,
+            )
+        )
+
+    added_by_digest: Dict[str, List[str]] = {}
+    for path in added:
+        added_by_digest.setdefault(new_digests[path], []).append(path)
+    renamed_to = set()
+    for path in removed:
+        candidates = added_by_digest.get(old_digests[path])
+        if candidates:
+            target = candidates.pop(0)
+            renamed_to.add(target)
+            changes.append(
+                Change(normalize_id(target), "renamed", path, target, old_digests[path], new_digests[target])
+            )
+        else:
+            changes.append(
+                Change(
+                    normalize_id(path),
+                    "removed",
+                    old_path=path,
+                    old_digest=old_digests[path],
+                    placeholders_removed=placeholders_in(old_bodies[path]),
+                )
+            )
+    for path in added:
+        if path not in renamed_to:
+            changes.append(
+                Change(
+                    normalize_id(path),
+                    "added",
+                    new_path=path,
+                    new_digest=new_digests[path],
+                    placeholders_added=placeholders_in(new_bodies[path]),
+                )
+            )
+    changes.sort(key=lambda c: (STATUSES.index(c.status), c.id))
+    return changes
+
+
+def changed_ids(changes: Iterable[Change]) -> List[str]:
+    """Ids of templates that exist after the change and differ from before."""
+    return sorted(c.id for c in changes if c.status != "removed")
@@ -0,0 +1,149 @@
+"""Checkpoints for resumable bulk sends.
+
+A checkpoint tracks which positions of a send's input have been completed:
+a bitmap over input indices plus a cursor, the first index not yet done.
+It is stored as two files:
+
+* ``<path>``, a snapshot: magic, job id, cursor and the bitmap;
+* ``<path>.log``, a journal of 4-byte indices completed since the snapshot.
+
+Each completion is appended to the journal straight away, so an interrupted
+run loses nothing it had already been told about; the journal is folded
+into the snapshot every ``compact_every`` completions and on close.
+
+The job id ties a checkpoint to one template and parameter set, so a
+checkpoint cannot be resumed against a different notice by mistake. It does
+not fingerprint the input list: resume with the same input, in the same
+order.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+from pathlib import Path
+from typing import Any, Mapping, Optional, Union
+
+MAGIC = b"MNCKPT01"
+
+_HEADER = struct.Struct("<8s16sQ")
+_INDEX = struct.Struct("<I")
+
+
+class CheckpointError(ValueError):
+    """Raised when a checkpoint belongs to another job or is corrupt."""
+
+
+def job_id(template_id: str, params: Optional[Mapping[str, Any]] = None) -> bytes:
+    """Identity of a send job: its template and fixed parameters."""
+    data = json.dumps([template_id, {k: str(v) for k, v in (params or {}).items()}], sort_keys=True)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).digest()
+
+
+class Checkpoint:
+    """Completed-index bitmap for one send job, persisted at ``path``."""
+
+    def __init__(self, path: Union[str, Path], job: bytes, compact_every: int = 10_000):
+        self.path = Path(path)
+        self.log_path = self.path.with_name(self.path.name + ".log")
+        self.job = job
+        self.compact_every = compact_every
+        self.cursor = 0
+        self._bits = bytearray()
+        self._since_compact = 0
+        self._load()
+        self._log = os.open(self.log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        if not self.path.exists():
+            self.save()
+
+    @classmethod
+    def for_job(
+        cls, path: Union[str, Path], template_id: str, params: Optional[Mapping[str, Any]] = None
+    ) -> "Checkpoint":
+        return cls(path, job_id(template_id, params))
+
+    def _load(self) -> None:
+        try:
+            data = self.path.read_bytes()
+        except FileNotFoundError:
+            data = b""
+        if data:
+            if len(data) < _HEADER.size:
+                raise CheckpointError(f"{self.path}: truncated checkpoint")
+            magic, job, cursor = _HEADER.unpack_from(data)
+            if magic != MAGIC:
+                raise CheckpointError(f"{self.path}: not a send checkpoint")
+            if job != self.job:
+                raise CheckpointError(f"{self.path}: checkpoint belongs to a different template or parameters")
+            self.cursor = cursor
+            self._bits = bytearray(data[_HEADER.size :])
+        try:
+            journal = self.log_path.read_bytes()
+        except FileNotFoundError:
+            journal = b""
+        if journal and not data:
+            raise CheckpointError(f"{self.log_path}: journal without a snapshot")
+        usable = len(journal) - len(journal) % _INDEX.size
+        for (index,) in _INDEX.iter_unpack(journal[:usable]):
+            self._set(index)
+        self._advance()
+
+    def _set(self, index: int) -> None:
+        byte = index >> 3
+        if byte >= len(self._bits):
+            self._bits.extend(bytes(byte + 1 - len(self._bits) + 1024))
+        self._bits[byte] |= 1 << (index & 7)
+
+    def _advance(self) -> None:
+        bits = self._bits
+        cursor = self.cursor
+        while (cursor >> 3) < len(bits) and bits[cursor >> 3] >> (cursor & 7) & 1:
+            cursor += 1
+        self.cursor = cursor
+
+    def done(self, index: int) -> bool:
+        """Whether input position ``index`` was completed in this or an earlier run."""
+        if index < self.cursor:
+            return True
+        byte = index >> 3
+        return byte < len(self._bits) and bool(self._bits[byte] >> (index & 7) & 1)
+
+    def mark(self, index: int) -> None:
+        """Record input position ``index`` as completed."""
+        if self.done(index):
+            return
+        self._set(index)
+        if index == self.cursor:
+            self._advance()
+        os.write(self._log, _INDEX.pack(index))
+        self._since_compact += 1
+        if self._since_compact >= self.compact_every:
+            self.save()
+
+    def completed(self) -> int:
+        """Number of completed positions."""
+        return sum(bin(b).count("1") for b in self._bits)
+
+    def save(self) -> None:
+        """Write a snapshot and empty the journal."""
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open("wb") as f:
+            f.write(_HEADER.pack(MAGIC, self.job, self.cursor))
+            f.write(self._bits.rstrip(b"\0"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        os.ftruncate(self._log, 0)
+        self._since_compact = 0
+
+    def close(self) -> None:
+        self.save()
+        os.close(self._log)
+
+    def __enter__(self) -> "Checkpoint":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
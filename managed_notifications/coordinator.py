@@ -0,0 +1,440 @@
+"""Sending one job from several hosts, with shards handed out on leases.
+
+A job (a template, its fixed parameters and a number of shards) lives in a
+SQLite file every participating host can open. Clusters are assigned to
+shards by :func:`~.sharded.shard_of`; each host repeatedly leases a shard,
+sends to the shard's clusters and marks it done, until no shard is left.
+A lease is kept alive by heartbeats; a shard whose lease expires (its host
+died or hung) is leased again by another host.
+
+No cluster is sent twice:
+
+* Every lease carries an epoch, and every write a holder makes is fenced
+  on it. A host that lost its lease (e.g. it was paused past the expiry)
+  finds out on its next write and stops sending.
+* Before posting, a holder *claims* the next block of the shard's inputs,
+  and it records the ones it completed. A new holder therefore knows which
+  inputs the previous one may have posted without confirming them. Those
+  *uncertain* inputs are skipped and reported as failed results (or, with
+  ``resend_uncertain``, sent again).
+
+Every host must read the same input, in the same order. Lease expiry
+compares wall clocks across hosts, so keep them in sync to well within the
+lease duration. The file needs a filesystem with working POSIX locks; the
+SQL is plain, so the store can move to a database server by porting
+:class:`Coordinator`.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+
+from .checkpoint import job_id as job_key
+from .render import Params, iter_uuids
+from .sender import BulkSender, SendResult
+from .sharded import shard_of
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    job_key BLOB NOT NULL,
+    template_id TEXT NOT NULL,
+    params TEXT NOT NULL,
+    shards INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS shards (
+    job_id TEXT NOT NULL,
+    shard INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    epoch INTEGER NOT NULL DEFAULT 0,
+    lease_expires REAL,
+    heartbeat_at REAL,
+    claimed INTEGER NOT NULL DEFAULT 0,
+    done BLOB NOT NULL DEFAULT x'',
+    sent INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    uncertain INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (job_id, shard)
+);
+"""
+
+#: Shard states.
+PENDING, LEASED, DONE = "pending", "leased", "done"
+
+UNCERTAIN_ERROR = "uncertain: an earlier holder of this shard may have posted it"
+
+
+class CoordinatorError(ValueError):
+    """Raised for an unknown job or one defined differently elsewhere."""
+
+
+@dataclass(frozen=True)
+class ShardStatus:
+    job_id: str
+    shard: int
+    state: str
+    owner: Optional[str]
+    epoch: int
+    lease_expires: Optional[float]
+    heartbeat_at: Optional[float]
+    sent: int
+    failed: int
+    uncertain: int
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "shard": self.shard,
+            "state": self.state,
+            "owner": self.owner,
+            "epoch": self.epoch,
+            "lease_expires": self.lease_expires,
+            "heartbeat_at": self.heartbeat_at,
+            "sent": self.sent,
+            "failed": self.failed,
+            "uncertain": self.uncertain,
+        }
+
+
+@dataclass(frozen=True)
+class Job:
+    job_id: str
+    template_id: str
+    params: Mapping[str, Any]
+    shards: int
+
+
+class Coordinator:
+    """Job and lease store in the SQLite file at ``path``; see the module docstring.
+
+    ``host`` names this participant in leases (default: host name and pid).
+    Leases last ``lease`` seconds and are renewed every ``lease / 3``.
+    """
+
+    def __init__(self, path: Union[str, Path], host: Optional[str] = None, lease: float = 30.0):
+        self.path = Path(path)
+        self.host = host or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease = lease
+        self._db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "Coordinator":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _transaction(self, sql: str, args: Tuple[Any, ...] = ()) -> int:
+        """Run one fenced write; return the number of rows it changed."""
+        with self._lock:
+            return self._db.execute(sql, args).rowcount
+
+    def create_job(
+        self, job_id: str, template_id: str, params: Optional[Mapping[str, Any]] = None, shards: int = 16
+    ) -> Job:
+        """Create the job, or check that an existing one has the same definition."""
+        if shards < 1:
+            raise CoordinatorError("a job needs at least one shard")
+        params = {k: str(v) for k, v in (params or {}).items()}
+        key = job_key(template_id, params)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT job_key, shards FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+                if row is None:
+                    self._db.execute(
+                        "INSERT INTO jobs (job_id, job_key, template_id, params, shards, created_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        (job_id, key, template_id, json.dumps(params, sort_keys=True), shards, time.time()),
+                    )
+                    self._db.executemany(
+                        "INSERT INTO shards (job_id, shard) VALUES (?, ?)", [(job_id, s) for s in range(shards)]
+                    )
+                elif bytes(row[0]) != key or row[1] != shards:
+                    raise CoordinatorError(f"job {job_id} exists with a different template, parameters or shards")
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return Job(job_id, template_id, params, shards)
+
+    def job(self, job_id: str) -> Job:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT template_id, params, shards FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            raise CoordinatorError(f"no such job: {job_id}")
+        return Job(job_id, row[0], json.loads(row[1]), row[2])
+
+    def jobs(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT job_id FROM jobs ORDER BY created_at")]
+
+    def acquire(self, job_id: str) -> Optional["Lease"]:
+        """Lease a pending shard, or one whose lease expired; None if there is none right now."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT shard, epoch, claimed, done, sent, failed, uncertain FROM shards"
+                    " WHERE job_id = ? AND (state = ? OR (state = ? AND lease_expires < ?))"
+                    " ORDER BY state = ?, shard LIMIT 1",
+                    (job_id, PENDING, LEASED, now, LEASED),
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE shards SET state = ?, owner = ?, epoch = ?, lease_expires = ?, heartbeat_at = ?"
+                        " WHERE job_id = ? AND shard = ?",
+                        (LEASED, self.host, row[1] + 1, now + self.lease, now, job_id, row[0]),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        shard, epoch, claimed, done, sent, failed, uncertain = row
+        return Lease(self, job_id, shard, epoch + 1, claimed, bytearray(done), sent, failed, uncertain)
+
+    def finished(self, job_id: str) -> bool:
+        with self._lock:
+            (left,) = self._db.execute(
+                "SELECT COUNT(*) FROM shards WHERE job_id = ? AND state != ?", (job_id, DONE)
+            ).fetchone()
+        return left == 0
+
+    def status(self, job_id: str) -> List[ShardStatus]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT job_id, shard, state, owner, epoch, lease_expires, heartbeat_at, sent, failed, uncertain"
+                " FROM shards WHERE job_id = ? ORDER BY shard",
+                (job_id,),
+            ).fetchall()
+        if not rows:
+            raise CoordinatorError(f"no such job: {job_id}")
+        return [ShardStatus(*row) for row in rows]
+
+
+class Lease:
+    """One shard held by this host.
+
+    It is also the ``checkpoint`` the shard's send runs with: :meth:`done`
+    claims inputs ahead of the sender and skips completed (and uncertain)
+    ones, and :meth:`mark` records completions. Indices are positions in
+    the shard's own input.
+    """
+
+    def __init__(
+        self,
+        coordinator: Coordinator,
+        job_id: str,
+        shard: int,
+        epoch: int,
+        claimed: int,
+        done: bytearray,
+        sent: int,
+        failed: int,
+        uncertain: int,
+        claim_ahead: int = 256,
+    ):
+        self.coordinator = coordinator
+        self.job_id = job_id
+        self.shard = shard
+        self.epoch = epoch
+        #: Inputs below this index may have been posted by an earlier holder.
+        self.inherited = claimed
+        self.claimed = claimed
+        self.claim_ahead = claim_ahead
+        self.sent = sent
+        self.failed = failed
+        self.uncertain = uncertain
+        self.resend_uncertain = False
+        #: Set once a fenced write finds the lease taken over; stop sending.
+        self.lost = False
+        self._bits = done
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def _is_set(self, index: int) -> bool:
+        byte = index >> 3
+        return byte < len(self._bits) and bool(self._bits[byte] >> (index & 7) & 1)
+
+    def is_uncertain(self, index: int) -> bool:
+        """Whether an earlier holder may have posted ``index`` without recording it."""
+        return index < self.inherited and not self._is_set(index)
+
+    def done(self, index: int) -> bool:
+        """Whether to skip ``index``; claims the next block of inputs first if needed."""
+        with self._lock:
+            if self._is_set(index):
+                return True
+            if self.is_uncertain(index) and not self.resend_uncertain:
+                return True
+            if index >= self.claimed:
+                self._write_locked(claimed=index + self.claim_ahead)
+            return self.lost
+
+    def mark(self, index: int) -> None:
+        with self._lock:
+            byte = index >> 3
+            if byte >= len(self._bits):
+                self._bits.extend(bytes(byte + 1 - len(self._bits) + 128))
+            self._bits[byte] |= 1 << (index & 7)
+            self.sent += 1
+
+    def renew(self) -> bool:
+        """Extend the lease and record progress; False if it was lost."""
+        with self._lock:
+            self._write_locked()
+            return not self.lost
+
+    def _write_locked(self, claimed: Optional[int] = None, state: str = LEASED) -> None:
+        if self.lost:
+            return
+        now = time.time()
+        claimed = self.claimed if claimed is None else claimed
+        owner = self.coordinator.host if state == LEASED else None
+        expires = now + self.coordinator.lease if state == LEASED else None
+        changed = self.coordinator._transaction(
+            "UPDATE shards SET state = ?, owner = ?, lease_expires = ?, heartbeat_at = ?, claimed = ?, done = ?,"
+            " sent = ?, failed = ?, uncertain = ? WHERE job_id = ? AND shard = ? AND owner = ? AND epoch = ?",
+            (
+                state,
+                owner,
+                expires,
+                now,
+                claimed,
+                bytes(self._bits.rstrip(b"\0")),
+                self.sent,
+                self.failed,
+                self.uncertain,
+                self.job_id,
+                self.shard,
+                self.coordinator.host,
+                self.epoch,
+            ),
+        )
+        if changed:
+            self.claimed = claimed
+        else:
+            self.lost = True
+
+    def start_heartbeat(self) -> None:
+        def beat() -> None:
+            interval = self.coordinator.lease / 3
+            while not self._stop.wait(interval):
+                if not self.renew():
+                    return
+
+        self._heartbeat = threading.Thread(target=beat, name=f"lease-{self.shard}", daemon=True)
+        self._heartbeat.start()
+
+    def _finish(self, state: str) -> None:
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        with self._lock:
+            self._write_locked(state=state)
+
+    def complete(self) -> None:
+        """Mark the shard done."""
+        self._finish(DONE)
+
+    def release(self) -> None:
+        """Give the shard back, keeping its progress, for another host to take over now."""
+        self._finish(PENDING)
+
+
+def run_job(
+    coordinator: Coordinator,
+    job_id: str,
+    sender: BulkSender,
+    inputs: Callable[[], Iterable[Any]],
+    fleet: bool = True,
+    resend_uncertain: bool = False,
+    poll: Optional[float] = None,
+) -> Iterator[SendResult]:
+    """Take part in ``job_id`` until every shard is done, yielding this host's results.
+
+    ``inputs`` opens the job's input afresh: cluster UUIDs (``fleet``) or
+    parameter sets with ``CLUSTER_UUID`` for :meth:`.BulkSender.send`. It is
+    read once per leased shard. Result indices are positions in the whole
+    input. While other hosts hold the remaining shards, this waits ``poll``
+    seconds (default: a third of the lease) between attempts to take over
+    an expired one.
+    """
+    job = coordinator.job(job_id)
+    poll = poll if poll is not None else coordinator.lease / 3
+    while True:
+        lease = coordinator.acquire(job_id)
+        if lease is None:
+            if coordinator.finished(job_id):
+                return
+            time.sleep(poll)
+            continue
+        lease.resend_uncertain = resend_uncertain
+        lease.start_heartbeat()
+        try:
+            yield from _send_shard(job, lease, sender, inputs, fleet)
+        except BaseException:
+            lease.release()
+            raise
+        if lease.lost:
+            continue
+        lease.complete()
+
+
+def _send_shard(
+    job: Job, lease: Lease, sender: BulkSender, inputs: Callable[[], Iterable[Any]], fleet: bool
+) -> Iterator[SendResult]:
+    # The sender numbers the shard's inputs from 0; map those back to input positions.
+    positions: Dict[int, int] = {}
+    uncertain: List[Tuple[int, str]] = []
+
+    def shard_inputs() -> Iterator[Any]:
+        local = 0
+        source = iter_uuids(inputs()) if fleet else inputs()
+        for position, value in enumerate(source):
+            cluster_uuid = value if fleet else str(value.get("CLUSTER_UUID", ""))
+            if shard_of(cluster_uuid, job.shards) != lease.shard:
+                continue
+            if lease.lost:
+                return
+            if lease.is_uncertain(local) and not lease.resend_uncertain:
+                uncertain.append((position, cluster_uuid))
+            positions[local] = position
+            local += 1
+            yield value
+
+    if fleet:
+        results = sender.send_fleet(job.template_id, shard_inputs(), dict(job.params), lease)
+    else:
+        params: Mapping[str, Any] = job.params
+        stream: Iterable[Params] = ({**params, **p} for p in shard_inputs())
+        results = sender.send(job.template_id, stream, lease)
+    for result in results:
+        result.index = positions.pop(result.index)
+        if result.failed:
+            lease.failed += 1
+        yield result
+    for position, cluster_uuid in uncertain:
+        lease.uncertain += 1
+        yield SendResult(position, cluster_uuid, None, 0, 0.0, UNCERTAIN_ERROR, b"", job.template_id)
@@ -0,0 +1,289 @@
+"""Store of payloads that could not be posted, for inspection and re-drive.
+
+:class:`~.sender.BulkSender` given a :class:`DeadLetterStore` records every
+failed post there with the rendered payload, the parameters it was rendered
+from, the last HTTP status and error, and an error class (see
+:func:`error_class`), so a few hundred failures of a fleet-wide send do not
+just scroll past. Entries are queried by template, error class and cluster,
+and :meth:`.BulkSender.redrive` posts them again in bulk, as stored or
+re-rendered with corrected parameters, without re-targeting the fleet::
+
+    python -m managed_notifications dead-letters dead.db --summary
+    python -m managed_notifications redrive dead.db --template osd/aws/AWS_outage --error-class server
+
+Re-driven entries are kept: a successful one is marked resolved, a failed
+one is updated with its new error, and one skipped as a duplicate is left
+pending.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dead_letters (
+    id INTEGER PRIMARY KEY,
+    failed_at REAL NOT NULL,
+    cluster_uuid TEXT NOT NULL,
+    template_id TEXT NOT NULL,
+    params TEXT,
+    body BLOB,
+    status INTEGER,
+    error_class TEXT NOT NULL,
+    error TEXT,
+    attempts INTEGER NOT NULL,
+    redrives INTEGER NOT NULL DEFAULT 0,
+    resolved_at REAL
+);
+CREATE INDEX IF NOT EXISTS dead_letters_template ON dead_letters (template_id, error_class);
+CREATE INDEX IF NOT EXISTS dead_letters_error ON dead_letters (error_class);
+CREATE INDEX IF NOT EXISTS dead_letters_cluster ON dead_letters (cluster_uuid);
+"""
+
+#: Error classes, from the ones re-driving as-is will not fix to the ones it may.
+ERROR_CLASSES = ("invalid", "client", "auth", "throttled", "server", "network")
+
+
+def error_class(status: Optional[int], error: Optional[str]) -> str:
+    """Classify a failed post by its HTTP status, or by its error without one."""
+    if status is None:
+        return "invalid" if error and error.startswith("invalid payload") else "network"
+    if status in (401, 403):
+        return "auth"
+    if status == 429:
+        return "throttled"
+    if status >= 500:
+        return "server"
+    return "client"
+
+
+@dataclass(frozen=True)
+class DeadLetter:
+    id: int
+    failed_at: float
+    cluster_uuid: str
+    template_id: str
+    params: Optional[Mapping[str, Any]]
+    body: Optional[bytes]
+    status: Optional[int]
+    error_class: str
+    error: Optional[str]
+    #: Posting attempts so far, over the original send and every re-drive.
+    attempts: int
+    redrives: int
+    resolved_at: Optional[float]
+
+    def payload(self) -> Optional[Dict[str, Any]]:
+        return None if self.body is None else json.loads(self.body)
+
+    def to_json(self) -> dict:
+        return {
+            "id": self.id,
+            "failed_at": self.failed_at,
+            "cluster_uuid": self.cluster_uuid,
+            "template_id": self.template_id,
+            "params": None if self.params is None else dict(self.params),
+            "status": self.status,
+            "error_class": self.error_class,
+            "error": self.error,
+            "attempts": self.attempts,
+            "redrives": self.redrives,
+            "resolved_at": self.resolved_at,
+        }
+
+
+_COLUMNS = (
+    "id, failed_at, cluster_uuid, template_id, params, body, status, error_class, error, attempts, redrives,"
+    " resolved_at"
+)
+
+
+class DeadLetterStore:
+    """SQLite-backed dead-letter store; safe to share between threads and processes.
+
+    Like the ledger, records are buffered and committed every
+    ``batch_size`` rows, on :meth:`flush` and on :meth:`close`.
+    """
+
+    def __init__(self, path: Union[str, Path], batch_size: int = 500):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self._db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[Any, ...]] = []
+
+    def __enter__(self) -> "DeadLetterStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def record(
+        self,
+        cluster_uuid: str,
+        template_id: str,
+        body: Optional[bytes],
+        params: Optional[Mapping[str, Any]],
+        status: Optional[int],
+        error: Optional[str],
+        attempts: int = 1,
+        failed_at: Optional[float] = None,
+    ) -> None:
+        """Add one failed post."""
+        row = (
+            failed_at if failed_at is not None else time.time(),
+            cluster_uuid,
+            template_id,
+            _dump_params(params),
+            body,
+            status,
+            error_class(status, error),
+            error,
+            attempts,
+        )
+        with self._lock:
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self._pending:
+            return
+        self._db.execute("BEGIN")
+        try:
+            self._db.executemany(
+                "INSERT INTO dead_letters (failed_at, cluster_uuid, template_id, params, body, status, error_class,"
+                " error, attempts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._pending,
+            )
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+        self._pending.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self._db.close()
+
+    def _where(
+        self,
+        template_id: Optional[str],
+        error_class: Optional[str],
+        cluster_uuid: Optional[str],
+        ids: Optional[Iterable[int]],
+        resolved: bool,
+    ) -> Tuple[str, List[Any]]:
+        clauses, args = [], []
+        for column, value in (
+            ("template_id", template_id),
+            ("error_class", error_class),
+            ("cluster_uuid", cluster_uuid),
+        ):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                args.append(value)
+        if ids is not None:
+            ids = list(ids)
+            clauses.append(f"id IN ({', '.join('?' * len(ids))})")
+            args.extend(ids)
+        if not resolved:
+            clauses.append("resolved_at IS NULL")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+    def entries(
+        self,
+        template_id: Optional[str] = None,
+        error_class: Optional[str] = None,
+        cluster_uuid: Optional[str] = None,
+        ids: Optional[Iterable[int]] = None,
+        resolved: bool = False,
+        limit: Optional[int] = None,
+    ) -> List[DeadLetter]:
+        """Entries matching every given filter, oldest first; with ``resolved``, resolved ones too."""
+        self.flush()
+        where, args = self._where(template_id, error_class, cluster_uuid, ids, resolved)
+        sql = f"SELECT {_COLUMNS} FROM dead_letters{where} ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [
+            DeadLetter(id, at, uuid, tid, None if params is None else json.loads(params), body, *rest)
+            for id, at, uuid, tid, params, body, *rest in rows
+        ]
+
+    def summary(self, resolved: bool = False) -> List[Tuple[str, str, int]]:
+        """``(template_id, error_class, count)`` of unresolved (or all) entries, largest groups first."""
+        self.flush()
+        where, args = self._where(None, None, None, None, resolved)
+        sql = (
+            f"SELECT template_id, error_class, count(*) AS n FROM dead_letters{where}"
+            " GROUP BY template_id, error_class ORDER BY n DESC, template_id, error_class"
+        )
+        with self._lock:
+            return [tuple(row) for row in self._db.execute(sql, args)]
+
+    def redriven(
+        self,
+        entry_id: int,
+        status: Optional[int],
+        error: Optional[str],
+        attempts: int,
+        cluster_uuid: Optional[str] = None,
+        body: Optional[bytes] = None,
+        params: Optional[Mapping[str, Any]] = None,
+    ) -> None:
+        """Record the outcome of re-driving an entry; ``error`` ``None`` resolves it.
+
+        ``cluster_uuid``, ``body`` and ``params``, when given, replace the
+        stored ones (the entry was re-rendered).
+        """
+        now = time.time()
+        sql = "UPDATE dead_letters SET status = ?, error = ?, attempts = attempts + ?, redrives = redrives + 1"
+        args: List[Any] = [status, error, attempts]
+        if error is None:
+            sql += ", resolved_at = ?"
+            args.append(now)
+        else:
+            sql += ", failed_at = ?, error_class = ?"
+            args.extend([now, error_class(status, error)])
+        if body is not None:
+            sql += ", cluster_uuid = ?, body = ?, params = ?"
+            args.extend([cluster_uuid, body, _dump_params(params)])
+        self.flush()
+        with self._lock:
+            self._db.execute(sql + " WHERE id = ?", [*args, entry_id])
+
+    def discard(
+        self,
+        template_id: Optional[str] = None,
+        error_class: Optional[str] = None,
+        ids: Optional[Iterable[int]] = None,
+        unresolved: bool = False,
+    ) -> int:
+        """Delete matching resolved entries, and with ``unresolved`` open ones too; returns how many."""
+        self.flush()
+        where, args = self._where(template_id, error_class, None, ids, True)
+        if not unresolved:
+            where += (" AND" if where else " WHERE") + " resolved_at IS NOT NULL"
+        with self._lock:
+            return self._db.execute(f"DELETE FROM dead_letters{where}", args).rowcount
+
+
+def _dump_params(params: Optional[Mapping[str, Any]]) -> Optional[str]:
+    return None if params is None else json.dumps({k: str(v) for k, v in params.items()}, sort_keys=True)
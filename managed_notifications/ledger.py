@@ -0,0 +1,235 @@
+"""Append-only record of which template was sent to which cluster.
+
+The ledger is a SQLite file written by :class:`~.sender.BulkSender`. Every
+posted payload adds one row with the cluster, template, event stream id,
+parameters, HTTP status and time; rows are never updated. Indexes on
+cluster, (template, parameters), event stream id and time make questions
+like "which clusters already got ``osd/security_update_available`` for this
+``ADVISORY_URL``" a single indexed query, and let a resend skip clusters
+that already have the notice.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List, Mapping, Optional, Set, Tuple, Union
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sends (
+    id INTEGER PRIMARY KEY,
+    sent_at REAL NOT NULL,
+    cluster_uuid TEXT NOT NULL,
+    template_id TEXT NOT NULL,
+    event_stream_id TEXT,
+    params_key BLOB NOT NULL,
+    params TEXT NOT NULL,
+    status INTEGER,
+    ok INTEGER NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS sends_cluster ON sends (cluster_uuid, template_id);
+CREATE INDEX IF NOT EXISTS sends_template ON sends (template_id, params_key, ok);
+CREATE INDEX IF NOT EXISTS sends_event_stream ON sends (event_stream_id) WHERE event_stream_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS sends_time ON sends (sent_at);
+"""
+
+#: Parameters that identify the cluster or alert rather than the notice itself.
+PER_SEND_PARAMS = frozenset({"CLUSTER_UUID", "EVENT_STREAM_ID"})
+
+
+def params_key(params: Optional[Mapping[str, Any]]) -> bytes:
+    """Digest of a parameter set, ignoring :data:`PER_SEND_PARAMS`."""
+    shared = {k: str(v) for k, v in (params or {}).items() if k not in PER_SEND_PARAMS}
+    data = json.dumps(shared, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+@dataclass(frozen=True)
+class LedgerEntry:
+    sent_at: float
+    cluster_uuid: str
+    template_id: str
+    event_stream_id: Optional[str]
+    params: Mapping[str, Any]
+    status: Optional[int]
+    ok: bool
+    error: Optional[str]
+
+    def to_json(self) -> dict:
+        return {
+            "sent_at": self.sent_at,
+            "cluster_uuid": self.cluster_uuid,
+            "template_id": self.template_id,
+            "event_stream_id": self.event_stream_id,
+            "params": dict(self.params),
+            "status": self.status,
+            "ok": self.ok,
+            "error": self.error,
+        }
+
+
+class Ledger:
+    """SQLite-backed send ledger; safe to share between threads and processes.
+
+    Writes are buffered and committed every ``batch_size`` rows, on
+    :meth:`flush` and on :meth:`close`.
+    """
+
+    def __init__(self, path: Union[str, Path], batch_size: int = 500):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self._db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[Any, ...]] = []
+
+    def __enter__(self) -> "Ledger":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def record(
+        self,
+        cluster_uuid: str,
+        template_id: str,
+        params: Optional[Mapping[str, Any]],
+        status: Optional[int],
+        error: Optional[str] = None,
+        sent_at: Optional[float] = None,
+        event_stream_id: Optional[str] = None,
+    ) -> None:
+        """Append one send.
+
+        ``event_stream_id`` is the payload's; it defaults to the
+        ``EVENT_STREAM_ID`` parameter.
+        """
+        params = params or {}
+        if event_stream_id is None:
+            event_stream_id = params.get("EVENT_STREAM_ID")
+        row = (
+            sent_at if sent_at is not None else time.time(),
+            cluster_uuid,
+            template_id,
+            None if event_stream_id is None else str(event_stream_id),
+            params_key(params),
+            json.dumps({k: str(v) for k, v in params.items()}, sort_keys=True),
+            status,
+            int(status is not None and 200 <= status < 300),
+            error,
+        )
+        with self._lock:
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self._pending:
+            return
+        self._db.execute("BEGIN")
+        try:
+            self._db.executemany(
+                "INSERT INTO sends (sent_at, cluster_uuid, template_id, event_stream_id, params_key, params,"
+                " status, ok, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._pending,
+            )
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+        self._pending.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self._db.close()
+
+    def clusters(
+        self,
+        template_id: str,
+        params: Optional[Mapping[str, Any]] = None,
+        since: Optional[float] = None,
+    ) -> Set[str]:
+        """Clusters that successfully received ``template_id``.
+
+        With ``params``, only sends with exactly those parameters (apart from
+        :data:`PER_SEND_PARAMS`) count; ``since`` is a Unix timestamp.
+        """
+        self.flush()
+        sql = "SELECT DISTINCT cluster_uuid FROM sends WHERE template_id = ? AND ok = 1"
+        args: List[Any] = [template_id]
+        if params is not None:
+            sql += " AND params_key = ?"
+            args.append(params_key(params))
+        if since is not None:
+            sql += " AND sent_at >= ?"
+            args.append(since)
+        with self._lock:
+            return {row[0] for row in self._db.execute(sql, args)}
+
+    def unsent(
+        self,
+        template_id: str,
+        cluster_uuids: Iterable[str],
+        params: Optional[Mapping[str, Any]] = None,
+    ) -> Iterator[str]:
+        """Yield the UUIDs from ``cluster_uuids`` that have not received the notice yet."""
+        done = self.clusters(template_id, params)
+        return (u for u in cluster_uuids if u not in done)
+
+    def unsent_params(
+        self, template_id: str, params_stream: Iterable[Mapping[str, Any]]
+    ) -> Iterator[Mapping[str, Any]]:
+        """Yield the parameter sets whose ``CLUSTER_UUID`` has not received the notice with those parameters."""
+        self.flush()
+        sql = "SELECT DISTINCT cluster_uuid, params_key FROM sends WHERE template_id = ? AND ok = 1"
+        with self._lock:
+            done = set(self._db.execute(sql, (template_id,)))
+        return (p for p in params_stream if (str(p.get("CLUSTER_UUID", "")), params_key(p)) not in done)
+
+    def history(
+        self,
+        cluster_uuid: Optional[str] = None,
+        template_id: Optional[str] = None,
+        event_stream_id: Optional[str] = None,
+        since: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> List[LedgerEntry]:
+        """Sends matching every given filter, newest first."""
+        self.flush()
+        clauses, args = [], []
+        for column, value in (
+            ("cluster_uuid", cluster_uuid),
+            ("template_id", template_id),
+            ("event_stream_id", event_stream_id),
+        ):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                args.append(value)
+        if since is not None:
+            clauses.append("sent_at >= ?")
+            args.append(since)
+        sql = "SELECT sent_at, cluster_uuid, template_id, event_stream_id, params, status, ok, error FROM sends"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY sent_at DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [
+            LedgerEntry(sent_at, uuid, tid, esid, json.loads(params), status, bool(ok), error)
+            for sent_at, uuid, tid, esid, params, status, ok, error in rows
+        ]
@@ -0,0 +1,88 @@
+"""Inverted index between placeholders and the templates that use them.
+
+Built from the catalog index, so no template files are read. It answers
+"what does this template need", "which templates use this variable" and
+"which templates can I fully render with these parameters".
+
+Templates are not consistent in how they name some variables
+(``${ALERT_NAME}`` vs ``${ALERTNAME}``, ``${NAMESPACE}`` vs
+``${NAMESPACE_OR_CLUSTER_SCOPE}``); :data:`~.render.ALIASES` records which
+parameter may stand in for which. Rendering applies it, so a placeholder
+counts as supplied when one of its aliases is.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, Optional
+
+from .catalog import Catalog, default_catalog
+from .render import ALIASES, MissingParameters
+
+
+class PlaceholderIndex:
+    """Placeholder -> templates and template -> placeholders lookups."""
+
+    def __init__(self, catalog: Optional[Catalog] = None):
+        catalog = catalog if catalog is not None else default_catalog()
+        self._required: Dict[str, FrozenSet[str]] = {}
+        users: Dict[str, set] = defaultdict(set)
+        for entry in catalog:
+            self._required[entry.id] = entry.placeholders
+            for name in entry.placeholders:
+                users[name].add(entry.id)
+        self._users: Dict[str, FrozenSet[str]] = {name: frozenset(ids) for name, ids in users.items()}
+        self._catalog = catalog
+
+    def placeholders(self) -> List[str]:
+        """Every placeholder used by at least one template."""
+        return sorted(self._users)
+
+    def templates_using(self, name: str) -> FrozenSet[str]:
+        """Templates with a placeholder ``name`` fills, itself or through an alias."""
+        names = [name, *(target for target, sources in ALIASES.items() if name in sources)]
+        return frozenset().union(*(self._users.get(n, ()) for n in names))
+
+    def required(self, template_id: str) -> FrozenSet[str]:
+        try:
+            return self._required[template_id]
+        except KeyError:
+            return self._required[self._catalog.entry(template_id).id]
+
+    def missing(self, template_id: str, params: Mapping[str, Any]) -> FrozenSet[str]:
+        """Placeholders of ``template_id`` that ``params`` (with aliases) does not supply."""
+        required = self.required(template_id)
+        return frozenset(name for name in required if name not in params and not _aliased(name, params))
+
+    def check(self, template_id: str, params: Mapping[str, Any]) -> None:
+        """Raise :class:`~.render.MissingParameters` if ``params`` cannot render the template."""
+        missing = self.missing(template_id, params)
+        if missing:
+            raise MissingParameters(self._catalog.entry(template_id).id, missing)
+
+    def renderable(self, params: Iterable[str]) -> List[str]:
+        """Templates whose every placeholder is among ``params`` (or their aliases).
+
+        Counts, per template, how many of the given names it uses, touching
+        only the templates that use at least one of them.
+        """
+        names = set(params)
+        names.update(name for name, sources in ALIASES.items() if names.intersection(sources))
+        hits: Dict[str, int] = defaultdict(int)
+        for name in names:
+            for template_id in self._users.get(name, ()):
+                hits[template_id] += 1
+        ready = [t for t, count in hits.items() if count == len(self._required[t])]
+        ready.extend(t for t, required in self._required.items() if not required)
+        return sorted(ready)
+
+
+@lru_cache(maxsize=None)
+def default_placeholder_index() -> PlaceholderIndex:
+    """Return the process-wide index over :func:`~.catalog.default_catalog`."""
+    return PlaceholderIndex()
+
+
+def _aliased(name: str, params: Mapping[str, Any]) -> bool:
+    return any(source in params for source in ALIASES.get(name, ()))
@@ -0,0 +1,215 @@
+"""Adaptive rate limiting for service log posts.
+
+:class:`AdaptiveLimiter` combines two controls:
+
+* a token bucket capping the request rate at ``rate`` per second (with
+  bursts of up to ``burst``), when a rate is given;
+* an AIMD window on the number of requests in flight: every successful
+  response grows the window by ``increase / window`` (about ``increase``
+  per window's worth of responses), and a throttled response (429 or 503),
+  or a latency average above ``latency_target``, shrinks it by the factor
+  ``decrease``, at most once per round trip.
+
+A ``Retry-After`` on the throttled response that shrinks the window also
+pauses every new request until it has passed. :meth:`AdaptiveLimiter.stats`
+returns the current window, achieved messages per second and latency, for
+progress reporting.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Deque, Optional
+
+#: Statuses that mean the API wants us to slow down.
+THROTTLE_STATUSES = frozenset({429, 503})
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Seconds to wait from a ``Retry-After`` header (delay or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when - (time.time() if now is None else now))
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``rate`` tokens per second."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self) -> float:
+        """Take a token if one is available; otherwise return the wait for one."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self) -> None:
+        """Take one token, sleeping until one is available."""
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def try_acquire(self) -> bool:
+        """Take one token if available, without waiting."""
+        return not self._take()
+
+
+@dataclass
+class LimiterStats:
+    """A snapshot of an :class:`AdaptiveLimiter`."""
+
+    completed: int
+    throttled: int
+    errors: int
+    in_flight: int
+    window: float
+    #: Completed requests per second over the last ``stats_window`` seconds.
+    rate: float
+    #: Moving average of response latency, in seconds.
+    latency: float
+    #: Seconds until a ``Retry-After`` pause ends.
+    paused: float
+
+    def to_json(self) -> dict:
+        return {
+            "completed": self.completed,
+            "throttled": self.throttled,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "window": round(self.window, 2),
+            "rate": round(self.rate, 1),
+            "latency": round(self.latency, 4),
+            "paused": round(self.paused, 2),
+        }
+
+
+class AdaptiveLimiter:
+    """Token bucket plus AIMD concurrency window; see the module docstring.
+
+    Callers bracket each request with :meth:`acquire` and :meth:`release`.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        rate: Optional[float] = None,
+        burst: Optional[float] = None,
+        min_concurrency: int = 1,
+        initial: Optional[float] = None,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_target: Optional[float] = None,
+        stats_window: float = 10.0,
+    ):
+        if not 1 <= min_concurrency <= max_concurrency:
+            raise ValueError("need 1 <= min_concurrency <= max_concurrency")
+        if not 0 < decrease < 1:
+            raise ValueError("decrease must be between 0 and 1")
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.stats_window = stats_window
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.window = float(initial if initial is not None else max_concurrency)
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._latency = 0.0
+        self._completed = 0
+        self._throttled = 0
+        self._errors = 0
+        self._recent: Deque[float] = deque()
+        self._started = time.monotonic()
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        """Wait for a slot in the window, any ``Retry-After`` pause and a token."""
+        with self._cond:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    self._cond.wait(pause)
+                elif self._in_flight >= int(self.window):
+                    self._cond.wait()
+                else:
+                    break
+            self._in_flight += 1
+        if self.bucket is not None:
+            self.bucket.acquire()
+
+    def release(self, status: Optional[int], latency: float, retry_after: Optional[float] = None) -> None:
+        """Record the outcome of a request started with :meth:`acquire`.
+
+        ``status`` is None when the request failed without a response.
+        """
+        now = time.monotonic()
+        with self._cond:
+            self._in_flight -= 1
+            self._latency = latency if not self._completed else 0.8 * self._latency + 0.2 * latency
+            self._completed += 1
+            self._recent.append(now)
+            while self._recent[0] < now - self.stats_window:
+                self._recent.popleft()
+            throttled = status in THROTTLE_STATUSES
+            if throttled:
+                self._throttled += 1
+            elif status is None or status >= 400:
+                self._errors += 1
+            slow = self.latency_target is not None and self._latency > self.latency_target
+            if throttled or slow:
+                # One decrease (and pause) per round trip: responses to
+                # requests sent before the last decrease reflect the old window.
+                if now - self._last_decrease >= max(latency, 0.01):
+                    self.window = max(float(self.min_concurrency), self.window * self.decrease)
+                    self._last_decrease = now
+                    if throttled and retry_after:
+                        self._paused_until = max(self._paused_until, now + retry_after)
+            elif status is not None and status < 400:
+                self.window = min(float(self.max_concurrency), self.window + self.increase / self.window)
+            self._cond.notify_all()
+
+    def stats(self) -> LimiterStats:
+        now = time.monotonic()
+        with self._cond:
+            recent = self._recent
+            while recent and recent[0] < now - self.stats_window:
+                recent.popleft()
+            return LimiterStats(
+                self._completed,
+                self._throttled,
+                self._errors,
+                self._in_flight,
+                self.window,
+                len(recent) / max(1e-3, min(self.stats_window, now - self._started)),
+                self._latency,
+                max(0.0, self._paused_until - now),
+            )
@@ -0,0 +1,248 @@
+"""Placeholder rendering for templates.
+
+Each template is compiled once into, per string field, a tuple of literal
+segments and the placeholder names between them. Rendering a field then fills
+the placeholder slots and joins the segments in a single pass, instead of
+running one search-and-replace over the text per parameter.
+
+For fleet-wide notices that differ per cluster only in ``${CLUSTER_UUID}``,
+:class:`FleetTemplate` goes one step further: the payload is serialized to JSON
+once with a marker in place of the UUID, and each cluster's payload is produced
+by splicing the UUID bytes between the pre-serialized pieces.
+
+Templates are not consistent in how they name some variables
+(``${ALERT_NAME}`` vs ``${ALERTNAME}``, ``${NAMESPACE}`` vs
+``${NAMESPACE_OR_CLUSTER_SCOPE}``); a placeholder missing from the
+parameters is filled from an alias in :data:`ALIASES` if one is given.
+"""
+
+from __future__ import annotations
+
+import json
+import uuid
+
+from functools import lru_cache
+from typing import IO, Any, Dict, FrozenSet, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+
+from .catalog import PLACEHOLDER_RE, Catalog, default_catalog
+
+Params = Mapping[str, Any]
+
+#: Placeholder -> parameters that can supply it when it is not given directly.
+ALIASES: Dict[str, Tuple[str, ...]] = {
+    "ALERT_NAME": ("ALERTNAME",),
+    "ALERTNAME": ("ALERT_NAME",),
+    "NAMESPACE_OR_CLUSTER_SCOPE": ("NAMESPACE",),
+}
+
+
+def with_aliases(params: Params) -> Dict[str, Any]:
+    """Return ``params`` plus any placeholder an alias in :data:`ALIASES` can fill."""
+    result = dict(params)
+    for name, sources in ALIASES.items():
+        if name not in result:
+            for source in sources:
+                if source in params:
+                    result[name] = params[source]
+                    break
+    return result
+
+
+class MissingParameters(ValueError):
+    """Raised when a template is rendered without all of its placeholders."""
+
+    def __init__(self, template_id: str, missing: Iterable[str]):
+        self.template_id = template_id
+        self.missing = sorted(missing)
+        super().__init__(f"{template_id}: missing parameters: {', '.join(self.missing)}")
+
+
+class CompiledString:
+    """A string split into literal segments around ``${NAME}`` placeholders.
+
+    ``literals`` always has one more element than ``names``; the rendered text
+    is ``literals[0] + params[names[0]] + literals[1] + ...``.
+    """
+
+    __slots__ = ("literals", "names")
+
+    def __init__(self, text: str):
+        literals: List[str] = []
+        names: List[str] = []
+        pos = 0
+        for match in PLACEHOLDER_RE.finditer(text):
+            literals.append(text[pos : match.start()])
+            names.append(match.group(1))
+            pos = match.end()
+        literals.append(text[pos:])
+        self.literals: Tuple[str, ...] = tuple(literals)
+        self.names: Tuple[str, ...] = tuple(names)
+
+    def render(self, params: Params) -> str:
+        names = self.names
+        if not names:
+            return self.literals[0]
+        out = [""] * (2 * len(names) + 1)
+        out[0::2] = self.literals
+        out[1::2] = [str(params[name]) for name in names]
+        return "".join(out)
+
+
+class CompiledTemplate:
+    """A template with every placeholder-bearing string field precompiled."""
+
+    __slots__ = ("id", "static", "fields", "placeholders")
+
+    def __init__(self, template_id: str, template: Mapping[str, Any]):
+        self.id = template_id
+        #: Copy of the template; rendered fields overwrite their keys in place
+        #: so payloads keep the template's key order.
+        self.static: Dict[str, Any] = dict(template)
+        #: Fields that contain at least one placeholder.
+        self.fields: List[Tuple[str, CompiledString]] = []
+        names = set()
+        for key, value in template.items():
+            if isinstance(value, str) and PLACEHOLDER_RE.search(value):
+                compiled = CompiledString(value)
+                self.fields.append((key, compiled))
+                names.update(compiled.names)
+        self.placeholders: FrozenSet[str] = frozenset(names)
+
+    def render(self, params: Params) -> Dict[str, Any]:
+        """Return the payload for ``params``; extra parameters are ignored.
+
+        Placeholders missing from ``params`` are filled from their aliases.
+        """
+        try:
+            return self._render(params)
+        except KeyError:
+            pass
+        params = with_aliases(params)
+        try:
+            return self._render(params)
+        except KeyError:
+            raise MissingParameters(self.id, self.placeholders.difference(params)) from None
+
+    def _render(self, params: Params) -> Dict[str, Any]:
+        payload = dict(self.static)
+        for key, compiled in self.fields:
+            payload[key] = compiled.render(params)
+        return payload
+
+
+def _encode_json_string(value: str) -> bytes:
+    """Return ``value`` as it appears between the quotes of a JSON string."""
+    if value.isascii() and value.isprintable() and '"' not in value and "\\" not in value:
+        return value.encode("ascii")
+    return json.dumps(value)[1:-1].encode("ascii")
+
+
+class FleetTemplate:
+    """A fully rendered payload, pre-serialized, with one per-cluster slot.
+
+    All placeholders except ``key`` are filled from ``params`` up front; the
+    payload is serialized to compact JSON and split at every occurrence of
+    ``key`` into byte segments.
+    """
+
+    __slots__ = ("id", "key", "segments")
+
+    def __init__(self, compiled: CompiledTemplate, params: Optional[Params] = None, key: str = "CLUSTER_UUID"):
+        marker = f"\x00{key}-{uuid.uuid4().hex}\x00"
+        fixed = dict(params or {})
+        fixed[key] = marker
+        payload = compiled.render(fixed)
+        data = json.dumps(payload, separators=(",", ":")).encode("ascii")
+        self.id = compiled.id
+        self.key = key
+        self.segments: Tuple[bytes, ...] = tuple(data.split(_encode_json_string(marker)))
+
+    def render(self, value: str) -> bytes:
+        """Return the JSON payload for one cluster."""
+        return _encode_json_string(value).join(self.segments)
+
+    def render_all(self, values: "UuidSource") -> Iterator[bytes]:
+        """Yield one JSON payload per value in ``values``.
+
+        ``values`` may be any iterable of strings (a list, an array column) or
+        an open text or binary file with one value per line; blank lines are
+        skipped.
+        """
+        segments = self.segments
+        join = bytes.join
+        encode = _encode_json_string
+        for value in iter_uuids(values):
+            yield join(encode(value), segments)
+
+
+UuidSource = Union[Iterable[str], Iterable[bytes], IO[str], IO[bytes]]
+
+
+def iter_uuids(values: UuidSource) -> Iterator[str]:
+    """Yield cleaned-up cluster UUIDs from a column or a line-oriented file."""
+    for value in values:
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        else:
+            value = str(value)
+        value = value.strip()
+        if value:
+            yield value
+
+
+class Renderer:
+    """Renders catalog templates, compiling each one on first use."""
+
+    def __init__(self, catalog: Optional[Catalog] = None):
+        self.catalog = catalog if catalog is not None else default_catalog()
+        self._compiled: Dict[str, CompiledTemplate] = {}
+
+    def compile(self, template_id: str) -> CompiledTemplate:
+        compiled = self._compiled.get(template_id)
+        if compiled is None:
+            entry = self.catalog.entry(template_id)
+            compiled = self._compiled.get(entry.id)
+            if compiled is None:
+                compiled = CompiledTemplate(entry.id, self.catalog.template(entry.id))
+                self._compiled[entry.id] = compiled
+            self._compiled[template_id] = compiled
+        return compiled
+
+    def render(self, template_id: str, params: Params) -> Dict[str, Any]:
+        return self.compile(template_id).render(params)
+
+    def render_many(self, template_id: str, params_list: Iterable[Params]) -> List[Dict[str, Any]]:
+        render = self.compile(template_id).render
+        return [render(params) for params in params_list]
+
+    def fleet(self, template_id: str, params: Optional[Params] = None, key: str = "CLUSTER_UUID") -> FleetTemplate:
+        return FleetTemplate(self.compile(template_id), params, key)
+
+    def render_fleet(
+        self, template_id: str, cluster_uuids: UuidSource, params: Optional[Params] = None
+    ) -> Iterator[bytes]:
+        return self.fleet(template_id, params).render_all(cluster_uuids)
+
+
+@lru_cache(maxsize=None)
+def default_renderer() -> Renderer:
+    """Return the process-wide renderer over :func:`default_catalog`."""
+    return Renderer()
+
+
+def render(template_id: str, params: Params) -> Dict[str, Any]:
+    """Render ``template_id`` from the default catalog with ``params``."""
+    return default_renderer().render(template_id, params)
+
+
+def render_many(template_id: str, params_list: Iterable[Params]) -> List[Dict[str, Any]]:
+    """Render ``template_id`` once per parameter set in ``params_list``."""
+    return default_renderer().render_many(template_id, params_list)
+
+
+def render_fleet(template_id: str, cluster_uuids: UuidSource, params: Optional[Params] = None) -> Iterator[bytes]:
+    """Yield the serialized payload of ``template_id`` for each cluster UUID.
+
+    ``params`` supplies every other placeholder and is the same for all clusters.
+    """
+    return default_renderer().render_fleet(template_id, cluster_uuids, params)
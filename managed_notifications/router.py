@@ -0,0 +1,254 @@
+"""Route Alertmanager alerts to templates.
+
+:data:`ROUTES` lists which alert goes to which template, optionally
+narrowed by severity, by its namespace or by whether that is a platform or
+a customer namespace, and by cloud provider. The router compiles it into a
+dict keyed on all four, so routing an alert is a fixed number of dict
+lookups (most specific key first) regardless of how many routes or
+templates exist.
+
+Template parameters are filled from the alert: every label is offered under
+its upper-cased name (``namespace`` -> ``NAMESPACE``), plus ``ALERT_NAME``,
+``CLUSTER_UUID``, ``EVENT_STREAM_ID`` (the alert fingerprint) and
+``BRIEF_DESCRIPTION`` (the summary annotation). ``PERCENT``, when no label
+sets it, is the used share of a volume worked out from the "N% free" that
+volume alerts such as ``KubePersistentVolumeFillingUp`` put in their
+description. Placeholder aliases from :mod:`.render` apply.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from itertools import product
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple
+
+from .catalog import Catalog, default_catalog
+from .render import with_aliases
+
+#: Labels that may carry the cluster's external id, in order of preference.
+CLUSTER_LABELS = ("_id", "cluster_id", "cluster_uuid", "external_id")
+
+#: Namespaces that belong to the platform rather than the customer.
+PLATFORM_NAMESPACES = frozenset({"default", "openshift", "kube-system", "kube-public", "kube-node-lease"})
+
+#: Namespace prefix of the platform's namespaces; customers cannot create such namespaces.
+PLATFORM_PREFIX = "openshift-"
+
+#: The free space in a volume alert's message, e.g. "... is only 2.63% free.".
+_PERCENT_FREE_RE = re.compile(r"(\d+(?:\.\d+)?)\s*% free")
+
+
+@dataclass(frozen=True)
+class Route:
+    """Send alerts named ``alertname`` to ``template``.
+
+    ``severity`` (``critical``, ``warning``, ``info``), ``scope``
+    (``platform`` or ``user``), ``namespace`` (one namespace; more specific
+    than ``scope``) and ``provider`` (``aws``, ``gcp``) narrow the match
+    when set.
+    """
+
+    alertname: str
+    template: str
+    severity: Optional[str] = None
+    scope: Optional[str] = None
+    provider: Optional[str] = None
+    namespace: Optional[str] = None
+
+
+ROUTES: Tuple[Route, ...] = (
+    # The platform variants are about Elasticsearch storage of cluster logging.
+    Route(
+        "KubePersistentVolumeFillingUp",
+        "osd/KubePersistentVolumeFillingUpError",
+        "critical",
+        namespace="openshift-logging",
+    ),
+    Route(
+        "KubePersistentVolumeFillingUp",
+        "osd/KubePersistentVolumeFillingUpWarn",
+        "warning",
+        namespace="openshift-logging",
+    ),
+    Route("KubePersistentVolumeFillingUp", "osd/KubePersistentVolumeFillingUpError-user", scope="user"),
+    Route("ElasticsearchClusterNotHealthy", "osd/ElasticsearchClusterNotHealthy_Error", "critical"),
+    Route("ElasticsearchClusterNotHealthy", "osd/ElasticsearchClusterNotHealthy_Warning", "warning"),
+    Route("StuckNewBuilds3MinSRE", "osd/StuckNewBuilds3MinSRE"),
+    Route("AlertmanagerSilencesActiveSRE", "osd/AlertmanagerSilencesActiveSRE"),
+    Route("AlertmanagerSilencesActiveSRE", "osd/aws/AlertmanagerSilencesActiveSRE", provider="aws"),
+    Route("ClusterOperatorIngressDegradedServiceMesh", "osd/ClusterOperatorIngressDegradedServiceMesh"),
+)
+
+_SEVERITIES = {
+    "critical": "critical",
+    "error": "critical",
+    "warning": "warning",
+    "warn": "warning",
+    "info": "info",
+    "none": "info",
+}
+
+_Key = Tuple[str, Optional[str], Optional[str], Optional[str]]
+
+#: Wildcard patterns (severity, where, provider) tried from most to least specific; ``where`` is
+#: 2 for the namespace, 1 for its scope and 0 for neither.
+_PATTERNS = sorted(
+    product((True, False), (2, 1, 0), (True, False)),
+    key=lambda p: (-(p[0] + bool(p[1]) + p[2]), not p[0], -p[1], not p[2]),
+)
+
+
+def _namespace_key(namespace: str) -> str:
+    # Scopes are plain words, so this cannot collide with one.
+    return f"namespace:{namespace}"
+
+
+@dataclass
+class Routed:
+    """An alert matched to a template, with the parameters gathered for it."""
+
+    template: str
+    params: Dict[str, Any]
+    missing: FrozenSet[str] = field(default_factory=frozenset)
+    alert: Mapping[str, Any] = field(default_factory=dict, repr=False)
+
+    @property
+    def ready(self) -> bool:
+        """Whether every placeholder of the template could be filled."""
+        return not self.missing
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"template": self.template, "params": self.params, "missing": sorted(self.missing)}
+
+
+def scope_of(namespace: Optional[str]) -> Optional[str]:
+    if not namespace:
+        return None
+    if namespace in PLATFORM_NAMESPACES or namespace.startswith(PLATFORM_PREFIX):
+        return "platform"
+    return "user"
+
+
+def percent_used(annotations: Mapping[str, Any]) -> Optional[str]:
+    """The used share of a volume, from the "N% free" in an alert's description or message."""
+    for name in ("description", "message", "summary"):
+        m = _PERCENT_FREE_RE.search(str(annotations.get(name) or ""))
+        if m:
+            return f"{round(100 - float(m.group(1)), 2):g}"
+    return None
+
+
+class AlertRouter:
+    """Matches alerts against a compiled route table.
+
+    ``fallback`` names a template for alerts no route matches (for example
+    ``osd/unknown_failure``); ``resolved`` one for alerts whose status is
+    ``resolved`` (for example ``osd/incident_resolved``). Both default to
+    ignoring such alerts.
+    """
+
+    def __init__(
+        self,
+        routes: Iterable[Route] = ROUTES,
+        catalog: Optional[Catalog] = None,
+        fallback: Optional[str] = None,
+        resolved: Optional[str] = None,
+    ):
+        self.catalog = catalog if catalog is not None else default_catalog()
+        self._table: Dict[_Key, str] = {}
+        for route in routes:
+            template = self.catalog.entry(route.template).id
+            severity = _SEVERITIES.get(route.severity, route.severity) if route.severity else None
+            where = _namespace_key(route.namespace) if route.namespace else route.scope
+            self._table[(route.alertname, severity, where, route.provider)] = template
+        self.fallback = self.catalog.entry(fallback).id if fallback else None
+        self.resolved = self.catalog.entry(resolved).id if resolved else None
+
+    def match(
+        self,
+        alertname: str,
+        severity: Optional[str] = None,
+        namespace: Optional[str] = None,
+        provider: Optional[str] = None,
+    ) -> Optional[str]:
+        """Return the template for an alert, or ``None`` if no route matches."""
+        severity = _SEVERITIES.get(severity.lower(), severity) if severity else None
+        wheres = (None, scope_of(namespace), _namespace_key(namespace) if namespace else None)
+        table = self._table
+        for use_severity, where, use_provider in _PATTERNS:
+            if where and wheres[where] is None:
+                continue
+            key = (
+                alertname,
+                severity if use_severity else None,
+                wheres[where],
+                provider if use_provider else None,
+            )
+            template = table.get(key)
+            if template is not None:
+                return template
+        return None
+
+    def params_for(self, alert: Mapping[str, Any], cluster_uuid: Optional[str] = None) -> Dict[str, Any]:
+        labels = alert.get("labels") or {}
+        annotations = alert.get("annotations") or {}
+        params: Dict[str, Any] = {name.upper(): value for name, value in labels.items() if not name.startswith("_")}
+        params["ALERT_NAME"] = labels.get("alertname", "")
+        if cluster_uuid is None:
+            cluster_uuid = next((labels[name] for name in CLUSTER_LABELS if labels.get(name)), None)
+        if cluster_uuid:
+            params["CLUSTER_UUID"] = cluster_uuid
+        if alert.get("fingerprint"):
+            params["EVENT_STREAM_ID"] = alert["fingerprint"]
+        brief = annotations.get("summary") or annotations.get("message") or annotations.get("description")
+        if brief:
+            params["BRIEF_DESCRIPTION"] = brief
+        if "PERCENT" not in params:
+            percent = percent_used(annotations)
+            if percent is not None:
+                params["PERCENT"] = percent
+        return with_aliases(params)
+
+    def route_alert(
+        self,
+        alert: Mapping[str, Any],
+        provider: Optional[str] = None,
+        cluster_uuid: Optional[str] = None,
+    ) -> Optional[Routed]:
+        """Route one alert from a webhook's ``alerts`` list."""
+        labels = alert.get("labels") or {}
+        if alert.get("status") == "resolved":
+            template = self.resolved
+        else:
+            template = self.match(
+                labels.get("alertname", ""),
+                labels.get("severity"),
+                labels.get("namespace"),
+                provider or labels.get("provider"),
+            ) or self.fallback
+        if template is None:
+            return None
+        params = self.params_for(alert, cluster_uuid)
+        required = self.catalog.entry(template).placeholders
+        return Routed(template, params, frozenset(required.difference(params)), alert)
+
+    def route(
+        self,
+        payload: Mapping[str, Any],
+        provider: Optional[str] = None,
+        cluster_uuid: Optional[str] = None,
+    ) -> List[Routed]:
+        """Route every alert of an Alertmanager webhook payload.
+
+        Alerts that match no route (and no fallback) are left out.
+        """
+        common = payload.get("commonLabels") or {}
+        routed = []
+        for alert in payload.get("alerts") or ():
+            if common:
+                alert = dict(alert, labels={**common, **(alert.get("labels") or {})})
+            result = self.route_alert(alert, provider, cluster_uuid)
+            if result is not None:
+                routed.append(result)
+        return routed
@@ -0,0 +1,450 @@
+"""Cluster selectors built from the ``cluster/*.txt`` search fragments.
+
+The fragments are OCM cluster search expressions such as
+``region.id is '${CLUSTER_REGION}'``. This module parses them, and boolean
+combinations of them, into a small AST that can be turned back into an OCM
+search string or evaluated locally against a cached cluster inventory.
+
+Inside an expression a bare fragment name stands for that fragment, so
+``clusterIsReady and clusterRegionIs and not clusterIsCCS`` is a valid
+selector once ``CLUSTER_REGION`` is supplied.
+
+Ordering operators on version fields (``version.id > '4.9.0'``) compare
+OpenShift versions numerically rather than as strings; see :mod:`.version`.
+"""
+
+from __future__ import annotations
+
+import json
+import operator
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+
+from .catalog import BUNDLE_ENV, PLACEHOLDER_RE, REPO_ROOT
+from .version import is_version_field, version_key
+
+#: Directory holding the search fragments.
+FRAGMENT_DIR = REPO_ROOT / "cluster"
+
+Record = Mapping[str, Any]
+Predicate = Callable[[Record], bool]
+
+
+class SelectorError(ValueError):
+    """Raised for malformed selector expressions."""
+
+
+@dataclass(frozen=True)
+class Compare:
+    field: str
+    op: str
+    value: Any
+
+    def to_search(self) -> str:
+        return f"{self.field} {self.op} {_quote(self.value)}"
+
+
+@dataclass(frozen=True)
+class And:
+    items: Tuple["Node", ...]
+
+    def to_search(self) -> str:
+        return " and ".join(_group(item) for item in self.items)
+
+
+@dataclass(frozen=True)
+class Or:
+    items: Tuple["Node", ...]
+
+    def to_search(self) -> str:
+        return " or ".join(_group(item) for item in self.items)
+
+
+@dataclass(frozen=True)
+class Not:
+    item: "Node"
+
+    def to_search(self) -> str:
+        return f"not ({self.item.to_search()})"
+
+
+Node = Union[Compare, And, Or, Not]
+
+#: Comparison operators, normalized spelling first.
+OPERATORS = {
+    "is": "is",
+    "is not": "is not",
+    "=": "is",
+    "!=": "is not",
+    "<>": "is not",
+    "<": "<",
+    "<=": "<=",
+    ">": ">",
+    ">=": ">=",
+    "like": "like",
+    "in": "in",
+}
+
+
+def _quote(value: Any) -> str:
+    if isinstance(value, tuple):
+        return "(" + ", ".join(_quote(v) for v in value) + ")"
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _group(node: Node) -> str:
+    if isinstance(node, (And, Or)):
+        return f"({node.to_search()})"
+    return node.to_search()
+
+
+_TOKEN_RE = re.compile(
+    r"""
+    \s*(?:
+        (?P<string>'(?:[^']|'')*')
+      | (?P<op><=|>=|<>|!=|=|<|>)
+      | (?P<punct>[(),])
+      | (?P<word>[A-Za-z0-9_.\-]+)
+    )""",
+    re.VERBOSE,
+)
+
+_KEYWORDS = {"and", "or", "not", "is", "like", "in"}
+
+
+def _tokenize(text: str) -> List[Tuple[str, str]]:
+    tokens: List[Tuple[str, str]] = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if match is None:
+            raise SelectorError(f"unexpected input at {pos}: {text[pos:pos + 20]!r}")
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "string":
+            value = value[1:-1].replace("''", "'")
+        elif kind == "word" and value.lower() in _KEYWORDS:
+            kind, value = "keyword", value.lower()
+        tokens.append((kind, value))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, text: str, resolve: Callable[[str], Node]):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+        self.resolve = resolve
+
+    def peek(self, offset: int = 0) -> Tuple[str, str]:
+        i = self.pos + offset
+        return self.tokens[i] if i < len(self.tokens) else ("end", "")
+
+    def take(self) -> Tuple[str, str]:
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def expect(self, kind: str, value: Optional[str] = None) -> str:
+        got_kind, got_value = self.take()
+        if got_kind != kind or (value is not None and got_value != value):
+            raise SelectorError(f"expected {value or kind}, got {got_value or got_kind!r}")
+        return got_value
+
+    def parse(self) -> Node:
+        node = self.parse_or()
+        if self.peek()[0] != "end":
+            raise SelectorError(f"unexpected {self.peek()[1]!r}")
+        return node
+
+    def parse_or(self) -> Node:
+        items = [self.parse_and()]
+        while self.peek() == ("keyword", "or"):
+            self.take()
+            items.append(self.parse_and())
+        return items[0] if len(items) == 1 else Or(tuple(items))
+
+    def parse_and(self) -> Node:
+        items = [self.parse_not()]
+        while self.peek() == ("keyword", "and"):
+            self.take()
+            items.append(self.parse_not())
+        return items[0] if len(items) == 1 else And(tuple(items))
+
+    def parse_not(self) -> Node:
+        if self.peek() == ("keyword", "not"):
+            self.take()
+            return Not(self.parse_not())
+        return self.parse_primary()
+
+    def parse_primary(self) -> Node:
+        kind, value = self.peek()
+        if (kind, value) == ("punct", "("):
+            self.take()
+            node = self.parse_or()
+            self.expect("punct", ")")
+            return node
+        if kind != "word":
+            raise SelectorError(f"expected a field or fragment name, got {value or kind!r}")
+        next_kind, next_value = self.peek(1)
+        if next_kind == "op" or (next_kind == "keyword" and next_value in ("is", "like", "in")):
+            return self.parse_compare()
+        self.take()
+        return self.resolve(value)
+
+    def parse_compare(self) -> Compare:
+        field = self.expect("word")
+        kind, op = self.take()
+        if op == "is" and self.peek() == ("keyword", "not"):
+            self.take()
+            op = "is not"
+        op = OPERATORS[op]
+        if op == "in":
+            self.expect("punct", "(")
+            values = [self.parse_value()]
+            while self.peek() == ("punct", ","):
+                self.take()
+                values.append(self.parse_value())
+            self.expect("punct", ")")
+            return Compare(field, op, tuple(values))
+        return Compare(field, op, self.parse_value())
+
+    def parse_value(self) -> str:
+        kind, value = self.take()
+        if kind not in ("string", "word"):
+            raise SelectorError(f"expected a value, got {value or kind!r}")
+        return value
+
+
+def substitute(text: str, params: Optional[Mapping[str, Any]] = None) -> str:
+    """Fill ``${NAME}`` placeholders in a fragment, quoting-safe."""
+    params = params or {}
+
+    def repl(match: "re.Match[str]") -> str:
+        name = match.group(1)
+        if name not in params:
+            raise SelectorError(f"missing parameter {name}")
+        return str(params[name]).replace("'", "''")
+
+    return PLACEHOLDER_RE.sub(repl, text)
+
+
+#: Where fragments come from: a directory of ``*.txt`` files, or a mapping
+#: of fragment name to text such as :meth:`~.bundle.Bundle.fragments`.
+FragmentSource = Union[Path, Mapping[str, str]]
+
+
+def default_fragments() -> FragmentSource:
+    """The fragments of the bundle named by ``$MANAGED_NOTIFICATIONS_BUNDLE``, else :data:`FRAGMENT_DIR`."""
+    bundle_path = os.environ.get(BUNDLE_ENV)
+    if bundle_path:
+        from .bundle import Bundle
+
+        with Bundle(bundle_path) as bundle:
+            return bundle.fragments()
+    return FRAGMENT_DIR
+
+
+def fragment_names(source: FragmentSource = FRAGMENT_DIR) -> List[str]:
+    if isinstance(source, Mapping):
+        return sorted(source)
+    return sorted(p.stem for p in Path(source).glob("*.txt"))
+
+
+def read_fragment(name: str, source: FragmentSource = FRAGMENT_DIR) -> str:
+    if isinstance(source, Mapping):
+        try:
+            return source[name]
+        except KeyError:
+            raise SelectorError(f"unknown fragment {name!r}") from None
+    path = Path(source) / f"{name}.txt"
+    try:
+        return path.read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        raise SelectorError(f"unknown fragment {name!r}") from None
+
+
+def parse(
+    text: str,
+    params: Optional[Mapping[str, Any]] = None,
+    fragments: FragmentSource = FRAGMENT_DIR,
+) -> Node:
+    """Parse a selector expression, expanding fragment names it mentions."""
+
+    def resolve(name: str) -> Node:
+        return parse(read_fragment(name, fragments), params, fragments)
+
+    return _Parser(substitute(text, params), resolve).parse()
+
+
+def fragment(
+    name: str, params: Optional[Mapping[str, Any]] = None, fragments: FragmentSource = FRAGMENT_DIR
+) -> Node:
+    """Parse the fragment ``cluster/<name>.txt``."""
+    return parse(read_fragment(name, fragments), params, fragments)
+
+
+def get_field(record: Record, field: str) -> Any:
+    """Look up a dotted field, accepting both flat and nested records."""
+    return field_getter(field)(record)
+
+
+def field_getter(field: str) -> Callable[[Record], Any]:
+    """Return a fast accessor for a dotted field (see :func:`get_field`)."""
+    parts = tuple(field.split("."))
+
+    def get(record: Record) -> Any:
+        if field in record:
+            return record[field]
+        value: Any = record
+        for part in parts:
+            if not isinstance(value, Mapping):
+                return None
+            value = value.get(part)
+        return value
+
+    return get
+
+
+def as_text(value: Any) -> Optional[str]:
+    """Render a record value the way the search language compares it."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def like_pattern(pattern: str) -> "re.Pattern[str]":
+    """Translate a ``like`` pattern (``%`` and ``_`` wildcards) to a regex."""
+    parts = (re.escape(p) for p in pattern.split("%"))
+    return re.compile(".*".join(parts).replace("_", "."), re.DOTALL)
+
+
+def _compile_compare(node: Compare) -> Predicate:
+    op, value = node.op, node.value
+    get = field_getter(node.field)
+    if op == "is":
+        return lambda r: as_text(get(r)) == value
+    if op == "is not":
+        return lambda r: as_text(get(r)) != value
+    if op == "in":
+        values = frozenset(value)
+        return lambda r: as_text(get(r)) in values
+    if op == "like":
+        # Like the ordering operators, a missing or null field never matches.
+        match = like_pattern(value).fullmatch
+
+        def like(r: Record) -> bool:
+            actual = as_text(get(r))
+            return actual is not None and match(actual) is not None
+
+        return like
+    key, bound = ordering(node)
+    compare = ORDERING[op]
+
+    def predicate(r: Record) -> bool:
+        actual = as_text(get(r))
+        if actual is None:
+            return False
+        actual_key = key(actual)
+        return actual_key is not None and compare(actual_key, bound)
+
+    return predicate
+
+
+#: Ordering operators as functions of (actual, bound).
+ORDERING = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def _identity(text: str) -> str:
+    return text
+
+
+def ordering(node: Compare) -> Tuple[Callable[[str], Any], Any]:
+    """Return the sort key function for ``node.field`` and the key of its bound.
+
+    Version fields sort by :func:`~.version.version_key`; everything else
+    compares as text.
+    """
+    if not is_version_field(node.field):
+        return _identity, node.value
+    bound = version_key(node.value)
+    if bound is None:
+        raise SelectorError(f"{node.field}: cannot parse version {node.value!r}")
+    return version_key, bound
+
+
+def compile_predicate(node: Node) -> Predicate:
+    """Compile an AST into a function of a single cluster record."""
+    if isinstance(node, Compare):
+        return _compile_compare(node)
+    if isinstance(node, Not):
+        inner = compile_predicate(node.item)
+        return lambda r: not inner(r)
+    predicates = [compile_predicate(item) for item in node.items]
+    if isinstance(node, And):
+        return lambda r: all(p(r) for p in predicates)
+    return lambda r: any(p(r) for p in predicates)
+
+
+def fields_of(node: Node) -> List[str]:
+    """Return the fields a selector references, in order of appearance."""
+    if isinstance(node, Compare):
+        return [node.field]
+    if isinstance(node, Not):
+        return fields_of(node.item)
+    fields: List[str] = []
+    for item in node.items:
+        fields.extend(f for f in fields_of(item) if f not in fields)
+    return fields
+
+
+def select(node: Node, records: Iterable[Record]) -> Iterator[Record]:
+    """Yield the records matching ``node``."""
+    predicate = compile_predicate(node)
+    return (r for r in records if predicate(r))
+
+
+def iter_inventory(path: Union[str, Path]) -> Iterator[Dict[str, Any]]:
+    """Yield the cluster records of a cached inventory.
+
+    JSON lines files (one cluster object per line) are read natively. Arrow
+    IPC (``.arrow``/``.feather``) and Parquet files need ``pyarrow``.
+    """
+    path = Path(path)
+    if path.suffix in (".arrow", ".feather", ".parquet"):
+        yield from _read_arrow(path)
+        return
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def load_inventory(path: Union[str, Path]) -> List[Dict[str, Any]]:
+    """Load a cached cluster inventory into a list of records."""
+    return list(iter_inventory(path))
+
+
+def _read_arrow(path: Path) -> List[Dict[str, Any]]:
+    try:
+        import pyarrow.feather as feather
+        import pyarrow.parquet as parquet
+    except ImportError:
+        raise SelectorError(f"reading {path.suffix} inventories requires pyarrow") from None
+    if path.suffix == ".parquet":
+        table = parquet.read_table(path)
+    else:
+        table = feather.read_table(path)
+    return table.to_pylist()
@@ -0,0 +1,506 @@
+"""Bulk posting of rendered templates to the service log API.
+
+:class:`BulkSender` keeps a pool of keep-alive HTTP connections and posts
+payloads from a bounded number of worker threads, retrying throttled, failed
+and dropped requests with exponential backoff. Results are yielded as they
+complete, so arbitrarily long parameter streams can be sent without holding
+them in memory.
+"""
+
+from __future__ import annotations
+
+import http.client
+import json
+import queue
+import random
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+from .checkpoint import Checkpoint
+from .deadletter import DeadLetter, DeadLetterStore
+from .ledger import Ledger
+from .ratelimit import AdaptiveLimiter, parse_retry_after
+from .render import Params, Renderer, UuidSource, default_renderer, iter_uuids
+from .suppress import Suppressor, send_key
+from .validate import check_payload, validate_payload
+
+DEFAULT_URL = "https://api.openshift.com"
+SERVICE_LOG_PATH = "/api/service_logs/v1/cluster_logs"
+
+#: Status codes that are worth retrying.
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+#: A bearer token, or a callable returning the current one.
+Token = Union[str, Callable[[], str], None]
+
+
+class WorkItem(NamedTuple):
+    """One payload to post."""
+
+    index: int
+    cluster_uuid: str
+    body: bytes
+    template_id: str = ""
+    #: Suppression key admitted for this send; forgotten again if it fails.
+    key: Optional[bytes] = None
+    #: Parameters the payload was rendered from, for the ledger.
+    params: Optional[Params] = None
+
+
+@dataclass
+class SendResult:
+    """Outcome of posting one payload."""
+
+    index: int
+    cluster_uuid: str
+    status: Optional[int]
+    attempts: int
+    elapsed: float
+    error: Optional[str] = None
+    response: bytes = b""
+    template_id: str = ""
+    #: True when the send was skipped as a recent duplicate.
+    suppressed: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.status is not None and 200 <= self.status < 300
+
+    @property
+    def failed(self) -> bool:
+        return not self.ok and not self.suppressed
+
+    def to_json(self) -> dict:
+        return {
+            "index": self.index,
+            "cluster_uuid": self.cluster_uuid,
+            "template_id": self.template_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "elapsed": round(self.elapsed, 6),
+            "error": self.error,
+            "suppressed": self.suppressed,
+        }
+
+
+class ConnectionPool:
+    """A fixed-size pool of keep-alive connections to one host."""
+
+    def __init__(self, base_url: str, size: int, timeout: float = 30.0):
+        parts = urlsplit(base_url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"unsupported URL scheme: {base_url}")
+        self.scheme = parts.scheme
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    @staticmethod
+    def ensure_connected(conn: http.client.HTTPConnection) -> None:
+        """Open ``conn`` if needed, with Nagle's algorithm disabled."""
+        if conn.sock is None:
+            conn.connect()
+            conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def acquire(self) -> http.client.HTTPConnection:
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn: http.client.HTTPConnection, reuse: bool = True) -> None:
+        if reuse:
+            self._idle.put(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class BulkSender:
+    """Posts service log payloads over pooled connections.
+
+    ``concurrency`` bounds both the number of in-flight requests and the
+    number of open connections. Each request is attempted up to
+    ``retries + 1`` times; retries sleep ``backoff * 2**attempt`` seconds
+    (capped at ``max_backoff``, with jitter), or as long as a ``Retry-After``
+    header asks if that is longer (also capped at ``max_backoff``).
+
+    With a ``limiter`` (see :mod:`.ratelimit`), every attempt waits for the
+    limiter first and reports its status and latency back to it, so the
+    request rate and the number in flight adapt to throttling.
+
+    ``token`` may be a callable such as :class:`~.auth.TokenManager`, which
+    is asked for the token before every attempt; if it also has an
+    ``invalidate(token)`` method, a ``401`` response invalidates the token
+    and the request is tried once more with a new one.
+
+    With ``validate`` (the default) every payload is checked against
+    :data:`~.validate.PAYLOAD_SCHEMA` first and invalid ones are reported as
+    failed results without being posted.
+
+    With a ``suppressor`` (see :mod:`.suppress`), a payload whose cluster,
+    template and description were already sent within the suppression
+    window is skipped and reported with ``suppressed=True``. Sends that
+    fail are forgotten again so they can be retried.
+
+    With a ``ledger`` (see :mod:`.ledger`), every posted payload is recorded
+    along with its parameters and outcome.
+
+    With ``dead_letters`` (see :mod:`.deadletter`), every payload that
+    failed validation or could not be posted is stored with its parameters
+    and error, for :meth:`redrive` to post again later.
+
+    :meth:`send` and :meth:`send_fleet` accept a :class:`~.checkpoint.Checkpoint`:
+    input positions it has recorded as done are skipped without rendering,
+    and each position is recorded once its payload was posted successfully
+    (or suppressed), so an interrupted run can be resumed.
+    """
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_URL,
+        token: Token = None,
+        concurrency: int = 16,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        timeout: float = 30.0,
+        renderer: Optional[Renderer] = None,
+        validate: bool = True,
+        suppressor: Optional[Suppressor] = None,
+        ledger: Optional[Ledger] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+        dead_letters: Optional[DeadLetterStore] = None,
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.token = token
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.validate = validate
+        self.suppressor = suppressor
+        self.ledger = ledger
+        self.limiter = limiter
+        self.dead_letters = dead_letters
+        self.renderer = renderer if renderer is not None else default_renderer()
+        self.pool = ConnectionPool(base_url, concurrency, timeout)
+        self.path = self.pool.prefix + SERVICE_LOG_PATH
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="servicelog")
+
+    def __enter__(self) -> "BulkSender":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self.pool.close()
+
+    def _headers(self, token: Optional[str]) -> dict:
+        headers = {"Content-Type": "application/json", "Accept": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        return headers
+
+    def _delay(self, attempt: int) -> float:
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)
+
+    def post(self, item: WorkItem) -> SendResult:
+        """Post one payload, retrying as configured."""
+        index, cluster_uuid, body, template_id = item[:4]
+        start = time.monotonic()
+        status: Optional[int] = None
+        error: Optional[str] = None
+        response = b""
+        limiter = self.limiter
+        attempt = 0
+        reauthenticated = False
+        while True:
+            token = self.token() if callable(self.token) else self.token
+            if limiter is not None:
+                limiter.acquire()
+            conn = self.pool.acquire()
+            sent = time.monotonic()
+            reuse = False
+            retry_after = None
+            try:
+                self.pool.ensure_connected(conn)
+                conn.request("POST", self.path, body=body, headers=self._headers(token))
+                resp = conn.getresponse()
+                response = resp.read()
+                status = resp.status
+                error = None if 200 <= status < 300 else f"HTTP {status}"
+                reuse = not resp.will_close
+                if status in RETRY_STATUSES:
+                    retry_after = parse_retry_after(resp.getheader("Retry-After"))
+                    if retry_after is not None:
+                        retry_after = min(retry_after, self.max_backoff)
+            except (OSError, http.client.HTTPException) as e:
+                status = None
+                error = f"{type(e).__name__}: {e}"
+            finally:
+                self.pool.release(conn, reuse)
+                if limiter is not None:
+                    limiter.release(status, time.monotonic() - sent, retry_after)
+            if status == 401 and token and not reauthenticated and hasattr(self.token, "invalidate"):
+                # The token was revoked or expired early: replace it and try again once.
+                self.token.invalidate(token)
+                reauthenticated = True
+                continue
+            retryable = status is None or status in RETRY_STATUSES
+            if not retryable or attempt >= self.retries:
+                break
+            delay = self._delay(attempt)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            time.sleep(delay)
+            attempt += 1
+        return SendResult(
+            index, cluster_uuid, status, attempt + 1, time.monotonic() - start, error, response, template_id
+        )
+
+    def _finish(
+        self,
+        item: WorkItem,
+        result: SendResult,
+        checkpoint: Optional[Checkpoint] = None,
+        dead_letter: bool = True,
+    ) -> SendResult:
+        if item.key is not None and not result.ok:
+            self.suppressor.forget(item.key)
+        if checkpoint is not None and result.ok:
+            checkpoint.mark(item.index)
+        store_failure = dead_letter and self.dead_letters is not None and not result.ok
+        if self.ledger is not None or store_failure:
+            params = dict(item.params or {})
+            params["CLUSTER_UUID"] = item.cluster_uuid
+            if self.ledger is not None:
+                self.ledger.record(
+                    item.cluster_uuid,
+                    item.template_id,
+                    params,
+                    result.status,
+                    result.error,
+                    event_stream_id=_event_stream_id(item.body),
+                )
+            if store_failure:
+                self.dead_letters.record(
+                    item.cluster_uuid, item.template_id, item.body, params, result.status, result.error, result.attempts
+                )
+        return result
+
+    def send_items(
+        self,
+        items: Iterable[Union[WorkItem, SendResult]],
+        checkpoint: Optional[Checkpoint] = None,
+        dead_letter: bool = True,
+    ) -> Iterator[SendResult]:
+        """Post work items, yielding results in completion order.
+
+        Ready-made :class:`SendResult` objects in ``items`` (payloads that were
+        rejected before posting) are passed straight through. At most
+        ``2 * concurrency`` items are pulled from ``items`` ahead of completed
+        requests. Successful and suppressed results are marked in
+        ``checkpoint``. Without ``dead_letter``, failures are left for the
+        caller to store.
+
+        If the caller stops early (``break``, an exception, Ctrl-C), items
+        not yet being posted are dropped, and the posts in flight are waited
+        for and recorded in ``checkpoint``, the ledger and the dead-letter
+        store, so a resumed run does not post them again.
+        """
+        pending: Dict[Future, WorkItem] = {}
+        limit = 2 * self.concurrency
+        try:
+            for item in items:
+                if isinstance(item, SendResult):
+                    if checkpoint is not None and item.suppressed:
+                        checkpoint.mark(item.index)
+                    yield item
+                    continue
+                pending[self._executor.submit(self.post, item)] = item
+                if len(pending) >= limit:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield self._finish(pending.pop(future), future.result(), checkpoint, dead_letter)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield self._finish(pending.pop(future), future.result(), checkpoint, dead_letter)
+        finally:
+            for future, item in list(pending.items()):
+                if future.cancel():
+                    del pending[future]
+                    if item.key is not None:
+                        self.suppressor.forget(item.key)
+            if pending:
+                wait(pending)
+            for future, item in pending.items():
+                if future.exception() is None:
+                    self._finish(item, future.result(), checkpoint, dead_letter)
+            for store in (self.ledger, self.dead_letters):
+                if store is not None:
+                    store.flush()
+
+    def _admit(self, item: WorkItem, description: str) -> Union[WorkItem, SendResult]:
+        """Apply the suppressor, if any, to a work item."""
+        if self.suppressor is None:
+            return item
+        key = send_key(item.cluster_uuid, item.template_id, description)
+        if not self.suppressor.admit(key):
+            return SendResult(
+                item.index, item.cluster_uuid, None, 0, 0.0, "suppressed duplicate", b"", item.template_id, True
+            )
+        return item._replace(key=key)
+
+    def send(
+        self, template_id: str, params_stream: Iterable[Params], checkpoint: Optional[Checkpoint] = None
+    ) -> Iterator[SendResult]:
+        """Render ``template_id`` for each parameter set and post the payloads.
+
+        A parameter set the template cannot be rendered from (a missing
+        parameter, say) fails on its own like an invalid payload, and is
+        dead-lettered with its parameters so it can be re-driven with the
+        missing ones.
+        """
+        compiled = self.renderer.compile(template_id)
+        render = compiled.render
+        validate = self.validate
+
+        def items() -> Iterator[Union[WorkItem, SendResult]]:
+            for index, params in enumerate(params_stream):
+                if checkpoint is not None and checkpoint.done(index):
+                    continue
+                try:
+                    payload = render(params)
+                except ValueError as e:
+                    cluster_uuid = str(params.get("CLUSTER_UUID", ""))
+                    error = f"invalid payload: {e}"
+                    if self.dead_letters is not None:
+                        self.dead_letters.record(cluster_uuid, compiled.id, None, params, None, error, 0)
+                    yield SendResult(index, cluster_uuid, None, 0, 0.0, error, b"", compiled.id)
+                    continue
+                cluster_uuid = payload.get("cluster_uuid", "")
+                body = json.dumps(payload).encode("utf-8")
+                if validate:
+                    errors = validate_payload(payload)
+                    if errors:
+                        error = f"invalid payload: {'; '.join(errors)}"
+                        if self.dead_letters is not None:
+                            self.dead_letters.record(cluster_uuid, compiled.id, body, params, None, error, 0)
+                        yield SendResult(index, cluster_uuid, None, 0, 0.0, error, b"", compiled.id)
+                        continue
+                item = WorkItem(index, cluster_uuid, body, compiled.id, params=params)
+                yield self._admit(item, payload.get("description", ""))
+
+        return self.send_items(items(), checkpoint)
+
+    def send_fleet(
+        self,
+        template_id: str,
+        cluster_uuids: UuidSource,
+        params: Optional[Params] = None,
+        checkpoint: Optional[Checkpoint] = None,
+    ) -> Iterator[SendResult]:
+        """Post a template that varies only by cluster UUID to every cluster.
+
+        The payload is validated once, up front; an invalid one raises
+        :class:`~.validate.ValidationError` before anything is posted.
+        """
+        sample = dict(params or {})
+        sample["CLUSTER_UUID"] = "00000000-0000-0000-0000-000000000000"
+        sample_payload = self.renderer.render(template_id, sample)
+        if self.validate:
+            check_payload(sample_payload)
+        description = sample_payload.get("description", "")
+        fleet = self.renderer.fleet(template_id, params)
+
+        template_id = fleet.id
+
+        def items() -> Iterator[Union[WorkItem, SendResult]]:
+            for index, cluster_uuid in enumerate(iter_uuids(cluster_uuids)):
+                if checkpoint is not None and checkpoint.done(index):
+                    continue
+                item = WorkItem(index, cluster_uuid, fleet.render(cluster_uuid), template_id, params=params)
+                yield self._admit(item, description)
+
+        return self.send_items(items(), checkpoint)
+
+    def redrive(self, entries: Iterable[DeadLetter], params: Optional[Params] = None) -> Iterator[SendResult]:
+        """Post dead-lettered payloads again, yielding results in completion order.
+
+        Each entry's stored payload is posted as is, or, with ``params``,
+        re-rendered from its stored parameters updated with ``params``. The
+        outcome is written back to :attr:`dead_letters`: successful entries
+        are resolved and failed ones keep their new error. Entries the
+        suppressor skips were not posted and stay as they are. A result's
+        ``index`` is the entry id.
+        """
+        store = self.dead_letters
+        if store is None:
+            raise ValueError("redrive needs a sender with dead_letters")
+        # Re-rendered payloads, to replace the stored ones.
+        rendered: Dict[int, Tuple[str, bytes, Params]] = {}
+
+        def items() -> Iterator[Union[WorkItem, SendResult]]:
+            for entry in entries:
+                entry_params = dict(entry.params or {})
+                cluster_uuid, body = entry.cluster_uuid, entry.body
+                try:
+                    if params or body is None:
+                        entry_params.update(params or {})
+                        payload = self.renderer.render(entry.template_id, entry_params)
+                        cluster_uuid = payload.get("cluster_uuid", cluster_uuid)
+                        body = json.dumps(payload).encode("utf-8")
+                        rendered[entry.id] = (cluster_uuid, body, entry_params)
+                    else:
+                        payload = json.loads(body)
+                    errors = validate_payload(payload) if self.validate else []
+                except ValueError as e:  # missing parameters, or a stored body that is not JSON
+                    errors = [str(e)]
+                if errors:
+                    error = f"invalid payload: {'; '.join(errors)}"
+                    yield SendResult(entry.id, cluster_uuid, None, 0, 0.0, error, b"", entry.template_id)
+                    continue
+                item = WorkItem(entry.id, cluster_uuid, body, entry.template_id, params=entry_params)
+                yield self._admit(item, payload.get("description", ""))
+
+        for result in self.send_items(items(), dead_letter=False):
+            replacement = rendered.pop(result.index, ())
+            if not result.suppressed:
+                error = None if result.ok else result.error
+                store.redriven(result.index, result.status, error, result.attempts, *replacement)
+            yield result
+
+
+def _event_stream_id(body: bytes) -> Optional[str]:
+    """The payload's ``event_stream_id``, which templates may fill from any placeholder."""
+    if b'"event_stream_id"' not in body:
+        return None
+    value = json.loads(body).get("event_stream_id")
+    return None if value is None else str(value)
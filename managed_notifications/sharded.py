@@ -0,0 +1,334 @@
+"""Sending from several processes, sharded by cluster.
+
+One :class:`~.sender.BulkSender` runs rendering, JSON encoding, TLS and
+response parsing on one core. :class:`ShardedSender` starts ``shards``
+worker processes, each with its own sender, connection pool and renderer,
+and routes every cluster to the worker :func:`shard_of` picks from a hash
+of its UUID, so a cluster's sends always go through the same worker.
+
+The parent reads the input, hands it to the workers in batches and merges
+their results back into input order, so the report is the same as a
+single sender's. It also owns the checkpoint, marking each result as it
+arrives; when a send stops early, the workers stop taking new input and
+the parent waits for their in-flight posts, up to :data:`STOP_TIMEOUT`,
+so those are checkpointed too. Suppression, the ledger and the
+dead-letter store are SQLite files that every worker opens by path.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import multiprocessing
+import pickle
+import queue
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from .checkpoint import Checkpoint
+from .deadletter import DeadLetterStore
+from .ledger import Ledger
+from .ratelimit import AdaptiveLimiter
+from .render import Params, Renderer, UuidSource, default_renderer, iter_uuids
+from .sender import DEFAULT_URL, BulkSender, SendResult, Token
+from .suppress import DEFAULT_WINDOW, SqliteSuppressor
+from .validate import check_payload
+
+#: Inputs handed to a worker at a time, and results sent back at a time.
+BATCH_SIZE = 256
+
+#: Seconds a worker holds back a partial batch of results.
+FLUSH_INTERVAL = 0.05
+
+#: Seconds to wait for workers to finish their in-flight posts when a send stops early.
+STOP_TIMEOUT = 30.0
+
+
+class ShardError(RuntimeError):
+    """Raised when a worker process dies before finishing its shard."""
+
+
+def shard_of(cluster_uuid: str, shards: int) -> int:
+    """The shard of ``cluster_uuid``; stable across processes and runs."""
+    digest = hashlib.blake2b(cluster_uuid.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % shards
+
+
+class ShardedSender:
+    """Fans :meth:`send` and :meth:`send_fleet` out over worker processes.
+
+    ``concurrency`` is per worker. ``rate`` caps posts per second across
+    all workers (each gets an equal share) and, like ``adaptive``, gives
+    every worker an :class:`~.ratelimit.AdaptiveLimiter`. ``token`` may be
+    a string or a :class:`~.auth.TokenManager`; workers get their own copy
+    of the manager, sharing its ``cache_path`` if it has one.
+    """
+
+    def __init__(
+        self,
+        shards: int,
+        base_url: str = DEFAULT_URL,
+        token: Token = None,
+        concurrency: int = 16,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        timeout: float = 30.0,
+        validate: bool = True,
+        suppress_db: Union[str, Path, None] = None,
+        suppress_window: float = DEFAULT_WINDOW,
+        ledger: Union[str, Path, None] = None,
+        dead_letters: Union[str, Path, None] = None,
+        adaptive: bool = False,
+        rate: Optional[float] = None,
+        renderer: Optional[Renderer] = None,
+    ):
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        self.shards = shards
+        self.validate = validate
+        self.renderer = renderer if renderer is not None else default_renderer()
+        self._config: Dict[str, Any] = {
+            "base_url": base_url,
+            "token": token,
+            "concurrency": concurrency,
+            "retries": retries,
+            "backoff": backoff,
+            "max_backoff": max_backoff,
+            "timeout": timeout,
+            "validate": validate,
+            "suppress_db": str(suppress_db) if suppress_db is not None else None,
+            "suppress_window": suppress_window,
+            "ledger": str(ledger) if ledger is not None else None,
+            "dead_letters": str(dead_letters) if dead_letters is not None else None,
+            "adaptive": adaptive or bool(rate),
+            "rate": rate / shards if rate else None,
+        }
+        # Results the parent may be waiting on before it stops reading input.
+        self._window = shards * max(4 * concurrency, 2 * BATCH_SIZE)
+        self._context = multiprocessing.get_context("spawn")
+
+    def __enter__(self) -> "ShardedSender":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Nothing to release; workers only live for the duration of a send."""
+
+    def send(
+        self, template_id: str, params_stream: Iterable[Params], checkpoint: Optional[Checkpoint] = None
+    ) -> Iterator[SendResult]:
+        """Like :meth:`.BulkSender.send`, with results in input order."""
+        template_id = self.renderer.compile(template_id).id
+        inputs = ((params, str(params.get("CLUSTER_UUID", ""))) for params in params_stream)
+        return self._run(template_id, False, None, inputs, checkpoint)
+
+    def send_fleet(
+        self,
+        template_id: str,
+        cluster_uuids: UuidSource,
+        params: Optional[Params] = None,
+        checkpoint: Optional[Checkpoint] = None,
+    ) -> Iterator[SendResult]:
+        """Like :meth:`.BulkSender.send_fleet`, with results in input order."""
+        template_id = self.renderer.compile(template_id).id
+        if self.validate:
+            sample = dict(params or {}, CLUSTER_UUID="00000000-0000-0000-0000-000000000000")
+            check_payload(self.renderer.render(template_id, sample))
+        inputs = ((cluster_uuid, cluster_uuid) for cluster_uuid in iter_uuids(cluster_uuids))
+        return self._run(template_id, True, params, inputs, checkpoint)
+
+    def _run(
+        self,
+        template_id: str,
+        fleet: bool,
+        params: Optional[Params],
+        inputs: Iterator[Tuple[Any, str]],
+        checkpoint: Optional[Checkpoint],
+    ) -> Iterator[SendResult]:
+        ctx = self._context
+        inboxes = [ctx.Queue() for _ in range(self.shards)]
+        outbox = ctx.Queue()
+        stop = ctx.Event()
+        workers = [
+            ctx.Process(
+                target=_worker,
+                args=(shard, self._config, template_id, fleet, params, inboxes[shard], outbox, stop),
+                name=f"send-shard-{shard}",
+                daemon=True,
+            )
+            for shard in range(self.shards)
+        ]
+        for worker in workers:
+            worker.start()
+        batches: List[List[Tuple[int, Any]]] = [[] for _ in range(self.shards)]
+        # Indices handed out, in input order, and results waiting for earlier ones.
+        order: Deque[int] = deque()
+        ready: Dict[int, SendResult] = {}
+        finished: Set[int] = set()
+
+        def flush(shard: int) -> None:
+            if batches[shard]:
+                inboxes[shard].put(batches[shard])
+                batches[shard] = []
+
+        def receive(deadline: Optional[float] = None) -> None:
+            suspect = False
+            while True:
+                try:
+                    kind, shard, payload = outbox.get(timeout=1.0)
+                    break
+                except queue.Empty:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        return
+                    dead = [w.name for i, w in enumerate(workers) if w.exitcode is not None and i not in finished]
+                    if dead and suspect:
+                        raise ShardError(f"{', '.join(dead)} exited without finishing") from None
+                    # Give a message sent just before exiting one more poll to arrive.
+                    suspect = bool(dead)
+            if kind == "error":
+                finished.add(shard)
+                raise payload
+            if kind == "done":
+                finished.add(shard)
+                return
+            for result in payload:
+                # Checkpoint on arrival, not when the result's turn comes to be
+                # yielded: a send stopped early may never get that far.
+                if checkpoint is not None and (result.ok or result.suppressed):
+                    checkpoint.mark(result.index)
+                ready[result.index] = result
+
+        def drain() -> Iterator[SendResult]:
+            while order and order[0] in ready:
+                yield ready.pop(order.popleft())
+
+        try:
+            for index, (value, cluster_uuid) in enumerate(inputs):
+                if checkpoint is not None and checkpoint.done(index):
+                    continue
+                shard = shard_of(cluster_uuid, self.shards)
+                batches[shard].append((index, value))
+                order.append(index)
+                if len(batches[shard]) >= BATCH_SIZE:
+                    flush(shard)
+                if len(order) >= self._window:
+                    for shard in range(self.shards):
+                        flush(shard)
+                    while len(order) >= self._window:
+                        receive()
+                        yield from drain()
+            for shard in range(self.shards):
+                flush(shard)
+                inboxes[shard].put(None)
+            while len(finished) < self.shards:
+                receive()
+                yield from drain()
+            yield from drain()
+        finally:
+            if len(finished) < self.shards:
+                # Stopped early: let the workers finish the posts they started
+                # and collect (and checkpoint) those results before going.
+                stop.set()
+                for inbox in inboxes:
+                    inbox.put(None)
+                deadline = time.monotonic() + STOP_TIMEOUT
+                while len(finished) < self.shards and time.monotonic() < deadline:
+                    try:
+                        receive(deadline)
+                    except ShardError:
+                        break
+                    except Exception:
+                        continue
+            for shard, worker in enumerate(workers):
+                if shard not in finished:
+                    worker.terminate()
+                worker.join()
+
+
+def _worker(
+    shard: int,
+    config: Dict[str, Any],
+    template_id: str,
+    fleet: bool,
+    params: Optional[Params],
+    inbox: "multiprocessing.Queue",
+    outbox: "multiprocessing.Queue",
+    stop: Any,
+) -> None:
+    """Send one shard's inputs, reporting results with their input index.
+
+    Once ``stop`` is set no further inputs are taken; posts already started
+    are finished and reported.
+    """
+    config = dict(config)
+    suppress_db, suppress_window = config.pop("suppress_db"), config.pop("suppress_window")
+    ledger_path, dead_letters_path = config.pop("ledger"), config.pop("dead_letters")
+    adaptive, rate = config.pop("adaptive"), config.pop("rate")
+    suppressor = SqliteSuppressor(suppress_db, suppress_window) if suppress_db else None
+    ledger = Ledger(ledger_path) if ledger_path else None
+    dead_letters = DeadLetterStore(dead_letters_path) if dead_letters_path else None
+    limiter = AdaptiveLimiter(config["concurrency"], rate=rate) if adaptive else None
+    # The sender numbers its inputs from 0; map those back to the input index.
+    indices: Dict[int, int] = {}
+    results: List[SendResult] = []
+    flushed = time.monotonic()
+
+    def flush() -> None:
+        nonlocal results, flushed
+        if results:
+            outbox.put(("results", shard, results))
+            results = []
+        flushed = time.monotonic()
+
+    def inputs() -> Iterator[Any]:
+        local = 0
+        while True:
+            try:
+                batch = inbox.get_nowait()
+            except queue.Empty:
+                # Everything sent so far may be waited on; do not sit on results.
+                flush()
+                batch = inbox.get()
+            if batch is None or stop.is_set():
+                return
+            for index, value in batch:
+                if stop.is_set():
+                    return
+                indices[local] = index
+                local += 1
+                yield value
+
+    try:
+        with BulkSender(
+            suppressor=suppressor, ledger=ledger, limiter=limiter, dead_letters=dead_letters, **config
+        ) as sender:
+            if fleet:
+                stream = sender.send_fleet(template_id, inputs(), params)
+            else:
+                stream = sender.send(template_id, inputs())
+            for result in stream:
+                result.index = indices.pop(result.index)
+                results.append(result)
+                if len(results) >= BATCH_SIZE or time.monotonic() - flushed >= FLUSH_INTERVAL:
+                    flush()
+        flush()
+        outbox.put(("done", shard, None))
+    except Exception as e:
+        outbox.put(("error", shard, _portable(e)))
+    finally:
+        for store in (suppressor, ledger, dead_letters):
+            if store is not None:
+                store.close()
+
+
+def _portable(error: Exception) -> Exception:
+    """``error`` if it survives pickling to the parent, else a :class:`ShardError` describing it."""
+    try:
+        pickle.loads(pickle.dumps(error))
+    except Exception:
+        return ShardError(f"{type(error).__name__}: {error}")
+    return error
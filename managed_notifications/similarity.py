@@ -0,0 +1,230 @@
+"""Near-duplicate templates, found with MinHash and locality-sensitive hashing.
+
+A template's text (summary and description) is cut into overlapping word
+shingles; its MinHash signature estimates the Jaccard similarity of two
+shingle sets. Signatures are split into bands and every band is hashed into
+a bucket, so only templates sharing a bucket with each other are compared:
+finding all near-duplicates, or the matches of one new template, does not
+compare every pair. Candidates are confirmed on the exact Jaccard
+similarity of their shingles, so reported similarities are exact; a pair
+just above the threshold may occasionally be missed.
+
+::
+
+    python -m managed_notifications duplicates                      # clusters in the catalog
+    python -m managed_notifications duplicates osd/new_template.json
+    python -m managed_notifications duplicates --changed-since origin/master
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+from array import array
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from .catalog import Catalog, default_catalog
+
+#: Template fields whose text is compared.
+TEXT_FIELDS = ("summary", "description")
+
+_TOKEN_RE = re.compile(r"\$\{\w+\}|\w+")
+
+
+def template_text(template: Dict[str, Any]) -> str:
+    return "\n".join(str(template[name]) for name in TEXT_FIELDS if template.get(name))
+
+
+def shingles(text: str, size: int = 3) -> FrozenSet[str]:
+    """Lower-cased word ``size``-grams of ``text``; placeholders count as words."""
+    words = _TOKEN_RE.findall(text.lower())
+    if len(words) <= size:
+        return frozenset([" ".join(words)]) if words else frozenset()
+    return frozenset(" ".join(words[i : i + size]) for i in range(len(words) - size + 1))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """Bands and rows per band whose LSH S-curve best fits ``threshold``.
+
+    Minimizes the weighted area of false positives below the threshold and
+    false negatives above it; misses weigh more, since every candidate is
+    verified anyway.
+    """
+
+    def area(f, lo: float, hi: float, steps: int = 64) -> float:
+        width = (hi - lo) / steps
+        return sum(f(lo + (i + 0.5) * width) for i in range(steps)) * width
+
+    best, best_error = (1, num_perm), float("inf")
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        if not rows:
+            break
+        false_positive = area(lambda s, r=rows, b=bands: 1 - (1 - s**r) ** b, 0.0, threshold)
+        false_negative = area(lambda s, r=rows, b=bands: (1 - s**r) ** b, threshold, 1.0)
+        error = 0.1 * false_positive + 0.9 * false_negative
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+@dataclass(frozen=True)
+class Match:
+    """A template similar to the one queried."""
+
+    id: str
+    similarity: float
+
+
+class _DisjointSet:
+    def __init__(self) -> None:
+        self._parent: Dict[str, str] = {}
+
+    def find(self, item: str) -> str:
+        parent = self._parent.setdefault(item, item)
+        while parent != item:
+            grandparent = self._parent[parent]
+            self._parent[item] = grandparent
+            item, parent = parent, grandparent
+        return item
+
+    def union(self, a: str, b: str) -> None:
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self._parent[max(a, b)] = min(a, b)
+
+    def groups(self) -> List[List[str]]:
+        members: Dict[str, List[str]] = defaultdict(list)
+        for item in self._parent:
+            members[self.find(item)].append(item)
+        return [sorted(group) for group in members.values()]
+
+
+class SimilarityIndex:
+    """MinHash LSH index of texts by id; see the module docstring.
+
+    ``threshold`` is the Jaccard similarity of shingle sets at or above
+    which two texts count as near-duplicates.
+    """
+
+    def __init__(self, threshold: float = 0.5, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        self._salt = f"{seed}:".encode("ascii")
+        self.bands, self.rows = _bands(num_perm, threshold)
+        self._shingles: Dict[str, FrozenSet[str]] = {}
+        self._keys: Dict[str, List[Tuple[int, ...]]] = {}
+        self._buckets: List[Dict[Tuple[int, ...], Set[str]]] = [defaultdict(set) for _ in range(self.bands)]
+
+    @classmethod
+    def from_catalog(cls, catalog: Optional[Catalog] = None, **kwargs: Any) -> "SimilarityIndex":
+        """Index the text of every template in ``catalog``."""
+        catalog = catalog if catalog is not None else default_catalog()
+        index = cls(**kwargs)
+        for template_id in catalog.ids():
+            index.add(template_id, template_text(catalog.template(template_id)))
+        return index
+
+    def __len__(self) -> int:
+        return len(self._shingles)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._shingles
+
+    def signature(self, shingle_set: Iterable[str]) -> List[int]:
+        """MinHash signature: per slot, the least of the shingles' hash values.
+
+        One SHAKE-128 call gives every slot's 32-bit hash of a shingle, and
+        the minimum is taken slot-wise across shingles in C.
+        """
+        size = 4 * self.num_perm
+        rows = [array("I", hashlib.shake_128(self._salt + s.encode("utf-8")).digest(size)) for s in shingle_set]
+        if len(rows) == 1:
+            return list(rows[0])
+        return list(map(min, *rows)) if rows else [0] * self.num_perm
+
+    def _band_keys(self, shingle_set: FrozenSet[str]) -> List[Tuple[int, ...]]:
+        signature, rows = self.signature(shingle_set), self.rows
+        return [tuple(signature[band * rows : (band + 1) * rows]) for band in range(self.bands)]
+
+    def add(self, key: str, text: str) -> None:
+        """Index ``text`` under ``key``, replacing any text already there."""
+        if key in self._shingles:
+            self.remove(key)
+        shingle_set = shingles(text, self.shingle_size)
+        band_keys = self._band_keys(shingle_set)
+        self._shingles[key] = shingle_set
+        self._keys[key] = band_keys
+        for buckets, band_key in zip(self._buckets, band_keys, strict=True):
+            buckets[band_key].add(key)
+
+    def remove(self, key: str) -> None:
+        del self._shingles[key]
+        for buckets, band_key in zip(self._buckets, self._keys.pop(key), strict=True):
+            bucket = buckets[band_key]
+            bucket.discard(key)
+            if not bucket:
+                del buckets[band_key]
+
+    def _confirm(self, shingle_set: FrozenSet[str], candidates: Iterable[str]) -> List[Match]:
+        matches = []
+        for candidate in candidates:
+            similarity = jaccard(shingle_set, self._shingles[candidate])
+            if similarity >= self.threshold:
+                matches.append(Match(candidate, similarity))
+        matches.sort(key=lambda m: (-m.similarity, m.id))
+        return matches
+
+    def query(self, text: str, exclude: Iterable[str] = ()) -> List[Match]:
+        """Indexed texts near-duplicating ``text``, most similar first."""
+        shingle_set = shingles(text, self.shingle_size)
+        candidates: Set[str] = set()
+        for buckets, band_key in zip(self._buckets, self._band_keys(shingle_set), strict=True):
+            candidates.update(buckets.get(band_key, ()))
+        return self._confirm(shingle_set, candidates.difference(exclude))
+
+    def similar_to(self, key: str) -> List[Match]:
+        """Other indexed texts near-duplicating the one under ``key``."""
+        candidates: Set[str] = set()
+        for buckets, band_key in zip(self._buckets, self._keys[key], strict=True):
+            candidates.update(buckets[band_key])
+        candidates.discard(key)
+        return self._confirm(self._shingles[key], candidates)
+
+    def pairs(self) -> List[Tuple[str, str, float]]:
+        """Every near-duplicate pair ``(a, b, similarity)`` with ``a < b``."""
+        seen: Set[Tuple[str, str]] = set()
+        found = []
+        for buckets in self._buckets:
+            for bucket in buckets.values():
+                if len(bucket) < 2:
+                    continue
+                members = sorted(bucket)
+                for i, a in enumerate(members):
+                    for b in members[i + 1 :]:
+                        if (a, b) in seen:
+                            continue
+                        seen.add((a, b))
+                        similarity = jaccard(self._shingles[a], self._shingles[b])
+                        if similarity >= self.threshold:
+                            found.append((a, b, similarity))
+        found.sort()
+        return found
+
+    def clusters(self) -> List[List[str]]:
+        """Groups of two or more ids linked by near-duplicate pairs, largest first."""
+        groups = _DisjointSet()
+        for a, b, _ in self.pairs():
+            groups.union(a, b)
+        return sorted(groups.groups(), key=lambda group: (-len(group), group))
@@ -0,0 +1,421 @@
+"""A local stand-in for the service log API, for offline load tests.
+
+:class:`StubServer` answers ``POST /api/service_logs/v1/cluster_logs`` the
+way the real endpoint does: the body is checked against
+:data:`SERVICE_LOG_SCHEMA` (severity, service_name, cluster_uuid,
+internal_only, ...) and answered with ``201`` and the created log entry, or
+``400`` and an OCM error object. Latency, server errors, throttling (a
+request-rate limit answered with ``429`` and ``Retry-After``), random
+throttling and dropped connections can be injected, and :meth:`metrics`
+reports throughput and status counts.
+
+It is a minimal HTTP/1.1 server on asyncio streams with keep-alive, so a
+single process can serve well over 10k requests per second. ``uvloop`` is
+used when installed. The server also answers ``GET
+/api/service_logs/v1/cluster_logs`` with the most recent entries and ``GET
+/metrics`` with :meth:`metrics`.
+
+With a ``refresh_token`` it also plays Red Hat SSO: ``POST`` to
+:data:`~.auth.TOKEN_PATH` with the refresh-token grant returns an access
+token valid for ``token_ttl`` seconds, and the service log endpoint then
+requires one of those tokens, so :class:`~.auth.TokenManager` can be
+tested end to end.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs
+
+from .auth import DEFAULT_CLIENT_ID, TOKEN_PATH
+from .ratelimit import TokenBucket
+from .sender import SERVICE_LOG_PATH
+from .validate import PAYLOAD_SCHEMA, compile_schema
+
+#: Payload schema of the endpoint; the same one the sender validates against.
+SERVICE_LOG_SCHEMA = PAYLOAD_SCHEMA
+
+_REASONS = {
+    200: "OK",
+    201: "Created",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+    503: "Service Unavailable",
+    504: "Gateway Timeout",
+}
+
+
+@dataclass
+class Faults:
+    """What the stub injects; rates are probabilities per request."""
+
+    #: Seconds added to every response, plus up to ``jitter`` more.
+    latency: float = 0.0
+    jitter: float = 0.0
+    #: Share of requests answered with ``error_status``.
+    error_rate: float = 0.0
+    error_status: int = 503
+    #: Requests per second accepted before answering 429 (None: unlimited).
+    rate_limit: Optional[float] = None
+    #: Share of requests answered with 429 regardless of the rate limit.
+    throttle_rate: float = 0.0
+    #: Seconds sent in ``Retry-After`` with 429 responses (None: no header).
+    retry_after: Optional[float] = 1.0
+    #: Share of requests whose connection is closed without a response.
+    drop_rate: float = 0.0
+
+
+@dataclass
+class _Metrics:
+    started: float = field(default_factory=time.monotonic)
+    requests: int = 0
+    created: int = 0
+    statuses: Dict[int, int] = field(default_factory=dict)
+    dropped: int = 0
+    tokens_issued: int = 0
+    bytes_in: int = 0
+    #: Completed requests per whole second of ``time.monotonic()``.
+    per_second: Deque[List[int]] = field(default_factory=deque)
+
+    def count(self, status: int) -> None:
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        now = int(time.monotonic())
+        per_second = self.per_second
+        if per_second and per_second[-1][0] == now:
+            per_second[-1][1] += 1
+        else:
+            per_second.append([now, 1])
+            while per_second[0][0] < now - 60:
+                per_second.popleft()
+
+
+class StubServer:
+    """Service log API stand-in; see the module docstring.
+
+    With ``token``, requests must carry ``Authorization: Bearer <token>``.
+    With ``refresh_token``, they may instead carry an unexpired token issued
+    by the token endpoint. The last ``keep`` created entries are retained
+    for inspection in :attr:`entries`.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        faults: Optional[Faults] = None,
+        token: Optional[str] = None,
+        keep: int = 1000,
+        seed: Optional[int] = None,
+        refresh_token: Optional[str] = None,
+        token_ttl: float = 900.0,
+    ):
+        self.host = host
+        self.port = port
+        self.faults = faults if faults is not None else Faults()
+        self.token = token
+        self.refresh_token = refresh_token
+        self.token_ttl = token_ttl
+        #: Issued access token -> its expiry (``time.monotonic()``).
+        self._issued: Dict[str, float] = {}
+        self.entries: Deque[Dict[str, Any]] = deque(maxlen=keep)
+        self._validate = compile_schema(SERVICE_LOG_SCHEMA)
+        self._random = random.Random(seed)
+        self._bucket = TokenBucket(self.faults.rate_limit) if self.faults.rate_limit else None
+        self._metrics = _Metrics()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._connections: Set["asyncio.Task[None]"] = set()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        """Start listening on the running event loop."""
+        self._server = await asyncio.start_server(self._serve, self.host, self.port, backlog=1024)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._loop = asyncio.get_running_loop()
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for task in list(self._connections):
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+
+    def start_in_thread(self) -> "StubServer":
+        """Run the server on its own event loop in a daemon thread."""
+        ready = threading.Event()
+
+        def run() -> None:
+            loop = _new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            ready.set()
+            loop.run_forever()
+            loop.run_until_complete(self.close())
+            loop.close()
+
+        self._thread = threading.Thread(target=run, name="servicelog-stub", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self) -> None:
+        """Stop a server started with :meth:`start_in_thread`."""
+        if self._thread is not None and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "StubServer":
+        return self.start_in_thread()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Request counts, status counts and throughput so far."""
+        m = self._metrics
+        now = time.monotonic()
+        elapsed = max(now - m.started, 1e-9)
+        second = int(now)
+        last_10 = sum(n for s, n in list(m.per_second) if second - 10 <= s < second)
+        return {
+            "requests": m.requests,
+            "created": m.created,
+            "dropped": m.dropped,
+            "tokens_issued": m.tokens_issued,
+            "statuses": {str(k): v for k, v in sorted(m.statuses.items())},
+            "bytes_in": m.bytes_in,
+            "elapsed": round(elapsed, 3),
+            "rate": round(m.requests / elapsed, 1),
+            "rate_10s": round(last_10 / min(10.0, max(second - int(m.started), 1)), 1),
+        }
+
+    def reset_metrics(self) -> None:
+        self._metrics = _Metrics()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                method, target, headers = _parse_head(head)
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+                response = await self._handle(method, target, headers, body)
+                if response is None:
+                    return
+                writer.write(response)
+                if writer.transport.get_write_buffer_size() > 1 << 16:
+                    await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    await writer.drain()
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            return
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _handle(self, method: str, target: str, headers: Dict[str, str], body: bytes) -> Optional[bytes]:
+        m = self._metrics
+        m.requests += 1
+        m.bytes_in += len(body)
+        path = target.split("?", 1)[0]
+        if method == "GET" and path == "/metrics":
+            return self._respond(200, self.metrics())
+        if method == "POST" and path == TOKEN_PATH and self.refresh_token is not None:
+            return self._issue_token(body)
+        if path != SERVICE_LOG_PATH:
+            return self._error(404, f"no such resource: {path}")
+        if not self._authorized(headers.get("authorization", "")):
+            return self._error(401, "missing or invalid bearer token")
+        if method == "GET":
+            items = list(self.entries)[::-1]
+            return self._respond(
+                200, {"kind": "ClusterLogList", "page": 1, "size": len(items), "total": len(items), "items": items}
+            )
+        if method != "POST":
+            return self._error(405, f"method not allowed: {method}")
+
+        faults = self.faults
+        rand = self._random.random
+        if faults.latency or faults.jitter:
+            await asyncio.sleep(faults.latency + faults.jitter * rand())
+        if faults.drop_rate and rand() < faults.drop_rate:
+            m.dropped += 1
+            return None
+        if (faults.throttle_rate and rand() < faults.throttle_rate) or (
+            self._bucket is not None and not self._bucket.try_acquire()
+        ):
+            extra = () if faults.retry_after is None else (("Retry-After", f"{faults.retry_after:g}"),)
+            return self._error(429, "too many requests", extra)
+        if faults.error_rate and rand() < faults.error_rate:
+            return self._error(faults.error_status, "injected failure")
+
+        try:
+            payload = json.loads(body)
+        except ValueError as e:
+            return self._error(400, f"body is not valid JSON: {e}")
+        if not isinstance(payload, dict):
+            return self._error(400, "body must be a JSON object")
+        errors = self._validate(payload)
+        if errors:
+            return self._error(400, "; ".join(errors))
+        m.created += 1
+        entry = _log_entry(m.created, payload)
+        self.entries.append(entry)
+        return self._respond(201, entry)
+
+    def _authorized(self, authorization: str) -> bool:
+        if self.token is None and self.refresh_token is None:
+            return True
+        scheme, _, value = authorization.partition(" ")
+        if scheme != "Bearer":
+            return False
+        if value == self.token:
+            return True
+        expires = self._issued.get(value)
+        return expires is not None and expires > time.monotonic()
+
+    def _issue_token(self, body: bytes) -> bytes:
+        form = {name: values[0] for name, values in parse_qs(body.decode("utf-8", "replace")).items()}
+        if form.get("grant_type") != "refresh_token":
+            return self._oauth_error("unsupported_grant_type", "only the refresh_token grant is supported")
+        if form.get("client_id") != DEFAULT_CLIENT_ID:
+            return self._oauth_error("invalid_client", "unknown client")
+        if form.get("refresh_token") != self.refresh_token:
+            return self._oauth_error("invalid_grant", "invalid refresh token")
+        now = time.monotonic()
+        self._issued = {value: expires for value, expires in self._issued.items() if expires > now}
+        self._metrics.tokens_issued += 1
+        access_token = f"stub-{self._metrics.tokens_issued}-{self._random.getrandbits(64):016x}"
+        self._issued[access_token] = now + self.token_ttl
+        return self._respond(
+            200,
+            {
+                "access_token": access_token,
+                "expires_in": self.token_ttl,
+                "refresh_expires_in": 0,
+                "refresh_token": self.refresh_token,
+                "token_type": "Bearer",
+                "scope": "openid offline_access",
+            },
+        )
+
+    def _oauth_error(self, error: str, description: str) -> bytes:
+        return self._respond(400, {"error": error, "error_description": description})
+
+    def _respond(self, status: int, obj: Any, extra: Tuple[Tuple[str, str], ...] = ()) -> bytes:
+        self._metrics.count(status)
+        body = json.dumps(obj, separators=(",", ":")).encode("utf-8")
+        head = f"HTTP/1.1 {status} {_REASONS.get(status, 'Unknown')}\r\nContent-Type: application/json\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in extra)
+        head += f"Content-Length: {len(body)}\r\n\r\n"
+        return head.encode("latin-1") + body
+
+    def _error(self, status: int, reason: str, extra: Tuple[Tuple[str, str], ...] = ()) -> bytes:
+        return self._respond(
+            status,
+            {
+                "kind": "Error",
+                "id": str(status),
+                "href": f"/api/service_logs/v1/errors/{status}",
+                "code": f"SERVICE-LOGS-{status}",
+                "reason": reason,
+            },
+            extra,
+        )
+
+
+def run_stub_server(server: StubServer, stats: Optional[float] = None) -> None:
+    """Serve until interrupted, printing :meth:`StubServer.metrics` every ``stats`` seconds."""
+
+    async def report() -> None:
+        while True:
+            await asyncio.sleep(stats)
+            print(json.dumps(server.metrics()), file=sys.stderr, flush=True)
+
+    async def main() -> None:
+        await server.start()
+        print(f"serving {server.url}{SERVICE_LOG_PATH}", file=sys.stderr, flush=True)
+        reporter = asyncio.ensure_future(report()) if stats else None
+        try:
+            await server.serve_forever()
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+
+    loop = _new_event_loop()
+    try:
+        loop.run_until_complete(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.close())
+        loop.close()
+
+
+def _parse_head(head: bytes) -> Tuple[str, str, Dict[str, str]]:
+    lines = head.decode("latin-1").split("\r\n")
+    method, target, _ = lines[0].split(" ", 2)
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    return method, target, headers
+
+
+def _log_entry(serial: int, payload: Dict[str, Any]) -> Dict[str, Any]:
+    entry_id = f"{serial:027x}"
+    now = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+    entry = {
+        "kind": "ClusterLog",
+        "id": entry_id,
+        "href": f"{SERVICE_LOG_PATH}/{entry_id}",
+        "created_at": now,
+        "timestamp": now,
+        "internal_only": False,
+        "log_type": "clustermgmt",
+        "service_name": "",
+        "username": "service-account-stub",
+    }
+    entry.update(payload)
+    return entry
+
+
+def _new_event_loop() -> asyncio.AbstractEventLoop:
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.new_event_loop()
+    return uvloop.new_event_loop()
@@ -0,0 +1,114 @@
+"""Suppression of repeated sends.
+
+A send is identified by a hash of (cluster UUID, template id, rendered
+description). A suppressor remembers the hashes it has let through for a
+time window and turns away repeats inside it, so a flapping incident does
+not post the same notice to the same cluster over and over.
+
+:class:`MemorySuppressor` is a bounded in-process TTL/LRU cache;
+:class:`SqliteSuppressor` keeps the window in a SQLite file that several
+sending processes can share.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Union
+
+#: Default suppression window, in seconds.
+DEFAULT_WINDOW = 3600.0
+
+
+def send_key(cluster_uuid: str, template_id: str, description: str) -> bytes:
+    """The identity of a send, as a 16-byte digest."""
+    data = "\0".join((cluster_uuid, template_id, description)).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class MemorySuppressor:
+    """In-process suppression window holding at most ``maxsize`` keys.
+
+    When full, the least recently admitted key is evicted first.
+    """
+
+    def __init__(self, window: float = DEFAULT_WINDOW, maxsize: int = 100_000):
+        self.window = window
+        self.maxsize = maxsize
+        self._expires: "OrderedDict[bytes, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def admit(self, key: bytes) -> bool:
+        """Record ``key`` and return True, unless it was admitted within the window."""
+        now = time.monotonic()
+        with self._lock:
+            expires = self._expires.get(key)
+            if expires is not None and expires > now:
+                return False
+            self._expires[key] = now + self.window
+            self._expires.move_to_end(key)
+            while len(self._expires) > self.maxsize:
+                self._expires.popitem(last=False)
+            return True
+
+    def forget(self, key: bytes) -> None:
+        """Drop ``key`` so the send can be retried, e.g. after it failed."""
+        with self._lock:
+            self._expires.pop(key, None)
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteSuppressor:
+    """Suppression window stored in SQLite, shared by every process using ``path``."""
+
+    def __init__(self, path: Union[str, Path], window: float = DEFAULT_WINDOW):
+        self.path = Path(path)
+        self.window = window
+        self._db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS suppress (key BLOB PRIMARY KEY, expires REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS suppress_expires ON suppress (expires)")
+        self._lock = threading.Lock()
+        self._admitted = 0
+
+    def admit(self, key: bytes) -> bool:
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM suppress WHERE key = ? AND expires <= ?", (key, now))
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO suppress (key, expires) VALUES (?, ?)", (key, now + self.window)
+                )
+                admitted = cursor.rowcount == 1
+                self._admitted += admitted
+                if admitted and self._admitted % 10_000 == 0:
+                    self._db.execute("DELETE FROM suppress WHERE expires <= ?", (now,))
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+        return admitted
+
+    def forget(self, key: bytes) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM suppress WHERE key = ?", (key,))
+
+    def close(self) -> None:
+        self._db.close()
+
+
+Suppressor = Union[MemorySuppressor, SqliteSuppressor]
+
+
+def open_suppressor(path: Optional[Union[str, Path]] = None, window: float = DEFAULT_WINDOW) -> Suppressor:
+    """A shared on-disk suppressor if ``path`` is given, else an in-memory one."""
+    if path is None:
+        return MemorySuppressor(window)
+    return SqliteSuppressor(path, window)
@@ -0,0 +1,307 @@
+"""Seeded synthetic cluster inventories for load tests and benchmarks.
+
+:func:`generate` streams cluster records shaped like OCM's, carrying the
+fields the ``cluster/`` fragments query (``cloud_provider.id``,
+``region.id``, ``ccs.enabled``, ``aws.private_link``, ``state``,
+``status.state``, ``managed``, ``version.id``). The same seed and
+:class:`FleetSpec` always produce the same records, so an inventory of any
+size can be regenerated instead of stored.
+
+:func:`write_fleet` writes them as JSON lines natively, or as Arrow IPC
+(``.arrow``/``.feather``) or Parquet with ``pyarrow``, in the shapes
+:func:`~.selector.iter_inventory` reads back.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+import sys
+from bisect import bisect
+from dataclasses import dataclass, field, fields
+from itertools import accumulate, islice
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, TextIO, Tuple, Union
+
+#: Records per Arrow record batch / Parquet row group.
+BATCH_SIZE = 65_536
+
+
+class FleetSpecError(ValueError):
+    """Raised for an invalid fleet spec or an unsupported output format."""
+
+
+@dataclass
+class FleetSpec:
+    """Distributions for :func:`generate`.
+
+    Mappings are relative weights; ``*_rate`` fields are probabilities.
+    """
+
+    providers: Dict[str, float] = field(default_factory=lambda: {"aws": 75, "gcp": 25})
+    regions: Dict[str, Dict[str, float]] = field(
+        default_factory=lambda: {
+            "aws": {
+                "us-east-1": 40,
+                "us-west-2": 20,
+                "eu-west-1": 15,
+                "eu-central-1": 10,
+                "ap-southeast-1": 8,
+                "ap-northeast-1": 7,
+            },
+            "gcp": {"us-east1": 40, "us-central1": 25, "europe-west1": 20, "asia-southeast1": 15},
+        }
+    )
+    states: Dict[str, float] = field(
+        default_factory=lambda: {"ready": 92, "installing": 3, "error": 2, "hibernating": 2, "uninstalling": 1}
+    )
+    #: Minor version -> weight; patch levels are uniform up to ``max_patch``.
+    versions: Dict[str, float] = field(
+        default_factory=lambda: {"4.12": 10, "4.13": 15, "4.14": 25, "4.15": 30, "4.16": 20}
+    )
+    max_patch: int = 40
+    #: Share of clusters on a release candidate of their minor version.
+    candidate_rate: float = 0.01
+    ccs_rate: float = 0.3
+    #: Share of AWS clusters using PrivateLink.
+    private_link_rate: float = 0.1
+    managed_rate: float = 0.97
+    #: Share of clusters whose status reports ``unknown`` instead of their state.
+    unknown_status_rate: float = 0.005
+
+    @classmethod
+    def from_json(cls, data: Mapping[str, Any]) -> "FleetSpec":
+        """Defaults overridden by the keys of ``data``."""
+        known = {f.name for f in fields(cls)}
+        unknown = sorted(set(data) - known)
+        if unknown:
+            raise FleetSpecError(f"unknown fleet spec keys: {', '.join(unknown)}")
+        spec = cls(**data)
+        spec.check()
+        return spec
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "FleetSpec":
+        with open(path, encoding="utf-8") as f:
+            return cls.from_json(json.load(f))
+
+    def check(self) -> None:
+        for name in ("providers", "states", "versions"):
+            _weights(name, getattr(self, name))
+        for provider in self.providers:
+            if provider not in self.regions:
+                raise FleetSpecError(f"no regions for provider {provider!r}")
+            _weights(f"regions.{provider}", self.regions[provider])
+        for f in fields(self):
+            if f.name.endswith("_rate") and not 0 <= getattr(self, f.name) <= 1:
+                raise FleetSpecError(f"{f.name} must be between 0 and 1")
+        if self.max_patch < 0:
+            raise FleetSpecError("max_patch must not be negative")
+
+
+def _weights(name: str, weights: Mapping[str, float]) -> None:
+    if not weights or any(w < 0 for w in weights.values()) or not sum(weights.values()):
+        raise FleetSpecError(f"{name} needs at least one positive weight and none negative")
+
+
+class _Choice:
+    """Weighted choice with precomputed cumulative weights."""
+
+    def __init__(self, weights: Mapping[str, float]):
+        self.values: Sequence[str] = list(weights)
+        self.cumulative: List[float] = list(accumulate(weights.values()))
+        self.total = self.cumulative[-1]
+
+    def __call__(self, rng: random.Random) -> str:
+        return self.values[bisect(self.cumulative, rng.random() * self.total)]
+
+
+#: UUID version 4 and RFC 4122 variant bits, and the mask clearing them.
+_UUID4_BITS = 4 << 76 | 0x8000 << 48
+_UUID4_MASK = ~(0xF000 << 64 | 0xC000 << 48)
+
+# A row: (index, id, external_id, provider, region, ccs, private_link, state,
+# status, managed, minor, patch, candidate suffix).
+_Row = Tuple[int, str, str, str, str, bool, bool, str, str, bool, str, int, str]
+
+
+def _rows(count: Optional[int], spec: FleetSpec, seed: int) -> Iterator[_Row]:
+    """The random draws behind :func:`generate`, as tuples."""
+    spec.check()
+    rng = random.Random(seed)
+    rand = rng.random
+    bits = rng.getrandbits
+    provider_of = _Choice(spec.providers)
+    region_of = {provider: _Choice(regions) for provider, regions in spec.regions.items()}
+    state_of = _Choice(spec.states)
+    minor_of = _Choice(spec.versions)
+    patches = spec.max_patch + 1
+    index = 0
+    while count is None or index < count:
+        provider = provider_of(rng)
+        state = state_of(rng)
+        minor = minor_of(rng)
+        patch = int(rand() * patches)
+        candidate = f"-rc.{int(rand() * 6)}-candidate" if rand() < spec.candidate_rate else ""
+        cluster_id = f"{bits(128):032x}"
+        h = f"{bits(128) & _UUID4_MASK | _UUID4_BITS:032x}"
+        yield (
+            index,
+            cluster_id,
+            f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}",
+            provider,
+            region_of[provider](rng),
+            rand() < spec.ccs_rate,
+            provider == "aws" and rand() < spec.private_link_rate,
+            state,
+            "unknown" if rand() < spec.unknown_status_rate else state,
+            rand() < spec.managed_rate,
+            minor,
+            patch,
+            candidate,
+        )
+        index += 1
+
+
+def generate(
+    count: Optional[int] = None, spec: Optional[FleetSpec] = None, seed: int = 0
+) -> Iterator[Dict[str, Any]]:
+    """Yield ``count`` cluster records (endlessly if ``count`` is None)."""
+    spec = spec if spec is not None else FleetSpec()
+    for (
+        index,
+        cluster_id,
+        external_id,
+        provider,
+        region,
+        ccs,
+        private_link,
+        state,
+        status,
+        managed,
+        minor,
+        patch,
+        candidate,
+    ) in _rows(count, spec, seed):
+        yield {
+            "id": cluster_id,
+            "external_id": external_id,
+            "name": f"synthetic-{index}",
+            "cloud_provider": {"id": provider},
+            "region": {"id": region},
+            "ccs": {"enabled": ccs},
+            "aws": {"private_link": private_link},
+            "state": state,
+            "status": {"state": status},
+            "managed": managed,
+            "version": {"id": f"openshift-v{minor}.{patch}{candidate}"},
+        }
+
+
+def _write_jsonl(count: int, spec: FleetSpec, seed: int, out: TextIO) -> int:
+    """Write :func:`generate`'s records as compact JSON lines without building dicts.
+
+    Values drawn from the spec are JSON-encoded once up front; the rest are
+    hex digits, digits and fixed text, which need no escaping.
+    """
+    encoded: Dict[str, str] = {}
+
+    def enc(value: str) -> str:
+        text = encoded.get(value)
+        if text is None:
+            text = encoded[value] = json.dumps(value)
+        return text
+
+    booleans = ("false", "true")
+    written = 0
+    rows = _rows(count, spec, seed)
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            return written
+        out.write(
+            "".join(
+                f'{{"id":"{cluster_id}","external_id":"{external_id}","name":"synthetic-{index}",'
+                f'"cloud_provider":{{"id":{enc(provider)}}},"region":{{"id":{enc(region)}}},'
+                f'"ccs":{{"enabled":{booleans[ccs]}}},"aws":{{"private_link":{booleans[private_link]}}},'
+                f'"state":{enc(state)},"status":{{"state":{enc(status)}}},"managed":{booleans[managed]},'
+                f'"version":{{"id":{enc("openshift-v" + minor)[:-1]}.{patch}{candidate}"}}}}\n'
+                for (
+                    index,
+                    cluster_id,
+                    external_id,
+                    provider,
+                    region,
+                    ccs,
+                    private_link,
+                    state,
+                    status,
+                    managed,
+                    minor,
+                    patch,
+                    candidate,
+                ) in batch
+            )
+        )
+        written += len(batch)
+
+
+def _arrow_schema(pa):
+    text = pa.string()
+    return pa.schema(
+        [
+            ("id", text),
+            ("external_id", text),
+            ("name", text),
+            ("cloud_provider", pa.struct([("id", text)])),
+            ("region", pa.struct([("id", text)])),
+            ("ccs", pa.struct([("enabled", pa.bool_())])),
+            ("aws", pa.struct([("private_link", pa.bool_())])),
+            ("state", text),
+            ("status", pa.struct([("state", text)])),
+            ("managed", pa.bool_()),
+            ("version", pa.struct([("id", text)])),
+        ]
+    )
+
+
+def _write_arrow(records: Iterator[Dict[str, Any]], path: Path) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as parquet
+    except ImportError:
+        raise FleetSpecError(f"writing {path.suffix} inventories requires pyarrow") from None
+    schema = _arrow_schema(pa)
+    if path.suffix == ".parquet":
+        writer = parquet.ParquetWriter(str(path), schema)
+    else:
+        writer = pa.ipc.new_file(str(path), schema)
+    written = 0
+    with writer:
+        while True:
+            batch = list(islice(records, BATCH_SIZE))
+            if not batch:
+                return written
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            written += len(batch)
+
+
+def write_fleet(
+    path: Union[str, Path],
+    count: int,
+    spec: Optional[FleetSpec] = None,
+    seed: int = 0,
+) -> int:
+    """Write ``count`` generated clusters to ``path`` (``-`` for stdout); return the count.
+
+    The format follows the suffix: ``.parquet``, ``.arrow``/``.feather``, or
+    JSON lines for anything else.
+    """
+    spec = spec if spec is not None else FleetSpec()
+    if str(path) == "-":
+        return _write_jsonl(count, spec, seed, sys.stdout)
+    path = Path(path)
+    if path.suffix in (".arrow", ".feather", ".parquet"):
+        return _write_arrow(generate(count, spec, seed), path)
+    with path.open("w", encoding="utf-8") as f:
+        return _write_jsonl(count, spec, seed, f)
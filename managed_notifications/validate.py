@@ -0,0 +1,139 @@
+"""Schema validation for templates and rendered payloads.
+
+A schema is a small declaration of fields, their types and allowed values.
+:func:`compile_schema` turns it into the source of a straight-line Python
+function, executed once, so validating a document is a handful of dict
+lookups and type checks with no per-document schema interpretation. That
+keeps it cheap enough to run on every payload in the bulk send path.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from .catalog import PLACEHOLDER_RE, Catalog, default_catalog
+
+#: Severities accepted by the service log API.
+SEVERITIES = ("Info", "Warning", "Error")
+
+Validator = Callable[[Any], List[str]]
+
+
+class ValidationError(ValueError):
+    """Raised when a document does not match its schema."""
+
+    def __init__(self, errors: List[str]):
+        self.errors = errors
+        super().__init__("; ".join(errors))
+
+
+@dataclass(frozen=True)
+class FieldSpec:
+    type: type
+    required: bool = True
+    choices: Optional[Tuple[str, ...]] = None
+    nonempty: bool = False
+
+
+@dataclass(frozen=True)
+class Schema:
+    fields: Dict[str, FieldSpec] = field(default_factory=dict)
+    #: Whether ``${NAME}`` placeholders may remain in string fields.
+    placeholders: bool = False
+    #: Whether fields not listed in ``fields`` are rejected.
+    closed: bool = True
+
+
+_COMMON_FIELDS = {
+    "severity": FieldSpec(str, choices=SEVERITIES),
+    "service_name": FieldSpec(str, nonempty=True),
+    "cluster_uuid": FieldSpec(str, nonempty=True),
+    "summary": FieldSpec(str, nonempty=True),
+    "description": FieldSpec(str, nonempty=True),
+    "internal_only": FieldSpec(bool),
+    "event_stream_id": FieldSpec(str, required=False, nonempty=True),
+    # Accepted by the service log API but not used by the templates so far.
+    "log_type": FieldSpec(str, required=False, nonempty=True),
+    "doc_references": FieldSpec(list, required=False),
+    "username": FieldSpec(str, required=False),
+}
+
+#: Schema for the JSON files under ``osd/`` and ``ocm/``.
+TEMPLATE_SCHEMA = Schema(dict(_COMMON_FIELDS), placeholders=True)
+
+#: Schema for rendered payloads about to be posted; ``internal_only`` defaults to false.
+PAYLOAD_SCHEMA = Schema({**_COMMON_FIELDS, "internal_only": FieldSpec(bool, required=False)})
+
+_TYPE_NAMES = {str: "a string", bool: "a boolean", int: "an integer"}
+
+
+def compile_schema(schema: Schema) -> Validator:
+    """Generate and compile a validation function for ``schema``.
+
+    The function returns a list of error messages, empty when valid.
+    """
+    names: Dict[str, Any] = {"MISSING": object(), "PLACEHOLDER": PLACEHOLDER_RE.search}
+    lines = [
+        "def validate(doc):",
+        "    if type(doc) is not dict:",
+        "        return ['document must be a JSON object']",
+        "    errors = []",
+    ]
+    for i, (name, spec) in enumerate(schema.fields.items()):
+        type_name = f"T{i}"
+        names[type_name] = spec.type
+        lines.append(f"    v = doc.get({name!r}, MISSING)")
+        lines.append("    if v is MISSING:")
+        if spec.required:
+            lines.append(f"        errors.append({f'missing required field {name!r}'!r})")
+        else:
+            lines.append("        pass")
+        lines.append(f"    elif type(v) is not {type_name}:")
+        type_desc = _TYPE_NAMES.get(spec.type, spec.type.__name__)
+        lines.append(f"        errors.append({f'{name!r} must be {type_desc}'!r})")
+        if spec.choices is not None:
+            choices = f"C{i}"
+            names[choices] = frozenset(spec.choices)
+            lines.append(f"    elif v not in {choices}:")
+            message = f"{name!r} must be one of {', '.join(spec.choices)}, got "
+            lines.append(f"        errors.append({message!r} + repr(v))")
+        if spec.nonempty:
+            lines.append("    elif not v.strip():")
+            lines.append(f"        errors.append({f'{name!r} must not be empty'!r})")
+        if spec.type is str and not schema.placeholders:
+            lines.append("    elif '${' in v and PLACEHOLDER(v):")
+            message = f"{name!r} has unresolved placeholder "
+            lines.append(f"        errors.append({message!r} + PLACEHOLDER(v).group(0))")
+    if schema.closed:
+        names["KNOWN"] = frozenset(schema.fields)
+        lines.append("    if not KNOWN.issuperset(doc):")
+        lines.append("        errors.append('unknown fields: ' + ', '.join(sorted(set(doc) - KNOWN)))")
+    lines.append("    return errors")
+    exec(compile("\n".join(lines), "<schema>", "exec"), names)
+    return names["validate"]
+
+
+validate_template: Validator = compile_schema(TEMPLATE_SCHEMA)
+validate_payload: Validator = compile_schema(PAYLOAD_SCHEMA)
+
+
+def check_payload(payload: Mapping[str, Any]) -> None:
+    """Raise :class:`ValidationError` if ``payload`` is not ready to post."""
+    errors = validate_payload(payload)
+    if errors:
+        raise ValidationError(errors)
+
+
+def validate_catalog(
+    catalog: Optional[Catalog] = None, ids: Optional[Iterable[str]] = None
+) -> Dict[str, List[str]]:
+    """Validate every template, or only ``ids``; returns the errors of each failing template."""
+    catalog = catalog if catalog is not None else default_catalog()
+    entries = catalog if ids is None else [catalog.entry(template_id) for template_id in ids]
+    failures: Dict[str, List[str]] = {}
+    for entry in entries:
+        errors = validate_template(catalog.template(entry.id))
+        if errors:
+            failures[entry.id] = errors
+    return failures
@@ -0,0 +1,65 @@
+"""OpenShift version ids as sortable integer keys.
+
+OCM version ids look like ``openshift-v4.10.3``,
+``openshift-v4.11.0-rc.2-candidate``, ``4.14.0-0.nightly-2023-06-01-123456``
+or plain ``4.9.12``. Comparing them as
+strings gets ``4.10`` vs ``4.9`` wrong, so the ordering operators of the
+``clusterVersion*`` fragments compare :func:`version_key` values instead.
+
+A key packs major (12 bits), minor (12 bits), patch (16 bits), release stage
+(4 bits) and pre-release number (12 bits) into one integer, so that
+``4.11.0-0.nightly-... < 4.11.0-ec.1 < 4.11.0-fc.0 < 4.11.0-rc.3 < 4.11.0 <
+4.11.1``. Nightly, CI and OKD builds of a version all share one key.
+"""
+
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import Optional
+
+#: Fields holding OpenShift version ids.
+VERSION_FIELDS = frozenset({"version.id", "version.raw_id", "openshift_version"})
+
+#: Release stages in increasing order; a GA release sorts after all of them.
+STAGES = {"ec": 1, "fc": 2, "rc": 3}
+#: Stage of ``-0.nightly-*``, ``-0.ci-*`` and ``-0.okd-*`` builds.
+BUILD_STAGE = 0
+GA_STAGE = 15
+
+_VERSION_RE = re.compile(
+    r"""
+    (?:openshift-)?v?
+    (?P<major>\d+)\.(?P<minor>\d+)(?:\.(?P<patch>\d+))?
+    (?:-(?P<stage>ec|fc|rc)\.(?P<pre>\d+)
+      |-0\.(?P<build>nightly|ci|okd)(?:-[A-Za-z0-9.]+)*)?
+    (?:-[A-Za-z0-9.]+)?   # channel group suffix such as -candidate
+    """,
+    re.VERBOSE | re.IGNORECASE,
+)
+
+
+def pack(major: int, minor: int, patch: int = 0, stage: int = GA_STAGE, pre: int = 0) -> int:
+    return ((((major << 12 | minor) << 16 | patch) << 4 | stage) << 12) | pre
+
+
+@lru_cache(maxsize=4096)
+def version_key(text: str) -> Optional[int]:
+    """Return the packed sort key for a version id, or ``None`` if it does not parse."""
+    match = _VERSION_RE.fullmatch(text.strip())
+    if match is None:
+        return None
+    major, minor = int(match["major"]), int(match["minor"])
+    patch = int(match["patch"] or 0)
+    if match["build"]:
+        stage = BUILD_STAGE
+    else:
+        stage = STAGES[match["stage"].lower()] if match["stage"] else GA_STAGE
+    pre = int(match["pre"] or 0)
+    if major >= 1 << 12 or minor >= 1 << 12 or patch >= 1 << 16 or pre >= 1 << 12:
+        return None
+    return pack(major, minor, patch, stage, pre)
+
+
+def is_version_field(field: str) -> bool:
+    return field in VERSION_FIELDS
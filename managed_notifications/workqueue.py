@@ -0,0 +1,390 @@
+"""Durable queue of rendered notifications, between rendering and posting.
+
+Alert-triggered renders are put on a :class:`WorkQueue`, a SQLite file in
+WAL mode, and posted by :func:`drain` in the same or another process, so a
+restart of either side loses nothing that was queued. Puts are buffered and
+committed in batches (every ``batch_size`` messages, after at most
+``flush_interval`` seconds, on :meth:`~WorkQueue.flush` and on
+:meth:`~WorkQueue.close`), so producers absorb a burst of alerts at memory
+speed while consumers post at the API's pace::
+
+    with WorkQueue("notifications.db") as queue:
+        queue.put(payload, template_id="osd/unknown_failure")
+
+    with WorkQueue("notifications.db") as queue, BulkSender(token=token) as sender:
+        for result in drain(queue, sender, follow=True):
+            ...
+
+Consumers take messages in batches with :meth:`~WorkQueue.get`. A message
+taken is hidden from other consumers for ``visibility_timeout`` seconds;
+:meth:`~WorkQueue.ack` deletes it once it was posted, and a message that is
+not acknowledged in time (its consumer crashed or hung) becomes visible
+again and is delivered anew. Delivery is therefore at least once: a
+consumer that dies between posting and acknowledging causes one repeat,
+which a suppressor (see :mod:`.suppress`) can catch.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+
+from .render import Params
+from .sender import RETRY_STATUSES, BulkSender, SendResult, WorkItem
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    queue TEXT NOT NULL,
+    visible_at REAL NOT NULL,
+    enqueued_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    receipt INTEGER,
+    cluster_uuid TEXT NOT NULL,
+    template_id TEXT NOT NULL,
+    params TEXT,
+    body BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_visible ON messages (queue, visible_at, id);
+"""
+
+#: Seconds a message taken by a consumer stays hidden from the others.
+DEFAULT_VISIBILITY_TIMEOUT = 300.0
+
+#: Longest pause between polls of an empty queue.
+MAX_POLL_INTERVAL = 0.5
+
+
+@dataclass(frozen=True)
+class Message:
+    """One delivery of a queued payload."""
+
+    id: int
+    #: Identifies this delivery; acknowledging a stale delivery does nothing.
+    receipt: int
+    cluster_uuid: str
+    template_id: str
+    body: bytes
+    params: Optional[Params]
+    #: Deliveries so far, including this one.
+    attempts: int
+    enqueued_at: float
+
+    def payload(self) -> Dict[str, Any]:
+        return json.loads(self.body)
+
+
+@dataclass(frozen=True)
+class QueueStats:
+    #: Messages waiting to be taken.
+    ready: int
+    #: Messages taken and not acknowledged yet.
+    in_flight: int
+    #: Messages put back with a delay, waiting for it to pass.
+    delayed: int
+    #: Seconds since the oldest message was put, or 0 if the queue is empty.
+    oldest_age: float
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "in_flight": self.in_flight,
+            "delayed": self.delayed,
+            "oldest_age": round(self.oldest_age, 3),
+        }
+
+
+class WorkQueue:
+    """SQLite-backed message queue; safe to share between threads and processes.
+
+    Several named queues may share one file; ``name`` picks the one this
+    instance puts to and takes from.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        name: str = "default",
+        visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT,
+        batch_size: int = 500,
+        flush_interval: float = 0.05,
+    ):
+        self.path = Path(path)
+        self.name = name
+        self.visibility_timeout = visibility_timeout
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[Any, ...]] = []
+        self._timer: Optional[threading.Timer] = None
+
+    def __enter__(self) -> "WorkQueue":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def put(
+        self,
+        payload: Union[Mapping[str, Any], bytes],
+        template_id: str = "",
+        cluster_uuid: Optional[str] = None,
+        params: Optional[Params] = None,
+        delay: float = 0.0,
+    ) -> None:
+        """Queue a rendered payload (a dict, or JSON bytes) for posting.
+
+        ``cluster_uuid`` defaults to the payload's ``cluster_uuid``. The
+        message can be taken once ``delay`` seconds have passed.
+        """
+        if isinstance(payload, bytes):
+            body = payload
+            if cluster_uuid is None:
+                cluster_uuid = json.loads(body).get("cluster_uuid", "")
+        else:
+            body = json.dumps(payload).encode("utf-8")
+            if cluster_uuid is None:
+                cluster_uuid = payload.get("cluster_uuid", "")
+        now = time.time()
+        row = (
+            self.name,
+            now + delay,
+            now,
+            cluster_uuid,
+            template_id,
+            None if params is None else json.dumps({k: str(v) for k, v in params.items()}, sort_keys=True),
+            body,
+        )
+        with self._lock:
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def put_many(self, payloads: Iterable[Union[Mapping[str, Any], bytes]], template_id: str = "") -> int:
+        """Queue several payloads of one template and commit them; returns how many."""
+        count = 0
+        for payload in payloads:
+            self.put(payload, template_id)
+            count += 1
+        self.flush()
+        return count
+
+    def flush(self) -> None:
+        """Commit buffered puts."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        if not self._pending:
+            return
+        self._db.execute("BEGIN")
+        try:
+            self._db.executemany(
+                "INSERT INTO messages (queue, visible_at, enqueued_at, cluster_uuid, template_id, params, body)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._pending,
+            )
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+        self._pending.clear()
+
+    def get(
+        self, max_messages: int = 1, visibility_timeout: Optional[float] = None, wait: float = 0.0
+    ) -> List[Message]:
+        """Take up to ``max_messages`` visible messages, oldest first.
+
+        They stay hidden for ``visibility_timeout`` seconds (default: the
+        queue's). With ``wait``, an empty queue is polled for up to that
+        many seconds before an empty list is returned.
+        """
+        timeout = self.visibility_timeout if visibility_timeout is None else visibility_timeout
+        deadline = time.monotonic() + wait
+        interval = 0.01
+        while True:
+            messages = self._take(max_messages, timeout)
+            remaining = deadline - time.monotonic()
+            if messages or remaining <= 0:
+                return messages
+            time.sleep(min(interval, remaining))
+            interval = min(2 * interval, MAX_POLL_INTERVAL)
+
+    def _take(self, limit: int, timeout: float) -> List[Message]:
+        receipt = random.getrandbits(62)
+        with self._lock:
+            self._flush_locked()
+            now = time.time()
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT id, cluster_uuid, template_id, params, body, attempts, enqueued_at FROM messages"
+                    " WHERE queue = ? AND visible_at <= ? ORDER BY visible_at, id LIMIT ?",
+                    (self.name, now, limit),
+                ).fetchall()
+                self._db.executemany(
+                    "UPDATE messages SET visible_at = ?, attempts = attempts + 1, receipt = ? WHERE id = ?",
+                    [(now + timeout, receipt, row[0]) for row in rows],
+                )
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+        return [
+            Message(id, receipt, uuid, tid, body, None if params is None else json.loads(params), attempts + 1, at)
+            for id, uuid, tid, params, body, attempts, at in rows
+        ]
+
+    def _update(self, sql: str, rows: List[Tuple[Any, ...]]) -> int:
+        if not rows:
+            return 0
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                changed = self._db.executemany(sql, rows).rowcount
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+        return changed
+
+    def ack(self, messages: Iterable[Message]) -> int:
+        """Delete delivered messages; returns how many were still held under these deliveries."""
+        return self._update(
+            "DELETE FROM messages WHERE id = ? AND receipt = ?", [(m.id, m.receipt) for m in messages]
+        )
+
+    def nack(self, messages: Iterable[Message], delay: float = 0.0) -> int:
+        """Put delivered messages back, to be taken again after ``delay`` seconds."""
+        visible_at = time.time() + delay
+        return self._update(
+            "UPDATE messages SET visible_at = ?, receipt = NULL WHERE id = ? AND receipt = ?",
+            [(visible_at, m.id, m.receipt) for m in messages],
+        )
+
+    def extend(self, messages: Iterable[Message], visibility_timeout: Optional[float] = None) -> int:
+        """Keep delivered messages hidden for another ``visibility_timeout`` seconds from now."""
+        timeout = self.visibility_timeout if visibility_timeout is None else visibility_timeout
+        visible_at = time.time() + timeout
+        return self._update(
+            "UPDATE messages SET visible_at = ? WHERE id = ? AND receipt = ?",
+            [(visible_at, m.id, m.receipt) for m in messages],
+        )
+
+    def stats(self) -> QueueStats:
+        self.flush()
+        now = time.time()
+        with self._lock:
+            ready, in_flight, delayed, oldest = self._db.execute(
+                "SELECT count(*) FILTER (WHERE visible_at <= ?),"
+                " count(*) FILTER (WHERE visible_at > ? AND receipt IS NOT NULL),"
+                " count(*) FILTER (WHERE visible_at > ? AND receipt IS NULL),"
+                " min(enqueued_at) FROM messages WHERE queue = ?",
+                (now, now, now, self.name),
+            ).fetchone()
+        return QueueStats(ready, in_flight, delayed, now - oldest if oldest is not None else 0.0)
+
+    def __len__(self) -> int:
+        self.flush()
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM messages WHERE queue = ?", (self.name,)).fetchone()[0]
+
+    def close(self) -> None:
+        self.flush()
+        self._db.close()
+
+
+def retryable(result: SendResult) -> bool:
+    """Whether a failed post may succeed later: throttled, a server error, or no response at all."""
+    return result.status is None or result.status in RETRY_STATUSES
+
+
+def drain(
+    queue: WorkQueue,
+    sender: BulkSender,
+    follow: bool = False,
+    visibility_timeout: Optional[float] = None,
+    max_attempts: int = 10,
+    retry_delay: float = 30.0,
+    max_retry_delay: float = 900.0,
+    stop: Optional[threading.Event] = None,
+) -> Iterator[SendResult]:
+    """Post queued messages through ``sender``, yielding a result per delivery.
+
+    Messages are taken ``2 * sender.concurrency`` at a time. Posted and
+    suppressed messages are acknowledged. Failures that may succeed later
+    (see :func:`retryable`) are put back for another try after
+    ``retry_delay`` seconds, doubling per delivery up to ``max_retry_delay``,
+    until ``max_attempts`` deliveries have failed; other failures are
+    acknowledged, and stored in the sender's ``dead_letters`` if it has
+    them. A result's ``index`` is the message id.
+
+    Without ``follow`` draining stops once no message is visible; with it,
+    it keeps polling until ``stop`` is set.
+    """
+    batch_size = 2 * sender.concurrency
+    taken: Dict[int, Message] = {}
+    done: List[Message] = []
+    sequence = 0
+
+    def items() -> Iterator[Union[WorkItem, SendResult]]:
+        nonlocal sequence
+        while stop is None or not stop.is_set():
+            queue.ack(done)
+            done.clear()
+            messages = queue.get(batch_size, visibility_timeout, wait=MAX_POLL_INTERVAL if follow else 0.0)
+            if not messages and not follow:
+                return
+            for message in messages:
+                # Numbered per delivery: a message whose visibility lapsed may be taken again.
+                taken[sequence] = message
+                item = WorkItem(
+                    sequence, message.cluster_uuid, message.body, message.template_id, params=message.params
+                )
+                sequence += 1
+                if sender.suppressor is None:
+                    yield item
+                else:
+                    yield sender._admit(item, message.payload().get("description", ""))
+
+    try:
+        for result in sender.send_items(items(), dead_letter=False):
+            message = taken.pop(result.index)
+            result.index = message.id
+            if result.failed and retryable(result) and message.attempts < max_attempts:
+                delay = min(retry_delay * 2 ** (message.attempts - 1), max_retry_delay)
+                queue.nack([message], delay)
+                yield result
+                continue
+            if result.failed and sender.dead_letters is not None:
+                params = dict(message.params or {}, CLUSTER_UUID=message.cluster_uuid)
+                sender.dead_letters.record(
+                    message.cluster_uuid,
+                    message.template_id,
+                    message.body,
+                    params,
+                    result.status,
+                    result.error,
+                    message.attempts,
+                )
+            done.append(message)
+            yield result
+    finally:
+        queue.ack(done)
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from typing import Callable, Iterator, List
+
+import pytest
+
+from managed_notifications.stub_server import StubServer
+
+
+@pytest.fixture
+def stub() -> Iterator[Callable[..., StubServer]]:
+    """Start :class:`StubServer` instances in threads; they are stopped after the test."""
+    servers: List[StubServer] = []
+
+    def start(faults=None, seed: int = 1, **kwargs) -> StubServer:
+        server = StubServer(faults=faults, seed=seed, **kwargs).start_in_thread()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import pickle
+import time
+
+import pytest
+
+from managed_notifications.auth import TOKEN_PATH, AuthError, TokenManager
+from managed_notifications.sender import BulkSender
+
+OFFLINE_TOKEN = "offline-token"
+
+
+def manager(server, **kwargs) -> TokenManager:
+    kwargs.setdefault("background", False)
+    return TokenManager(OFFLINE_TOKEN, token_url=server.url + TOKEN_PATH, **kwargs)
+
+
+def test_token_is_fetched_once_and_reused(stub):
+    server = stub(refresh_token=OFFLINE_TOKEN)
+    with manager(server) as token:
+        first = token()
+        assert token() == first
+        assert token.refreshes == 1
+    assert server.metrics()["tokens_issued"] == 1
+
+
+def test_token_is_refreshed_before_it_expires(stub):
+    server = stub(refresh_token=OFFLINE_TOKEN, token_ttl=0.4)
+    with manager(server, refresh_margin=0.3) as token:
+        first = token()
+        time.sleep(0.15)
+        assert token() == first
+        time.sleep(0.1)
+        assert token() != first
+        assert token.refreshes == 2
+
+
+def test_background_refresh(stub):
+    server = stub(refresh_token=OFFLINE_TOKEN, token_ttl=0.2)
+    with manager(server, background=True) as token:
+        first = token()
+        deadline = time.monotonic() + 2.0
+        while token.refreshes < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert token.refreshes >= 2
+        assert token() != first
+
+
+def test_rejected_offline_token(stub):
+    server = stub(refresh_token="another-token")
+    with manager(server) as token, pytest.raises(AuthError, match="invalid refresh token"):
+        token()
+
+
+def test_sender_posts_with_managed_tokens(stub):
+    server = stub(refresh_token=OFFLINE_TOKEN)
+    params = [{"CLUSTER_UUID": f"00000000-0000-0000-0000-{i:012d}"} for i in range(10)]
+    with manager(server) as token, BulkSender(server.url, token=token, concurrency=4) as sender:
+        assert all(r.ok for r in sender.send("osd/aws/AWS_outage", params[:5]))
+        # Revoke every issued token: the next post is answered 401, and the
+        # sender invalidates the token and retries with a fresh one.
+        server._issued.clear()
+        results = list(sender.send("osd/aws/AWS_outage", params[5:]))
+    assert all(r.ok for r in results)
+    assert token.refreshes == 2
+    assert server.metrics()["created"] == 10
+
+
+def test_pickled_manager_shares_the_cached_token(stub, tmp_path):
+    server = stub(refresh_token=OFFLINE_TOKEN)
+    cache = tmp_path / "token.json"
+    with manager(server, cache_path=cache) as token:
+        value = token()
+        # SSO rotated the refresh token on that fetch.
+        server.refresh_token = token._refresh_token = "rotated-token"
+        with pickle.loads(pickle.dumps(token)) as copy:
+            assert copy() == value
+            assert copy.refreshes == 0
+            copy.invalidate(value)
+            assert copy.refreshes == 1
+            # The parent picks up the copy's new token from the cache.
+            token.invalidate(value)
+            assert token() == copy() != value
+        assert token.refreshes == 1
+    assert server.metrics()["tokens_issued"] == 2
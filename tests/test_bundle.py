@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from managed_notifications.bundle import Bundle, BundleError, build_bundle, bundle_digest
+from managed_notifications.catalog import default_catalog
+
+TEMPLATE = "osd/aws/AWS_outage"
+
+
+@pytest.fixture(scope="module")
+def bundle_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("bundle") / "templates.bundle"
+    build_bundle(path)
+    return path
+
+
+def test_bundle_matches_catalog(bundle_path):
+    catalog = default_catalog()
+    with Bundle(bundle_path) as bundle:
+        assert bundle.digest == bundle_digest(bundle_path)
+        assert set(bundle.names()) == {e.id for e in catalog}
+        assert bundle.template(TEMPLATE) == catalog.template(TEMPLATE)
+        assert bundle.entry(TEMPLATE).placeholders == catalog.entry(TEMPLATE).placeholders
+        with pytest.raises(KeyError):
+            bundle.raw("osd/no/such_template")
+
+
+def test_raw_outlives_close(bundle_path):
+    bundle = Bundle(bundle_path)
+    raw = bundle.raw(TEMPLATE)
+    bundle.close()
+    assert json.loads(raw) == default_catalog().template(TEMPLATE)
+
+
+def test_rebuild_keeps_unchanged_bundle(bundle_path):
+    mtime = bundle_path.stat().st_mtime_ns
+    assert build_bundle(bundle_path) == bundle_digest(bundle_path)
+    assert bundle_path.stat().st_mtime_ns == mtime
+
+
+def test_corrupt_bundle_is_rejected(tmp_path):
+    path = tmp_path / "bad.bundle"
+    path.write_bytes(b"NOTABUNDLE" + bytes(64))
+    with pytest.raises(BundleError, match="not a template bundle"):
+        Bundle(path)
+    assert bundle_digest(path) is None
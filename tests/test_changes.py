@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import json
+import subprocess
+
+import pytest
+
+from managed_notifications.changes import RevisionError, _Tree, diff_revisions
+
+BASE = {
+    "severity": "Info",
+    "service_name": "SREManualAction",
+    "cluster_uuid": "${CLUSTER_UUID}",
+    "summary": "Summary",
+    "description": "Description",
+    "internal_only": False,
+}
+
+
+def git(root, *args):
+    subprocess.run(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@example.com", *args], cwd=root, check=True, capture_output=True
+    )
+
+
+def write(root, path, template, indent=None):
+    target = root / path
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_text(json.dumps(template, indent=indent))
+
+
+@pytest.fixture
+def repo(tmp_path):
+    git(tmp_path, "init", "-q")
+    write(tmp_path, "osd/a.json", BASE)
+    write(tmp_path, "osd/b.json", dict(BASE, summary="B"))
+    write(tmp_path, "osd/c.json", dict(BASE, summary="C"))
+    write(tmp_path, "ocm/d.json", dict(BASE, summary="D"))
+    git(tmp_path, "add", ".")
+    git(tmp_path, "commit", "-q", "-m", "base")
+    return tmp_path
+
+
+def test_working_tree_changes(repo):
+    write(repo, "osd/a.json", dict(BASE, description="New ${REASON}"))
+    write(repo, "osd/b.json", dict(BASE, summary="B"), indent=2)  # reformatted only
+    (repo / "osd/c.json").rename(repo / "osd/moved.json")
+    (repo / "ocm/d.json").unlink()
+    write(repo, "osd/e.json", dict(BASE, summary="E"))
+    changes = {c.id: c for c in diff_revisions("HEAD", root=repo)}
+    assert {i: c.status for i, c in changes.items()} == {
+        "osd/e": "added",
+        "ocm/d": "removed",
+        "osd/a": "modified",
+        "osd/moved": "renamed",
+    }
+    assert changes["osd/a"].fields == ("description",)
+    assert changes["osd/a"].placeholders_added == {"REASON"}
+    assert changes["osd/moved"].old_id == "osd/c"
+
+
+def test_unchanged_working_tree_files_are_not_read(repo):
+    write(repo, "osd/a.json", dict(BASE, summary="changed"))
+    tree = _Tree(repo, None)
+    assert set(tree.blobs) == {"osd/a.json", "osd/b.json", "osd/c.json", "ocm/d.json"}
+    assert set(tree._data) == {"osd/a.json"}
+    assert tree.blobs["osd/b.json"] == _Tree(repo, "HEAD").blobs["osd/b.json"]
+
+
+def test_staged_changes_count_as_working_tree(repo):
+    write(repo, "osd/b.json", dict(BASE, summary="staged"))
+    git(repo, "add", "osd/b.json")
+    (change,) = diff_revisions("HEAD", root=repo)
+    assert (change.id, change.status, change.fields) == ("osd/b", "modified", ("summary",))
+
+
+def test_between_revisions(repo):
+    write(repo, "osd/a.json", dict(BASE, severity="Warning"))
+    git(repo, "commit", "-q", "-am", "warn")
+    (change,) = diff_revisions("HEAD~1", "HEAD", root=repo)
+    assert (change.id, change.fields) == ("osd/a", ("severity",))
+    assert diff_revisions("HEAD", "HEAD", root=repo) == []
+
+
+def test_unknown_revision(repo):
+    with pytest.raises(RevisionError):
+        diff_revisions("no-such-rev", root=repo)
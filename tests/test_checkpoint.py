@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import pytest
+
+from managed_notifications.checkpoint import Checkpoint, CheckpointError, job_id
+
+JOB = job_id("osd/aws/AWS_outage", {"REGION": "us-east-1"})
+
+
+def test_marks_survive_reopening(tmp_path):
+    path = tmp_path / "send.ckpt"
+    with Checkpoint(path, JOB) as checkpoint:
+        for index in (0, 1, 2, 5, 700):
+            checkpoint.mark(index)
+        assert checkpoint.cursor == 3
+        assert checkpoint.completed() == 5
+    with Checkpoint(path, JOB) as checkpoint:
+        assert checkpoint.cursor == 3
+        assert checkpoint.completed() == 5
+        assert [i for i in range(1000) if checkpoint.done(i)] == [0, 1, 2, 5, 700]
+
+
+def test_marking_fills_the_gap_and_advances_the_cursor(tmp_path):
+    with Checkpoint(tmp_path / "send.ckpt", JOB) as checkpoint:
+        checkpoint.mark(1)
+        checkpoint.mark(2)
+        assert checkpoint.cursor == 0
+        checkpoint.mark(0)
+        assert checkpoint.cursor == 3
+        checkpoint.mark(1)
+        assert checkpoint.completed() == 3
+
+
+def test_journal_is_replayed_without_a_clean_close(tmp_path):
+    path = tmp_path / "send.ckpt"
+    checkpoint = Checkpoint(path, JOB, compact_every=4)
+    for index in range(10):
+        checkpoint.mark(index)
+    # Killed before close: marks 8 and 9 are only in the journal.
+    assert (tmp_path / "send.ckpt.log").stat().st_size == 8
+    with Checkpoint(path, JOB) as resumed:
+        assert resumed.cursor == 10
+        assert resumed.completed() == 10
+
+
+def test_torn_journal_write_is_ignored(tmp_path):
+    path = tmp_path / "send.ckpt"
+    checkpoint = Checkpoint(path, JOB)
+    checkpoint.mark(0)
+    checkpoint.mark(3)
+    with open(tmp_path / "send.ckpt.log", "ab") as log:
+        log.write(b"\x07\x00")  # half of the index 7
+    with Checkpoint(path, JOB) as resumed:
+        assert resumed.completed() == 2
+        assert resumed.done(3) and not resumed.done(7)
+
+
+def test_resume_skips_completed_positions(tmp_path):
+    path = tmp_path / "send.ckpt"
+    inputs = list(range(20))
+    with Checkpoint(path, JOB) as checkpoint:
+        for index in inputs[:7]:
+            checkpoint.mark(index)
+        checkpoint.mark(12)
+    with Checkpoint(path, JOB) as checkpoint:
+        remaining = [i for i in inputs if not checkpoint.done(i)]
+    assert remaining == [7, 8, 9, 10, 11, *range(13, 20)]
+
+
+def test_checkpoint_of_another_job_is_rejected(tmp_path):
+    path = tmp_path / "send.ckpt"
+    Checkpoint(path, JOB).close()
+    with pytest.raises(CheckpointError, match="different template or parameters"):
+        Checkpoint(path, job_id("osd/aws/AWS_outage", {"REGION": "eu-west-1"}))
+
+
+def test_corrupt_files_are_rejected(tmp_path):
+    path = tmp_path / "send.ckpt"
+    path.write_bytes(b"MNCKPT01")
+    with pytest.raises(CheckpointError, match="truncated"):
+        Checkpoint(path, JOB)
+    path.write_bytes(b"x" * 64)
+    with pytest.raises(CheckpointError, match="not a send checkpoint"):
+        Checkpoint(path, JOB)
+    orphan = tmp_path / "orphan.ckpt"
+    (tmp_path / "orphan.ckpt.log").write_bytes(b"\x01\x00\x00\x00")
+    with pytest.raises(CheckpointError, match="journal without a snapshot"):
+        Checkpoint(orphan, JOB)
+
+
+def test_input_longer_or_shorter_than_the_first_run(tmp_path):
+    # The checkpoint tracks positions, not the input: positions past the end
+    # of the first run are pending, and a shorter input just ends early.
+    path = tmp_path / "send.ckpt"
+    with Checkpoint(path, JOB) as checkpoint:
+        for index in range(10):
+            checkpoint.mark(index)
+    with Checkpoint(path, JOB) as checkpoint:
+        assert [i for i in range(15) if not checkpoint.done(i)] == list(range(10, 15))
+        assert all(checkpoint.done(i) for i in range(5))
+        assert checkpoint.completed() == 10
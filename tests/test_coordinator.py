@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import time
+from collections import Counter
+
+import pytest
+
+from managed_notifications.coordinator import (
+    DONE,
+    LEASED,
+    UNCERTAIN_ERROR,
+    Coordinator,
+    CoordinatorError,
+    run_job,
+)
+from managed_notifications.sender import BulkSender
+
+TEMPLATE = "osd/aws/AWS_outage"
+UUIDS = [f"00000000-0000-0000-0000-{i:012d}" for i in range(200)]
+
+
+def test_create_job_is_idempotent_but_checks_the_definition(tmp_path):
+    with Coordinator(tmp_path / "jobs.db") as coordinator:
+        job = coordinator.create_job("outage", TEMPLATE, {"REGION": "x"}, shards=4)
+        assert coordinator.create_job("outage", TEMPLATE, {"REGION": "x"}, shards=4) == job
+        with pytest.raises(CoordinatorError, match="different"):
+            coordinator.create_job("outage", TEMPLATE, {"REGION": "y"}, shards=4)
+        with pytest.raises(CoordinatorError, match="no such job"):
+            coordinator.job("other")
+
+
+def test_each_shard_is_leased_once(tmp_path):
+    path = tmp_path / "jobs.db"
+    with Coordinator(path, host="a") as a, Coordinator(path, host="b") as b:
+        a.create_job("outage", TEMPLATE, shards=2)
+        first, second = a.acquire("outage"), b.acquire("outage")
+        assert {first.shard, second.shard} == {0, 1}
+        assert a.acquire("outage") is None
+        first.complete()
+        second.complete()
+        assert a.finished("outage")
+        assert [s.state for s in b.status("outage")] == [DONE, DONE]
+
+
+def test_expired_lease_is_taken_over_and_the_old_holder_fenced(tmp_path):
+    path = tmp_path / "jobs.db"
+    with Coordinator(path, host="a", lease=0.05) as a, Coordinator(path, host="b", lease=30) as b:
+        a.create_job("outage", TEMPLATE, shards=1)
+        old = a.acquire("outage")
+        assert b.acquire("outage") is None
+        time.sleep(0.1)
+        new = b.acquire("outage")
+        assert new is not None and new.epoch == old.epoch + 1
+        (status,) = b.status("outage")
+        assert (status.state, status.owner) == (LEASED, "b")
+        # The paused holder finds out on its next write, and its writes are dropped.
+        assert not old.renew()
+        assert old.lost
+        old.complete()
+        assert not b.finished("outage")
+        assert new.renew()
+
+
+def test_inputs_claimed_but_not_confirmed_are_uncertain(tmp_path):
+    path = tmp_path / "jobs.db"
+    with Coordinator(path, host="a", lease=0.05) as a, Coordinator(path, host="b") as b:
+        a.create_job("outage", TEMPLATE, shards=1)
+        old = a.acquire("outage")
+        old.claim_ahead = 20
+        for index in range(5):
+            assert not old.done(index)
+            old.mark(index)
+        assert old.renew()
+        time.sleep(0.1)
+        new = b.acquire("outage")
+        assert new.inherited == 20
+        assert all(new.done(i) for i in range(5))
+        assert [new.is_uncertain(i) for i in (4, 5, 19, 20)] == [False, True, True, False]
+        assert new.done(5) and not new.done(20)
+        new.resend_uncertain = True
+        assert not new.done(6)
+
+
+def test_run_job_sends_every_cluster_once(stub, tmp_path):
+    server = stub()
+    with Coordinator(tmp_path / "jobs.db") as coordinator, BulkSender(server.url, concurrency=4) as sender:
+        coordinator.create_job("outage", TEMPLATE, shards=3)
+        results = list(run_job(coordinator, "outage", sender, lambda: UUIDS))
+        assert coordinator.finished("outage")
+    assert sorted(r.index for r in results) == list(range(len(UUIDS)))
+    assert all(r.ok for r in results)
+    assert server.metrics()["created"] == len(UUIDS)
+
+
+def test_takeover_after_a_stop_never_posts_twice(stub, tmp_path):
+    server = stub()
+    path = tmp_path / "jobs.db"
+    with BulkSender(server.url, concurrency=4) as sender:
+        with Coordinator(path, host="a") as a:
+            a.create_job("outage", TEMPLATE, shards=1)
+            for seen, _ in enumerate(run_job(a, "outage", sender, lambda: UUIDS), 1):
+                if seen == 30:
+                    break
+        with Coordinator(path, host="b") as b:
+            results = list(run_job(b, "outage", sender, lambda: UUIDS))
+            assert b.finished("outage")
+    posted = Counter(entry["cluster_uuid"] for entry in server.entries)
+    assert max(posted.values()) == 1
+    uncertain = {r.cluster_uuid for r in results if r.error == UNCERTAIN_ERROR}
+    # The first host claimed the whole shard up front, so what it did not confirm is uncertain.
+    assert 30 <= len(posted) < len(UUIDS)
+    assert set(posted) | uncertain == set(UUIDS)
+    assert not set(posted) & uncertain
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import io
+import json
+
+import pytest
+
+from managed_notifications.catalog import default_catalog
+from managed_notifications.render import render, render_fleet
+
+CATALOG = default_catalog()
+FLEET_TEMPLATES = sorted(e.id for e in CATALOG if "CLUSTER_UUID" in e.placeholders)
+
+UUIDS = [
+    "00000000-0000-0000-0000-000000000001",
+    "1e5b1a9e-7c1f-4d3c-9b0e-2a1b3c4d5e6f",
+    'odd "quoted" \\ value',
+    "café ☃",
+    "tab\there",
+]
+
+
+def compact(payload):
+    return json.dumps(payload, separators=(",", ":")).encode("ascii")
+
+
+@pytest.mark.parametrize("template_id", FLEET_TEMPLATES)
+def test_fleet_matches_render(template_id):
+    fixed = {name: f"<{name.lower()}>" for name in CATALOG.entry(template_id).placeholders - {"CLUSTER_UUID"}}
+    payloads = list(render_fleet(template_id, UUIDS, fixed))
+    assert payloads == [compact(render(template_id, dict(fixed, CLUSTER_UUID=u))) for u in UUIDS]
+
+
+def test_fleet_reads_uuid_files():
+    template = "osd/aws/AWS_outage"
+    text = "\n".join(UUIDS[:2]) + "\n\n  \n"
+    from_text = list(render_fleet(template, io.StringIO(text)))
+    from_bytes = list(render_fleet(template, io.BytesIO(text.encode())))
+    assert from_text == from_bytes == [compact(render(template, {"CLUSTER_UUID": u})) for u in UUIDS[:2]]
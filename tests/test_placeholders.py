@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import pytest
+
+from managed_notifications.catalog import Catalog, TemplateEntry
+from managed_notifications.placeholders import PlaceholderIndex
+from managed_notifications.render import MissingParameters
+
+
+def entry(template_id, *placeholders):
+    return TemplateEntry(template_id, f"{template_id}.json", "Info", "s", frozenset(placeholders), None)
+
+
+@pytest.fixture
+def index():
+    entries = [
+        entry("osd/a", "CLUSTER_UUID", "ALERT_NAME"),
+        entry("osd/b", "CLUSTER_UUID", "ALERTNAME"),
+        entry("osd/c", "CLUSTER_UUID", "NAMESPACE_OR_CLUSTER_SCOPE"),
+        entry("osd/d", "CLUSTER_UUID", "NAMESPACE"),
+        entry("ocm/e"),
+    ]
+    return PlaceholderIndex(Catalog({e.id: e for e in entries}))
+
+
+def test_templates_using_follows_aliases(index):
+    assert index.templates_using("CLUSTER_UUID") == {"osd/a", "osd/b", "osd/c", "osd/d"}
+    assert index.templates_using("ALERTNAME") == {"osd/a", "osd/b"}
+    assert index.templates_using("ALERT_NAME") == {"osd/a", "osd/b"}
+    assert index.templates_using("NAMESPACE") == {"osd/c", "osd/d"}
+    # An alias only works one way: NAMESPACE_OR_CLUSTER_SCOPE cannot fill NAMESPACE.
+    assert index.templates_using("NAMESPACE_OR_CLUSTER_SCOPE") == {"osd/c"}
+    assert index.templates_using("UNUSED") == frozenset()
+
+
+def test_missing_and_renderable_follow_aliases(index):
+    assert index.missing("osd/c", {"CLUSTER_UUID": "u", "NAMESPACE": "n"}) == frozenset()
+    assert index.missing("osd/d", {"CLUSTER_UUID": "u"}) == {"NAMESPACE"}
+    assert index.renderable(["CLUSTER_UUID", "ALERTNAME"]) == ["ocm/e", "osd/a", "osd/b"]
+    with pytest.raises(MissingParameters, match="NAMESPACE"):
+        index.check("osd/d", {"CLUSTER_UUID": "u"})
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from managed_notifications.ratelimit import AdaptiveLimiter, parse_retry_after
+from managed_notifications.sender import BulkSender
+from managed_notifications.stub_server import Faults
+
+
+def test_throttling_halves_the_window_once_per_round_trip():
+    limiter = AdaptiveLimiter(max_concurrency=16, decrease=0.5)
+    for _ in range(4):
+        limiter.acquire()
+    for _ in range(4):
+        limiter.release(429, latency=1.0)
+    assert limiter.window == 8.0
+    assert limiter.stats().throttled == 4
+
+
+def test_window_grows_back_additively_and_stays_in_bounds():
+    limiter = AdaptiveLimiter(max_concurrency=4, min_concurrency=2, initial=2, decrease=0.5)
+    limiter.acquire()
+    limiter.release(429, latency=0.0)
+    assert limiter.window == 2.0
+    for _ in range(100):
+        limiter.acquire()
+        limiter.release(201, latency=0.0)
+    assert limiter.window == 4.0
+
+
+def test_window_caps_requests_in_flight():
+    limiter = AdaptiveLimiter(max_concurrency=2)
+    limiter.acquire()
+    limiter.acquire()
+    third = threading.Thread(target=limiter.acquire)
+    third.start()
+    third.join(0.05)
+    assert third.is_alive()
+    limiter.release(201, latency=0.0)
+    third.join(1.0)
+    assert not third.is_alive()
+    assert limiter.stats().in_flight == 2
+
+
+def test_retry_after_pauses_new_requests():
+    limiter = AdaptiveLimiter(max_concurrency=4)
+    limiter.acquire()
+    limiter.release(429, latency=0.0, retry_after=0.1)
+    assert limiter.stats().paused > 0
+    started = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - started >= 0.09
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("2") == 2.0
+    assert parse_retry_after("Thu, 01 Jan 1970 00:00:10 GMT", now=4.0) == 6.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_limiter_backs_off_against_a_rate_limited_stub(stub):
+    server = stub(Faults(rate_limit=200, retry_after=0.05))
+    limiter = AdaptiveLimiter(max_concurrency=16)
+    params = [{"CLUSTER_UUID": f"00000000-0000-0000-0000-{i:012d}"} for i in range(300)]
+    with BulkSender(server.url, concurrency=16, retries=10, backoff=0.01, limiter=limiter) as sender:
+        results = list(sender.send("osd/aws/AWS_outage", params))
+    assert all(r.ok for r in results)
+    assert limiter.stats().throttled > 0
+    assert server.metrics()["created"] == 300
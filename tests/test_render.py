@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from managed_notifications.catalog import PLACEHOLDER_RE, default_catalog
+from managed_notifications.render import CompiledString, MissingParameters, render, render_many
+
+TEMPLATE = "osd/aws/AWS_outage"
+CATALOG = default_catalog()
+
+
+def params_for(template_id):
+    return {name: f"<{name.lower()}>" for name in CATALOG.entry(template_id).placeholders}
+
+
+def substitute(template, params):
+    """The plain search-and-replace rendering the compiled renderer replaces."""
+    payload = dict(template)
+    for key, value in template.items():
+        if isinstance(value, str):
+            payload[key] = PLACEHOLDER_RE.sub(lambda m: str(params[m.group(1)]), value)
+    return payload
+
+
+@pytest.mark.parametrize("template_id", sorted(e.id for e in CATALOG))
+def test_render_matches_substitution(template_id):
+    params = params_for(template_id)
+    expected = substitute(CATALOG.template(template_id), params)
+    assert json.dumps(render(template_id, params)) == json.dumps(expected)
+
+
+def test_compiled_string_segments():
+    compiled = CompiledString("a ${X} b ${Y}${X}")
+    assert compiled.literals == ("a ", " b ", "", "")
+    assert compiled.names == ("X", "Y", "X")
+    assert compiled.render({"X": 1, "Y": "$"}) == "a 1 b $1"
+    assert CompiledString("plain").render({}) == "plain"
+
+
+def test_render_many_and_aliases():
+    common = {"CLUSTER_UUID": "u", "RESOURCE": "pod/x", "ACTION_REQUIRED": "scale down"}
+    payloads = render_many(
+        "osd/ResouceIsRaisingClusterAlert",
+        [dict(common, NAMESPACE="a", ALERT_NAME="A"), dict(common, NAMESPACE_OR_CLUSTER_SCOPE="b", ALERTNAME="B")],
+    )
+    assert "pod/x in a is" in payloads[0]["summary"]
+    assert "the alert A to fire" in payloads[0]["description"]
+    assert "pod/x in b is" in payloads[1]["summary"]
+    assert "the alert B to fire" in payloads[1]["description"]
+    with pytest.raises(MissingParameters, match="CLUSTER_UUID"):
+        render(TEMPLATE, {})
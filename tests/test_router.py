@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import pytest
+
+from managed_notifications.render import render
+from managed_notifications.router import AlertRouter, percent_used
+
+CLUSTER = "00000000-0000-0000-0000-000000000001"
+
+
+@pytest.fixture(scope="module")
+def router():
+    return AlertRouter()
+
+
+def volume_alert(severity, namespace, free="2.63%"):
+    return {
+        "status": "firing",
+        "labels": {
+            "alertname": "KubePersistentVolumeFillingUp",
+            "severity": severity,
+            "namespace": namespace,
+            "persistentvolumeclaim": "elasticsearch-elasticsearch-cdm-1",
+            "_id": CLUSTER,
+        },
+        "annotations": {
+            "description": (
+                "The PersistentVolume claimed by elasticsearch-elasticsearch-cdm-1 in Namespace "
+                f"{namespace} is only {free} free."
+            ),
+        },
+        "fingerprint": "abc123",
+    }
+
+
+@pytest.mark.parametrize(
+    ("severity", "template"),
+    [
+        ("critical", "osd/KubePersistentVolumeFillingUpError"),
+        ("warning", "osd/KubePersistentVolumeFillingUpWarn"),
+    ],
+)
+def test_volume_alert_renders_percent(router, severity, template):
+    (routed,) = router.route({"alerts": [volume_alert(severity, "openshift-logging")]})
+    assert routed.template == template
+    assert routed.ready
+    assert routed.params["PERCENT"] == "97.37"
+    payload = render(routed.template, routed.params)
+    assert payload["cluster_uuid"] == CLUSTER
+    assert "97.37% load" in payload["description"]
+    assert "${" not in payload["description"]
+
+
+def test_user_volume_alert(router):
+    (routed,) = router.route({"alerts": [volume_alert("warning", "my-app")]})
+    assert routed.template == "osd/KubePersistentVolumeFillingUpError-user"
+    assert routed.ready
+    assert "'my-app'" in render(routed.template, routed.params)["description"]
+
+
+def test_percent_label_wins(router):
+    alert = volume_alert("critical", "openshift-logging")
+    alert["labels"]["percent"] = "90"
+    (routed,) = router.route({"alerts": [alert]})
+    assert routed.params["PERCENT"] == "90"
+
+
+def test_percent_used():
+    assert percent_used({"description": "is only 5% free."}) == "95"
+    assert percent_used({"message": "volume is 12.5 % free"}) == "87.5"
+    assert percent_used({"description": "no figure here"}) is None
+    assert percent_used({}) is None
+
+
+def test_unrouted_alert_is_dropped(router):
+    assert router.route({"alerts": [{"labels": {"alertname": "SomethingElse"}}]}) == []
+    fallback = AlertRouter(fallback="osd/unknown_failure")
+    (routed,) = fallback.route({"alerts": [{"labels": {"alertname": "SomethingElse", "_id": CLUSTER}}]})
+    assert routed.template == "osd/unknown_failure"
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import pytest
+
+from managed_notifications.inventory import Inventory
+from managed_notifications.selector import (
+    And,
+    Compare,
+    Not,
+    Or,
+    SelectorError,
+    compile_predicate,
+    fields_of,
+    fragment,
+    fragment_names,
+    parse,
+    select,
+)
+from managed_notifications.synthetic import generate
+
+FRAGMENT_PARAMS = {"CLOUD_PROVIDER": "aws", "CLUSTER_REGION": "us-east-1", "CLUSTER_VERSION": "4.12.0"}
+
+EXPRESSIONS = [
+    *fragment_names(),
+    "clusterIsReady and clusterRegionIs and not clusterIsCCS",
+    "clusterIsManaged or (clusterIsErrored and clusterCloudProviderIs)",
+    "region.id in ('us-east-1', 'eu-west-1') and version.id >= '4.11'",
+    "region.id like 'us-%' and not (version.id < '4.12.0-rc.0')",
+    "name like 'synthetic-1_' or aws.private_link != 'true'",
+]
+
+
+@pytest.fixture(scope="module")
+def records():
+    return list(generate(5000, seed=7))
+
+
+def test_parse_builds_the_ast():
+    node = parse("region.id is 'a' and (state = 'ready' or not managed is 'true')")
+    assert node == And(
+        (
+            Compare("region.id", "is", "a"),
+            Or((Compare("state", "is", "ready"), Not(Compare("managed", "is", "true")))),
+        )
+    )
+    assert node.to_search() == "region.id is 'a' and (state is 'ready' or not (managed is 'true'))"
+
+
+def test_fragments_expand_with_parameters():
+    node = parse("clusterRegionIs and not clusterIsCCS", {"CLUSTER_REGION": "it's"})
+    assert node.to_search() == "region.id is 'it''s' and not (ccs.enabled is 'true')"
+    assert fragment("clusterIsCCS") == Compare("ccs.enabled", "is", "true")
+
+
+@pytest.mark.parametrize("text", ["", "region.id is", "(state is 'a'", "state is 'a' garbage", "noSuchFragment"])
+def test_malformed_selectors_are_rejected(text):
+    with pytest.raises(SelectorError):
+        parse(text)
+
+
+def test_like_and_missing_fields():
+    records = [{"id": "a", "region": {"id": "us-east-1"}}, {"id": "b"}, {"id": "c", "region": {"id": None}}]
+    for text, expected in [
+        ("region.id like '%'", ["a"]),
+        ("region.id like 'us-_ast-1'", ["a"]),
+        ("not (region.id like 'eu%')", ["a", "b", "c"]),
+        ("region.id is not 'us-east-1'", ["b", "c"]),
+    ]:
+        node = parse(text)
+        assert [r["id"] for r in select(node, records)] == expected
+        assert Inventory.from_records(records, ["region.id"]).select(node) == expected
+
+
+@pytest.mark.parametrize("text", EXPRESSIONS)
+def test_inventory_matches_the_record_evaluator(records, text):
+    node = parse(text, FRAGMENT_PARAMS)
+    inventory = Inventory.from_records(records, fields_of(node))
+    predicate = compile_predicate(node)
+    expected = [r["external_id"] for r in records if predicate(r)]
+    assert inventory.select(node) == expected
+    assert inventory.count(node) == len(expected)
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from typing import List
+
+from managed_notifications.deadletter import DeadLetterStore
+from managed_notifications.sender import BulkSender
+from managed_notifications.stub_server import Faults
+
+TEMPLATE = "osd/aws/AWS_outage"
+
+
+def fleet(n: int) -> List[dict]:
+    return [{"CLUSTER_UUID": f"00000000-0000-0000-0000-{i:012d}"} for i in range(n)]
+
+
+def test_pooled_send_posts_every_payload(stub):
+    server = stub()
+    with BulkSender(server.url, concurrency=4) as sender:
+        results = list(sender.send(TEMPLATE, fleet(50)))
+    assert len(results) == 50
+    assert all(r.ok and r.attempts == 1 for r in results)
+    assert sorted(r.index for r in results) == list(range(50))
+    assert server.metrics()["created"] == 50
+    assert {e["cluster_uuid"] for e in server.entries} == {p["CLUSTER_UUID"] for p in fleet(50)}
+
+
+def test_server_errors_are_retried(stub):
+    server = stub(Faults(error_rate=0.3))
+    with BulkSender(server.url, concurrency=4, retries=8, backoff=0.001) as sender:
+        results = list(sender.send(TEMPLATE, fleet(40)))
+    assert all(r.ok for r in results)
+    assert any(r.attempts > 1 for r in results)
+    assert server.metrics()["created"] == 40
+
+
+def test_throttled_posts_honour_retry_after(stub):
+    server = stub(Faults(throttle_rate=0.3, retry_after=0.02))
+    with BulkSender(server.url, concurrency=4, retries=8, backoff=0.001) as sender:
+        results = list(sender.send(TEMPLATE, fleet(40)))
+    assert all(r.ok for r in results)
+    retried = [r for r in results if r.attempts > 1]
+    assert retried
+    # Every retry waited at least the Retry-After the stub asked for.
+    assert all(r.elapsed >= 0.02 * (r.attempts - 1) for r in retried)
+    assert server.metrics()["statuses"].get("429")
+
+
+def test_retries_give_up_after_the_limit(stub):
+    server = stub(Faults(error_rate=1.0, error_status=502))
+    with BulkSender(server.url, concurrency=2, retries=2, backoff=0.001) as sender:
+        results = list(sender.send(TEMPLATE, fleet(5)))
+    assert all(r.failed and r.status == 502 and r.attempts == 3 for r in results)
+    assert server.metrics()["created"] == 0
+
+
+def test_invalid_payloads_are_not_posted(stub):
+    server = stub()
+    with BulkSender(server.url) as sender:
+        (result,) = sender.send(TEMPLATE, [{"CLUSTER_UUID": ""}])
+    assert result.failed and result.status is None
+    assert result.error.startswith("invalid payload")
+    assert server.metrics()["requests"] == 0
+
+
+def test_unrenderable_params_are_dead_lettered_and_redriven(stub, tmp_path):
+    server = stub()
+    params = [{"CLUSTER_UUID": uuid, "USERNAME": "kubeadmin"} for uuid in ("a", "b", "c")]
+    del params[1]["USERNAME"]
+    with DeadLetterStore(tmp_path / "dead.db") as dead_letters:
+        with BulkSender(server.url, dead_letters=dead_letters) as sender:
+            results = sorted(sender.send("osd/Failed_Logins", params), key=lambda r: r.index)
+            assert [r.ok for r in results] == [True, False, True]
+            assert results[1].error == "invalid payload: osd/Failed_Logins: missing parameters: USERNAME"
+            (entry,) = dead_letters.entries()
+            assert (entry.cluster_uuid, entry.error_class, entry.body) == ("b", "invalid", None)
+            assert entry.params == {"CLUSTER_UUID": "b"}
+            (redriven,) = sender.redrive([entry], {"USERNAME": "admin"})
+        assert redriven.ok
+        assert dead_letters.entries() == []
+    assert sorted(e["cluster_uuid"] for e in server.entries) == ["a", "b", "c"]
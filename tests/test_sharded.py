@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from collections import Counter
+
+from managed_notifications.checkpoint import Checkpoint
+from managed_notifications.sharded import ShardedSender, shard_of
+from managed_notifications.stub_server import Faults
+
+TEMPLATE = "osd/aws/AWS_outage"
+UUIDS = [f"00000000-0000-0000-0000-{i:012d}" for i in range(300)]
+
+
+def test_shard_of_is_stable_and_in_range():
+    shards = [shard_of(uuid, 3) for uuid in UUIDS]
+    assert shards == [shard_of(uuid, 3) for uuid in UUIDS]
+    assert set(shards) == {0, 1, 2}
+
+
+def test_results_come_back_in_input_order(stub):
+    server = stub()
+    with ShardedSender(2, server.url, concurrency=4) as sender:
+        results = list(sender.send_fleet(TEMPLATE, UUIDS))
+    assert [r.index for r in results] == list(range(len(UUIDS)))
+    assert [r.cluster_uuid for r in results] == UUIDS
+    assert all(r.ok for r in results)
+
+
+def test_stopped_send_resumes_without_reposting(stub, tmp_path):
+    server = stub(Faults(latency=0.01))
+    path = tmp_path / "send.ckpt"
+    with ShardedSender(2, server.url, concurrency=8) as sender:
+        with Checkpoint.for_job(path, TEMPLATE) as checkpoint:
+            for seen, _ in enumerate(sender.send_fleet(TEMPLATE, UUIDS, checkpoint=checkpoint), 1):
+                if seen == 40:
+                    break
+            # Posts in flight when the send stopped were waited for and checkpointed.
+            assert checkpoint.completed() == server.metrics()["created"]
+            assert 40 <= checkpoint.completed() < len(UUIDS)
+        with Checkpoint.for_job(path, TEMPLATE) as checkpoint:
+            resumed = list(sender.send_fleet(TEMPLATE, UUIDS, checkpoint=checkpoint))
+            assert checkpoint.completed() == len(UUIDS)
+    assert all(r.ok for r in resumed)
+    posted = Counter(entry["cluster_uuid"] for entry in server.entries)
+    assert set(posted) == set(UUIDS)
+    assert max(posted.values()) == 1
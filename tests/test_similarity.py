@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from itertools import combinations
+
+import pytest
+
+from managed_notifications.catalog import default_catalog
+from managed_notifications.similarity import SimilarityIndex, jaccard, shingles, template_text
+
+BASE = (
+    "Your cluster requires you to take action. The AWS account has reached the limit of VPCs "
+    "in this region. Please request a quota increase from AWS support and retry the installation."
+)
+EDITED = BASE.replace("VPCs", "Elastic IP addresses")
+UNRELATED = "The cluster was upgraded to a new version. No action is required from you at this time."
+
+
+@pytest.fixture(scope="module")
+def catalog_index():
+    return SimilarityIndex.from_catalog()
+
+
+def test_shingles_and_jaccard():
+    assert shingles("a b c d") == {"a b c", "b c d"}
+    assert shingles("Hello ${NAME}") == {"hello ${name}"}
+    assert shingles("") == frozenset()
+    assert jaccard(frozenset(), frozenset()) == 1.0
+    assert jaccard(frozenset("ab"), frozenset("bc")) == pytest.approx(1 / 3)
+
+
+def test_known_catalog_pairs(catalog_index):
+    pairs = {(a, b) for a, b, _ in catalog_index.pairs()}
+    assert ("osd/aws/InstallFailed_InvalidSubnet", "osd/aws/InstallFailed_STS_PrivateLink") in pairs
+    assert ("osd/cluster_cannot_be_recovered", "osd/rosa_cluster_cannot_be_recovered") in pairs
+    assert ("osd/aws/GenericQuotaExceeded", "osd/gcp/GenericQuotaExceeded") in pairs
+    assert ["osd/rosa_cluster_cannot_be_recovered"] == [
+        m.id for m in catalog_index.similar_to("osd/cluster_cannot_be_recovered")
+    ]
+
+
+def test_pairs_match_exhaustive_comparison(catalog_index):
+    catalog = default_catalog()
+    sets = {i: shingles(template_text(catalog.template(i))) for i in catalog.ids()}
+    expected = sorted(
+        (a, b, jaccard(sets[a], sets[b]))
+        for a, b in combinations(sorted(sets), 2)
+        if jaccard(sets[a], sets[b]) >= catalog_index.threshold
+    )
+    found = catalog_index.pairs()
+    # LSH may miss a pair just above the threshold, but never reports a false or inexact one.
+    assert set(found) <= set(expected)
+    assert [p for p in expected if p[2] >= 0.6] == [p for p in found if p[2] >= 0.6]
+
+
+def test_query_add_remove():
+    index = SimilarityIndex(threshold=0.5)
+    index.add("base", BASE)
+    index.add("other", UNRELATED)
+    (match,) = index.query(EDITED)
+    assert match.id == "base"
+    assert match.similarity == pytest.approx(jaccard(shingles(BASE), shingles(EDITED)))
+    assert index.query(BASE, exclude=["base"]) == []
+    index.add("edited", EDITED)
+    assert index.pairs() == [("base", "edited", match.similarity)]
+    assert index.clusters() == [["base", "edited"]]
+    index.remove("base")
+    assert "base" not in index and len(index) == 2
+    assert index.pairs() == []
+    with pytest.raises(ValueError):
+        SimilarityIndex(threshold=0)
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import pytest
+
+from managed_notifications import suppress
+from managed_notifications.sender import BulkSender
+from managed_notifications.suppress import MemorySuppressor, SqliteSuppressor, open_suppressor, send_key
+
+TEMPLATE = "osd/aws/AWS_outage"
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(suppress.time, "monotonic", clock)
+    monkeypatch.setattr(suppress.time, "time", clock)
+    return clock
+
+
+def test_send_key_identity():
+    key = send_key("u", TEMPLATE, "text")
+    assert len(key) == 16
+    assert key == send_key("u", TEMPLATE, "text")
+    assert len({key, send_key("v", TEMPLATE, "text"), send_key("u", TEMPLATE, "other")}) == 3
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite"])
+def test_window(kind, clock, tmp_path):
+    suppressor = open_suppressor(tmp_path / "s.db" if kind == "sqlite" else None, window=60)
+    a, b = send_key("a", TEMPLATE, "x"), send_key("b", TEMPLATE, "x")
+    assert suppressor.admit(a)
+    assert not suppressor.admit(a)
+    assert suppressor.admit(b)
+    clock.now += 59
+    assert not suppressor.admit(a)
+    clock.now += 1
+    # The window runs from the admitted send, not from the last repeat turned away.
+    assert suppressor.admit(a)
+    assert not suppressor.admit(a)
+    suppressor.forget(a)
+    assert suppressor.admit(a)
+    suppressor.close()
+
+
+def test_memory_evicts_oldest():
+    suppressor = MemorySuppressor(window=60, maxsize=2)
+    keys = [send_key(str(i), TEMPLATE, "x") for i in range(3)]
+    assert all(suppressor.admit(k) for k in keys)
+    assert suppressor.admit(keys[0])
+    assert not suppressor.admit(keys[2])
+
+
+def test_sqlite_window_is_shared(tmp_path):
+    path = tmp_path / "s.db"
+    key = send_key("a", TEMPLATE, "x")
+    first, second = SqliteSuppressor(path), SqliteSuppressor(path)
+    assert first.admit(key)
+    assert not second.admit(key)
+    first.close()
+    second.close()
+    reopened = SqliteSuppressor(path)
+    assert not reopened.admit(key)
+    reopened.close()
+
+
+def test_sender_skips_repeats(stub):
+    server = stub()
+    params = [{"CLUSTER_UUID": f"00000000-0000-0000-0000-{i:012d}"} for i in range(20)]
+    with BulkSender(server.url, concurrency=2, suppressor=MemorySuppressor()) as sender:
+        first = list(sender.send(TEMPLATE, params))
+        second = list(sender.send(TEMPLATE, params + [{"CLUSTER_UUID": "new"}]))
+    assert all(r.ok and not r.suppressed for r in first)
+    assert sum(r.suppressed for r in second) == 20
+    assert [r.cluster_uuid for r in second if not r.suppressed] == ["new"]
+    assert server.metrics()["created"] == 21
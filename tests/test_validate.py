@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+import json
+
+from managed_notifications.__main__ import main
+from managed_notifications.render import render
+
+TEMPLATE = "osd/aws/AWS_outage"
+
+
+def test_validate_payloads_reports_malformed_lines(tmp_path, capsys):
+    path = tmp_path / "payloads.jsonl"
+    good = json.dumps(render(TEMPLATE, {"CLUSTER_UUID": "u"}))
+    path.write_text(f"{good}\n\n{{not json\n{good}\n")
+    assert main(["validate", "--payloads", str(path)]) == 1
+    out = capsys.readouterr().out.splitlines()
+    assert len(out) == 1
+    assert out[0].startswith(f"{path}:3: invalid JSON: ")
+
+
+def test_validate_payloads_accepts_rendered_payloads(tmp_path, capsys):
+    path = tmp_path / "payloads.jsonl"
+    path.write_text(json.dumps(render(TEMPLATE, {"CLUSTER_UUID": "u"})) + "\n")
+    assert main(["validate", "--payloads", str(path)]) == 0
+    assert capsys.readouterr().out == ""
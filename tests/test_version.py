@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import pytest
+
+from managed_notifications.selector import SelectorError, compile_predicate, parse
+from managed_notifications.version import BUILD_STAGE, GA_STAGE, pack, version_key
+
+
+def test_versions_sort_numerically():
+    ids = ["4.10.1", "4.9", "4.10", "4.9.12", "4.11.0", "5.0.0"]
+    assert sorted(ids, key=version_key) == ["4.9", "4.9.12", "4.10", "4.10.1", "4.11.0", "5.0.0"]
+
+
+def test_prefixes_and_channel_suffixes_are_ignored():
+    key = version_key("4.10.3")
+    assert version_key("openshift-v4.10.3") == key
+    assert version_key("v4.10.3") == key
+    assert version_key("4.10.3-candidate") == key
+    assert version_key(" 4.10.3 ") == key
+    assert version_key("4.10") == version_key("4.10.0")
+
+
+def test_prereleases_sort_before_the_release():
+    ids = [
+        "4.11.0",
+        "4.11.0-rc.3",
+        "openshift-v4.11.0-rc.2-candidate",
+        "4.11.0-fc.0",
+        "4.11.0-ec.1",
+        "4.11.0-0.nightly-2022-06-01-123456",
+        "4.10.9",
+        "4.11.1",
+    ]
+    assert sorted(ids, key=version_key) == [
+        "4.10.9",
+        "4.11.0-0.nightly-2022-06-01-123456",
+        "4.11.0-ec.1",
+        "4.11.0-fc.0",
+        "openshift-v4.11.0-rc.2-candidate",
+        "4.11.0-rc.3",
+        "4.11.0",
+        "4.11.1",
+    ]
+
+
+def test_nightly_ci_and_okd_builds_parse():
+    build = pack(4, 14, 0, BUILD_STAGE)
+    assert version_key("4.14.0-0.nightly-2023-06-01-123456") == build
+    assert version_key("openshift-v4.14.0-0.nightly-arm64-2023-06-01-123456") == build
+    assert version_key("4.14.0-0.ci-2023-06-01-123456") == build
+    assert version_key("4.14.0-0.okd-2023-06-01-123456") == build
+    assert build < version_key("4.14.0-ec.0") < pack(4, 14, 0, GA_STAGE)
+
+
+@pytest.mark.parametrize("text", ["", "4", "latest", "4.x.1", "4..1", "4.10.3.4", f"{1 << 12}.0.0"])
+def test_invalid_versions_do_not_parse(text):
+    assert version_key(text) is None
+
+
+def test_version_ranges_in_selectors():
+    node = parse("version.raw_id >= '4.10' and version.raw_id < '4.11.0'")
+    predicate = compile_predicate(node)
+    ids = ("4.9.30", "4.10.0", "4.10.45", "4.11.0-0.nightly-2022-06-01-1", "4.11.0", "bogus")
+    matching = [v for v in ids if predicate({"version": {"raw_id": v}})]
+    assert matching == ["4.10.0", "4.10.45", "4.11.0-0.nightly-2022-06-01-1"]
+    with pytest.raises(SelectorError, match="cannot parse version"):
+        compile_predicate(parse("version.raw_id > 'latest'"))
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import time
+
+from managed_notifications.deadletter import DeadLetterStore
+from managed_notifications.render import render
+from managed_notifications.sender import BulkSender
+from managed_notifications.stub_server import Faults
+from managed_notifications.workqueue import WorkQueue, drain
+
+TEMPLATE = "osd/aws/AWS_outage"
+
+
+def payloads(n: int):
+    return [render(TEMPLATE, {"CLUSTER_UUID": f"00000000-0000-0000-0000-{i:012d}"}) for i in range(n)]
+
+
+def test_messages_are_delivered_oldest_first_and_hidden_while_held(tmp_path):
+    with WorkQueue(tmp_path / "queue.db") as queue:
+        queue.put_many(payloads(3), TEMPLATE)
+        first = queue.get(2, visibility_timeout=60)
+        assert [m.cluster_uuid[-1] for m in first] == ["0", "1"]
+        assert all(m.attempts == 1 and m.template_id == TEMPLATE for m in first)
+        (last,) = queue.get(5, visibility_timeout=60)
+        assert queue.get() == []
+        assert queue.ack(first + [last]) == 3
+        assert len(queue) == 0
+
+
+def test_expired_lease_is_redelivered_and_stale_ack_is_ignored(tmp_path):
+    with WorkQueue(tmp_path / "queue.db") as queue:
+        queue.put(payloads(1)[0], TEMPLATE)
+        (held,) = queue.get(visibility_timeout=0.05)
+        time.sleep(0.1)
+        (again,) = queue.get(visibility_timeout=60)
+        assert again.id == held.id and again.attempts == 2
+        # The first holder's lease lapsed: its ack no longer counts.
+        assert queue.ack([held]) == 0
+        assert queue.extend([held]) == 0
+        assert len(queue) == 1
+        assert queue.ack([again]) == 1
+
+
+def test_nack_delays_redelivery(tmp_path):
+    with WorkQueue(tmp_path / "queue.db") as queue:
+        queue.put(payloads(1)[0], TEMPLATE)
+        assert queue.nack(queue.get(), delay=0.1) == 1
+        assert queue.get() == []
+        assert queue.stats().delayed == 1
+        time.sleep(0.15)
+        assert len(queue.get()) == 1
+
+
+def test_queues_in_one_file_are_separate(tmp_path):
+    with WorkQueue(tmp_path / "queue.db", "a") as a, WorkQueue(tmp_path / "queue.db", "b") as b:
+        a.put_many(payloads(2), TEMPLATE)
+        assert len(a) == 2 and len(b) == 0
+        assert b.get() == []
+
+
+def test_drain_posts_and_acknowledges_everything(stub, tmp_path):
+    server = stub()
+    with WorkQueue(tmp_path / "queue.db") as queue, BulkSender(server.url, concurrency=4) as sender:
+        queue.put_many(payloads(30), TEMPLATE)
+        results = list(drain(queue, sender))
+        assert len(queue) == 0
+    assert len(results) == 30 and all(r.ok for r in results)
+    assert server.metrics()["created"] == 30
+
+
+def test_drain_retries_transient_failures_through_the_queue(stub, tmp_path):
+    server = stub(Faults(error_rate=0.5))
+    with WorkQueue(tmp_path / "queue.db") as queue, BulkSender(server.url, retries=0) as sender:
+        queue.put_many(payloads(20), TEMPLATE)
+        results = list(drain(queue, sender, follow=False, retry_delay=0.0))
+        while len(queue):
+            results += drain(queue, sender, retry_delay=0.0)
+    assert sum(r.ok for r in results) == 20
+    assert any(r.failed for r in results)
+    assert server.metrics()["created"] == 20
+
+
+def test_drain_dead_letters_exhausted_retries(stub, tmp_path):
+    server = stub(Faults(error_rate=1.0, error_status=503))
+    with (
+        WorkQueue(tmp_path / "queue.db") as queue,
+        DeadLetterStore(tmp_path / "dead.db") as dead_letters,
+        BulkSender(server.url, retries=0, dead_letters=dead_letters) as sender,
+    ):
+        queue.put_many(payloads(3), TEMPLATE)
+        results = list(drain(queue, sender, max_attempts=2, retry_delay=0.0))
+        results += drain(queue, sender, max_attempts=2, retry_delay=0.0)
+        assert len(queue) == 0
+        entries = dead_letters.entries()
+    assert len(results) == 6
+    assert len(entries) == 3
+    assert all(e.attempts == 2 and e.error_class == "server" for e in entries)
+
+
+def test_drain_dead_letters_rejected_payloads_at_once(stub, tmp_path):
+    server = stub()
+    with (
+        WorkQueue(tmp_path / "queue.db") as queue,
+        DeadLetterStore(tmp_path / "dead.db") as dead_letters,
+        BulkSender(server.url, dead_letters=dead_letters) as sender,
+    ):
+        queue.put(b'{"severity": "Info"}', TEMPLATE, cluster_uuid="broken")
+        (result,) = drain(queue, sender, retry_delay=0.0)
+        assert len(queue) == 0
+        (entry,) = dead_letters.entries()
+    assert result.status == 400
+    assert (entry.cluster_uuid, entry.error_class, entry.attempts) == ("broken", "client", 1)